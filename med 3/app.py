@@ -1,17 +1,31 @@
 import os
 import re
 import json
+import hashlib
 import random
-from flask import Flask, render_template, request, jsonify
-import pytesseract
-from PIL import Image
-import pdf2image
-import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 from werkzeug.utils import secure_filename
-import cv2
+from ocr_engine import (
+    ocr_image_file,
+    ocr_pdf_file,
+    ocr_image_bytes,
+    ocr_pdf_bytes,
+    DEFAULT_OCR_WORKERS,
+    DEFAULT_PDF_DPI,
+    DEFAULT_PDF_PAGE_BATCH,
+    DEFAULT_OCR_STRATEGY,
+    DEFAULT_PREPROCESS_PROFILE,
+    DEFAULT_OCR_BACKEND
+)
+from ocr_cache import OCRCache
+from knowledge_base import get_knowledge_base
+from chat_router import get_chat_router, Route, FALLBACK_ROUTE
+from report_sessions import ReportSession, ReportSessionStore
+from charts import ChartFrame, available_charts, build_chart_json, template_json, DEFAULT_CHART_FORMAT, CHART_TEMPLATES
+from trend_store import TrendStore
+from jobs import JobQueue
+from reference_ranges import ReferenceRegistry, STATUS_LABELS, STATUS_COLOR_VALUES, UNKNOWN_TEST
 from doctor_suggestions import (
     get_specialist_recommendations,
     get_doctor_search_keywords,
@@ -28,494 +42,667 @@ from health_resources import (
     get_emergency_signs
 )
 
-# Configure Tesseract path
-pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-
 app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+# Decode uploads straight from the request stream instead of saving to UPLOAD_FOLDER
+app.config['OCR_IN_MEMORY'] = True
+# Processes used to OCR PDF pages concurrently (1 = sequential)
+app.config['OCR_WORKERS'] = DEFAULT_OCR_WORKERS
+# PDFs are rasterized PDF_PAGE_BATCH pages at a time to cap memory use
+app.config['PDF_DPI'] = DEFAULT_PDF_DPI
+app.config['PDF_PAGE_BATCH'] = DEFAULT_PDF_PAGE_BATCH
+# Page segmentation: 'adaptive' (layout analysis picks one --psm), 'legacy' (psm 6, retry psm 4)
+# or a fixed strategy name from ocr_engine.OCR_STRATEGIES
+app.config['OCR_STRATEGY'] = DEFAULT_OCR_STRATEGY
+# Preprocessing: 'quality' (full-resolution non-local means denoise) or 'fast' (downscale + median filter)
+app.config['PREPROCESS_PROFILE'] = DEFAULT_PREPROCESS_PROFILE
+# Tesseract backend: 'pytesseract' (process per call) or 'tesserocr' (warm instances, needs tesserocr)
+app.config['OCR_BACKEND'] = DEFAULT_OCR_BACKEND
+# OCR result cache: in-process LRU size and optional on-disk tier (None = disabled)
+app.config['OCR_CACHE_SIZE'] = 128
+app.config['OCR_CACHE_DIR'] = None
+app.config['OCR_CACHE_DISK_MAX_BYTES'] = 256 * 1024 * 1024
+# Reference ranges are reloaded when the CSV changes; checked every N seconds (0 = never)
+app.config['REFERENCE_CSV'] = 'reference_data.csv'
+app.config['REFERENCE_RELOAD_INTERVAL'] = 5
+# Analyzed reports kept server-side for /chat and /charts: LRU size, idle TTL in seconds, optional SQLite file.
+# Without the SQLite file a report exists only in the worker process that analyzed it; set
+# REPORT_SESSION_DB to a shared path when running more than one worker (e.g. gunicorn -w 4).
+app.config['REPORT_SESSION_MAX'] = 256
+app.config['REPORT_SESSION_TTL'] = 3600
+app.config['REPORT_SESSION_DB'] = None
+# Chart payloads: 'compact' (template sent once via /chart_templates) or 'plotly' (full fig.to_json())
+app.config['CHART_FORMAT'] = DEFAULT_CHART_FORMAT
+# SQLite file with each patient's past results, keyed by server-issued patient tokens; None disables history
+app.config['TREND_DB'] = None
+# Run /analyze as a background job (also per request with form field async=1). The web UI
+# follows this setting. Jobs live in the accepting process, so only enable it with a single
+# worker process or with sticky sessions that route /jobs/<id> back to the same worker.
+app.config['ANALYZE_ASYNC'] = False
+app.config['ANALYZE_JOB_WORKERS'] = 2
+app.config['ANALYZE_JOB_TTL'] = 3600
+# /analyze/batch: most files per request and how many are OCR'd at once
+app.config['BATCH_MAX_FILES'] = 10
+app.config['BATCH_OCR_THREADS'] = 4
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'pdf'}
 
 # Create upload folder if it doesn't exist
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Load reference data
-reference_df = pd.read_csv('reference_data.csv')
+# Cache of OCR text keyed by the hash of the uploaded bytes
+ocr_cache = OCRCache(
+    app.config['OCR_CACHE_SIZE'],
+    app.config['OCR_CACHE_DIR'],
+    app.config['OCR_CACHE_DISK_MAX_BYTES']
+)
 
-def allowed_file(filename):
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+# Load reference data, indexed by test name and reloaded in the background when edited
+reference_registry = ReferenceRegistry(app.config['REFERENCE_CSV'], app.config['REFERENCE_RELOAD_INTERVAL'])
+reference_registry.start()
 
-def preprocess_image(image_path):
-    """Enhance image quality for better OCR"""
-    img = cv2.imread(image_path)
-    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    # Apply thresholding
-    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
-    # Denoise
-    denoised = cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21)
-    temp_path = image_path.replace('.', '_processed.')
-    cv2.imwrite(temp_path, denoised)
-    return temp_path
+# Analyzed reports, looked up by the report_id returned from /analyze
+report_sessions = ReportSessionStore(
+    app.config['REPORT_SESSION_MAX'],
+    app.config['REPORT_SESSION_TTL'],
+    app.config['REPORT_SESSION_DB']
+)
 
-def extract_text_from_image(image_path):
-    """Extract text using OCR with preprocessing"""
-    processed_path = preprocess_image(image_path)
-    img = Image.open(processed_path)
-    # Try multiple OCR configurations for better results
-    text = pytesseract.image_to_string(img, config='--psm 6')
-    if len(text.strip()) < 50:  # If not much text, try different config
-        text = pytesseract.image_to_string(img, config='--psm 4')
-    # Clean up processed image
-    if os.path.exists(processed_path):
-        os.remove(processed_path)
-    return text
+trend_store = TrendStore(app.config['TREND_DB']) if app.config['TREND_DB'] else None
 
-def extract_text_from_pdf(pdf_path):
-    """Convert PDF to images and extract text"""
-    images = pdf2image.convert_from_path(pdf_path)
-    text = ""
-    for i, image in enumerate(images):
-        temp_image_path = f"{pdf_path}_page_{i}.jpg"
-        image.save(temp_image_path, 'JPEG')
-        text += extract_text_from_image(temp_image_path)
-        os.remove(temp_image_path)
-    return text
+# Background /analyze jobs; each runs the OCR of one upload in a pool process
+analysis_jobs = JobQueue(app.config['ANALYZE_JOB_WORKERS'], app.config['ANALYZE_JOB_TTL'])
 
-def extract_medical_values(text):
-    """Extract medical test values from OCR text - handles messy OCR"""
-    results = []
+def allowed_file(filename):
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def upload_hash(*uploads):
+    """Content hash of one or more uploaded files, independent of their order
     
-    # Split text into lines for better parsing
-    lines = text.split('\n')
+    Identifies re-uploads of the same report(s) so they enter a patient's history once."""
+    digests = sorted(hashlib.sha256(data).hexdigest() for data in uploads)
+    return hashlib.sha256('\n'.join(digests).encode('ascii')).hexdigest()
+
+def history_patient(form):
+    """Patient whose history a request reads and extends, or None
     
-    # Enhanced patterns that handle OCR errors and look for values on same line
-    test_patterns = {
-        'Hemoglobin': {
-            'keywords': ['hemoglobin', 'haemoglobin', 'hb', 'hgb', 'haemo', 'hemo'],
-            'range': (5, 20)
-        },
-        'WBC': {
-            'keywords': ['wbc', 'white', 'leucocyte', 'leukocyte', 'w.b.c'],
-            'range': (1000, 20000)
-        },
-        'RBC': {
-            'keywords': ['rbc', 'red blood', 'erythrocyte', 'r.b.c'],
-            'range': (2, 7)
-        },
-        'Platelets': {
-            'keywords': ['platelet', 'plt'],
-            'range': (50000, 500000)
-        },
-        'Neutrophils': {
-            'keywords': ['neutrophil', 'neutro'],
-            'range': (20, 80)
-        },
-        'Lymphocytes': {
-            'keywords': ['lymphocyte', 'lympho', 'litpiocr'],
-            'range': (15, 50)
-        },
-        'Glucose': {
-            'keywords': ['glucose', 'sugar', 'fbs', 'rbs'],
-            'range': (50, 400)
-        },
-        'Cholesterol': {
-            'keywords': ['cholesterol', 'chol'],
-            'range': (100, 400)
-        },
-        'Hematocrit': {
-            'keywords': ['hematocrit', 'haematocrit', 'hct', 'hot'],
-            'range': (30, 55)
-        },
-        'MCV': {
-            'keywords': ['mcv', 'mean corpuscular volume', 'mean cell volume'],
-            'range': (70, 110)
-        },
-        'MCH': {
-            'keywords': ['mch', 'mean cell haemoglobin', 'mean cell hemoglobin'],
-            'range': (20, 35)
-        },
-        'MCHC': {
-            'keywords': ['mchc', 'mean cell haemoglobin con', 'waeoglogin'],
-            'range': (30, 37)
-        },
-        # Urine Test Parameters (enhanced with more keywords and patterns)
-        'Urine_pH': {
-            'keywords': ['ph', 'urine ph', 'reaction', 'p.h', 'reaction ph', 'ph level', 'acidity', 'alkalinity', 'reaction (ph)'],
-            'range': (4.0, 9.0)
-        },
-        'Urine_Specific_Gravity': {
-            'keywords': ['specific gravity', 'sp gr', 'sp. gr', 'sg', 'specir', 'gramty', 'gravity', 'sp.gravity'],
-            'range': (1.000, 1.035),
-            'special_pattern': r'1\.0\d{2,3}'  # Matches 1.0XX or 1.0XXX format
-        },
-        'Urine_Protein': {
-            'keywords': ['protein', 'albumin', 'protew', 'alun', 'prot', 'pro', 'nil protein', 'protein nil'],
-            'range': (0, 30)
-        },
-        'Urine_Glucose': {
-            'keywords': ['glucose', 'sugar', 'sveum', 'cuvsose', 'glu', 'nil glucose', 'glucose nil', 'sugar (glucose)'],
-            'range': (0, 50)
-        },
-        'Urine_Ketones': {
-            'keywords': ['ketone', 'ketones', 'acetone', 'bodies', 'ketone bodies', 'nil ketones', 'ketones nil'],
-            'range': (0, 20)
-        },
-        'Urine_Blood': {
-            'keywords': ['blood', 'hemoglobin', 'occult blood', 'bun', 'nil blood', 'blood nil', 'haemoglobin'],
-            'range': (0, 10)
-        },
-        'Urine_Bilirubin': {
-            'keywords': ['bilirubin', 'bile', 'name', 'bile pigments', 'nil bilirubin', 'bilirubin nil'],
-            'range': (0, 2)
-        },
-        'Urine_Urobilinogen': {
-            'keywords': ['urobilinogen', 'urobil', 'uro', 'normal urobilinogen', 'urobilinogen normal'],
-            'range': (0, 4)
-        },
-        'Urine_WBC': {
-            'keywords': ['pus cells', 'wbc', 'leukocytes', 'leucocytes', 'rusceus', 'pusceus', 'pus', 'pus cells /hpf', 'wbc /hpf', 'pus cells (wbc)'],
-            'range': (0, 20)
-        },
-        'Urine_RBC': {
-            'keywords': ['rbc', 'red blood cells', 'erythrocytes', 'nec', 'rbc /hpf', 'red cells /hpf', 'red blood cells (rbc)'],
-            'range': (0, 10)
-        },
-        'Urine_Epithelial_Cells': {
-            'keywords': ['epithelial', 'epithelial cells', 'epi cells', 'epi', 'epithelial /hpf', 'epi cells /hpf'],
-            'range': (0, 15)
-        },
-        'Urine_Casts': {
-            'keywords': ['casts', 'cast', 'nil casts', 'casts nil', 'casts /lpf'],
-            'range': (0, 5)
-        },
-        'Urine_Crystals': {
-            'keywords': ['crystals', 'crystal', 'cresta', 'nil crystals', 'crystals nil'],
-            'range': (0, 5)
-        },
-        'Urine_Bacteria': {
-            'keywords': ['bacteria', 'bac', 'nil bacteria', 'bacteria nil', 'no bacteria'],
-            'range': (0, 0)  # Should be 0
-        },
-        'Urine_Nitrite': {
-            'keywords': ['nitrite', 'nitrites', 'nit', 'negative nitrite', 'nitrite negative', 'nitrites: negative'],
-            'range': (0, 0)  # Should be 0
-        },
-        # Kidney Function Tests
-        'BUN': {
-            'keywords': ['bun', 'blood urea nitrogen', 'urea nitrogen'],
-            'range': (5, 30)
-        },
-        # Electrolytes
-        'Sodium': {
-            'keywords': ['sodium', 'na', 'na+'],
-            'range': (130, 150)
-        },
-        'Potassium': {
-            'keywords': ['potassium', 'k', 'k+'],
-            'range': (3.0, 6.0)
-        },
-        'Chloride': {
-            'keywords': ['chloride', 'cl', 'cl-'],
-            'range': (90, 110)
-        },
-        'Calcium': {
-            'keywords': ['calcium', 'ca', 'ca++'],
-            'range': (8.0, 11.0)
-        },
-        'Magnesium': {
-            'keywords': ['magnesium', 'mg', 'mg++'],
-            'range': (1.5, 2.5)
-        },
-        'Phosphorus': {
-            'keywords': ['phosphorus', 'phosphate', 'po4'],
-            'range': (2.0, 5.0)
-        },
-        # Liver Function Tests
-        'Albumin': {
-            'keywords': ['albumin', 'alb'],
-            'range': (3.0, 6.0)
-        },
-        'Total_Protein': {
-            'keywords': ['total protein', 'protein total', 'tp'],
-            'range': (5.5, 9.0)
-        },
-        'Globulin': {
-            'keywords': ['globulin', 'glob'],
-            'range': (1.5, 4.0)
-        },
-        'Alkaline_Phosphatase': {
-            'keywords': ['alkaline phosphatase', 'alp', 'alk phos'],
-            'range': (20, 140)
-        },
-        'GGT': {
-            'keywords': ['ggt', 'gamma gt', 'gamma glutamyl'],
-            'range': (0, 60)
-        },
-        'Total_Bilirubin': {
-            'keywords': ['total bilirubin', 'bilirubin total', 'tbil'],
-            'range': (0, 1.5)
-        },
-        'Direct_Bilirubin': {
-            'keywords': ['direct bilirubin', 'conjugated bilirubin', 'dbil'],
-            'range': (0, 0.5)
-        },
-        # Diabetes Tests
-        'HbA1c': {
-            'keywords': ['hba1c', 'a1c', 'glycated hemoglobin', 'glycosylated'],
-            'range': (4.0, 14.0)
-        },
-        'Fasting_Insulin': {
-            'keywords': ['fasting insulin', 'insulin fasting', 'insulin'],
-            'range': (2, 30)
-        },
-        # Lipid Panel Extended
-        'VLDL': {
-            'keywords': ['vldl', 'very low density'],
-            'range': (2, 50)
-        },
-        # Thyroid Panel
-        'T3': {
-            'keywords': ['t3', 'triiodothyronine'],
-            'range': (70, 220)
-        },
-        'T4': {
-            'keywords': ['t4', 'thyroxine'],
-            'range': (4.0, 13.0)
-        },
-        'Free_T3': {
-            'keywords': ['free t3', 'ft3'],
-            'range': (2.0, 5.0)
-        },
-        'Free_T4': {
-            'keywords': ['free t4', 'ft4'],
-            'range': (0.7, 2.0)
-        },
-        # Vitamins
-        'Vitamin_D': {
-            'keywords': ['vitamin d', 'vit d', '25-oh', 'cholecalciferol'],
-            'range': (20, 120)
-        },
-        'Vitamin_B12': {
-            'keywords': ['vitamin b12', 'vit b12', 'b12', 'cobalamin'],
-            'range': (150, 1000)
-        },
-        'Folate': {
-            'keywords': ['folate', 'folic acid', 'vitamin b9'],
-            'range': (2.0, 20.0)
-        },
-        # Iron Studies
-        'Iron': {
-            'keywords': ['iron', 'serum iron', 'fe'],
-            'range': (50, 180)
-        },
-        'TIBC': {
-            'keywords': ['tibc', 'total iron binding'],
-            'range': (240, 460)
-        },
-        'Ferritin': {
-            'keywords': ['ferritin'],
-            'range': (10, 350)
-        },
-        'Transferrin_Saturation': {
-            'keywords': ['transferrin saturation', 'tsat', 'iron saturation'],
-            'range': (15, 55)
-        },
-        # Inflammation Markers
-        'CRP': {
-            'keywords': ['crp', 'c-reactive protein', 'c reactive'],
-            'range': (0, 10)
-        },
-        'ESR': {
-            'keywords': ['esr', 'sed rate', 'sedimentation rate'],
-            'range': (0, 30)
-        },
-        # Uric Acid
-        'Uric_Acid': {
-            'keywords': ['uric acid', 'urate'],
-            'range': (2.5, 8.0)
-        },
-        # Cardiac Markers
-        'Troponin': {
-            'keywords': ['troponin', 'trop'],
-            'range': (0, 0.1)
-        },
-        'BNP': {
-            'keywords': ['bnp', 'brain natriuretic'],
-            'range': (0, 150)
-        },
-        # Hormones
-        'Testosterone_Total': {
-            'keywords': ['testosterone', 'total testosterone'],
-            'range': (250, 1100)
-        },
-        'Estradiol': {
-            'keywords': ['estradiol', 'e2', 'estrogen'],
-            'range': (10, 400)
-        },
-        'Cortisol': {
-            'keywords': ['cortisol'],
-            'range': (5, 25)
-        },
-        'TSH': {
-            'keywords': ['tsh', 'thyroid stimulating'],
-            'range': (0.3, 5.0)
-        },
-        # Tumor Markers
-        'PSA': {
-            'keywords': ['psa', 'prostate specific'],
-            'range': (0, 5)
-        },
-        'CEA': {
-            'keywords': ['cea', 'carcinoembryonic'],
-            'range': (0, 5)
-        },
-        # Additional CBC Parameters
-        'Monocytes': {
-            'keywords': ['monocytes', 'mono'],
-            'range': (1, 10)
-        },
-        'Eosinophils': {
-            'keywords': ['eosinophils', 'eos', 'eosino'],
-            'range': (0, 5)
-        },
-        'Basophils': {
-            'keywords': ['basophils', 'baso'],
-            'range': (0, 2)
-        },
-        'RDW': {
-            'keywords': ['rdw', 'red cell distribution'],
-            'range': (11, 16)
-        },
-        'MPV': {
-            'keywords': ['mpv', 'mean platelet volume'],
-            'range': (7, 12)
-        }
+    History is keyed only on patient tokens the trend store issued, never on
+    a name the client types: a request asking to keep history (keep_history=1)
+    without a known patient_token gets a new token, returned as 'patient_token'
+    for the client to send with its next reports."""
+    if trend_store is None:
+        return None
+    token = form.get('patient_token', '').strip()
+    if token and trend_store.has_patient(token):
+        return token
+    if token or form.get('keep_history') in ('1', 'true'):
+        return trend_store.new_patient()
+    return None
+
+def ocr_cache_key(filename, data):
+    """OCR cache key of an upload: its bytes plus every setting that changes the OCR text"""
+    return ocr_cache.make_key(
+        data, 'pdf' if filename.lower().endswith('.pdf') else 'image', app.config['PDF_DPI'],
+        app.config['OCR_STRATEGY'], app.config['PREPROCESS_PROFILE'], app.config['OCR_BACKEND']
+    )
+
+def extract_text_from_upload(filename, data, progress=None):
+    """OCR an uploaded file, reusing cached text for identical uploads
+    
+    Returns the text and OCR details (strategy and timing per page).
+    Page events ('rasterized', 'ocr') go to `progress(event, data)`, if given."""
+    is_pdf = filename.lower().endswith('.pdf')
+    strategy = app.config['OCR_STRATEGY']
+    profile = app.config['PREPROCESS_PROFILE']
+    backend = app.config['OCR_BACKEND']
+    cache_key = ocr_cache_key(filename, data)
+    text = ocr_cache.get(cache_key)
+    if text is not None:
+        return text, {'cached': True, 'pages': []}
+    
+    if app.config['OCR_IN_MEMORY']:
+        if is_pdf:
+            result = ocr_pdf_bytes(
+                data, app.config['OCR_WORKERS'],
+                app.config['PDF_DPI'], app.config['PDF_PAGE_BATCH'], strategy, profile, backend, progress
+            )
+        else:
+            result = ocr_image_bytes(data, strategy, profile, backend, progress)
+    else:
+        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+        with open(filepath, 'wb') as f:
+            f.write(data)
+        try:
+            if is_pdf:
+                result = ocr_pdf_file(
+                    filepath, app.config['OCR_WORKERS'],
+                    app.config['PDF_DPI'], app.config['PDF_PAGE_BATCH'], strategy, profile, backend, progress
+                )
+            else:
+                result = ocr_image_file(filepath, strategy, profile, backend, progress)
+        finally:
+            # Clean up uploaded file
+            os.remove(filepath)
+    
+    ocr_cache.put(cache_key, result['text'])
+    return result['text'], {'cached': False, 'pages': result['pages']}
+
+# Enhanced patterns that handle OCR errors and look for values on same line
+TEST_PATTERNS = {
+    'Hemoglobin': {
+        'keywords': ['hemoglobin', 'haemoglobin', 'hb', 'hgb', 'haemo', 'hemo'],
+        'range': (5, 20)
+    },
+    'WBC': {
+        'keywords': ['wbc', 'white', 'leucocyte', 'leukocyte', 'w.b.c'],
+        'range': (1000, 20000)
+    },
+    'RBC': {
+        'keywords': ['rbc', 'red blood', 'erythrocyte', 'r.b.c'],
+        'range': (2, 7)
+    },
+    'Platelets': {
+        'keywords': ['platelet', 'plt'],
+        'range': (50000, 500000)
+    },
+    'Neutrophils': {
+        'keywords': ['neutrophil', 'neutro'],
+        'range': (20, 80)
+    },
+    'Lymphocytes': {
+        'keywords': ['lymphocyte', 'lympho', 'litpiocr'],
+        'range': (15, 50)
+    },
+    'Glucose': {
+        'keywords': ['glucose', 'sugar', 'fbs', 'rbs'],
+        'range': (50, 400)
+    },
+    'Cholesterol': {
+        'keywords': ['cholesterol', 'chol'],
+        'range': (100, 400)
+    },
+    'Hematocrit': {
+        'keywords': ['hematocrit', 'haematocrit', 'hct', 'hot'],
+        'range': (30, 55)
+    },
+    'MCV': {
+        'keywords': ['mcv', 'mean corpuscular volume', 'mean cell volume'],
+        'range': (70, 110)
+    },
+    'MCH': {
+        'keywords': ['mch', 'mean cell haemoglobin', 'mean cell hemoglobin'],
+        'range': (20, 35)
+    },
+    'MCHC': {
+        'keywords': ['mchc', 'mean cell haemoglobin con', 'waeoglogin'],
+        'range': (30, 37)
+    },
+    # Urine Test Parameters (enhanced with more keywords and patterns)
+    'Urine_pH': {
+        'keywords': ['ph', 'urine ph', 'reaction', 'p.h', 'reaction ph', 'ph level', 'acidity', 'alkalinity', 'reaction (ph)'],
+        'range': (4.0, 9.0)
+    },
+    'Urine_Specific_Gravity': {
+        'keywords': ['specific gravity', 'sp gr', 'sp. gr', 'sg', 'specir', 'gramty', 'gravity', 'sp.gravity'],
+        'range': (1.000, 1.035),
+        'special_pattern': r'1\.0\d{2,3}'  # Matches 1.0XX or 1.0XXX format
+    },
+    'Urine_Protein': {
+        'keywords': ['protein', 'albumin', 'protew', 'alun', 'prot', 'pro', 'nil protein', 'protein nil'],
+        'range': (0, 30)
+    },
+    'Urine_Glucose': {
+        'keywords': ['glucose', 'sugar', 'sveum', 'cuvsose', 'glu', 'nil glucose', 'glucose nil', 'sugar (glucose)'],
+        'range': (0, 50)
+    },
+    'Urine_Ketones': {
+        'keywords': ['ketone', 'ketones', 'acetone', 'bodies', 'ketone bodies', 'nil ketones', 'ketones nil'],
+        'range': (0, 20)
+    },
+    'Urine_Blood': {
+        'keywords': ['blood', 'hemoglobin', 'occult blood', 'bun', 'nil blood', 'blood nil', 'haemoglobin'],
+        'range': (0, 10)
+    },
+    'Urine_Bilirubin': {
+        'keywords': ['bilirubin', 'bile', 'name', 'bile pigments', 'nil bilirubin', 'bilirubin nil'],
+        'range': (0, 2)
+    },
+    'Urine_Urobilinogen': {
+        'keywords': ['urobilinogen', 'urobil', 'uro', 'normal urobilinogen', 'urobilinogen normal'],
+        'range': (0, 4)
+    },
+    'Urine_WBC': {
+        'keywords': ['pus cells', 'wbc', 'leukocytes', 'leucocytes', 'rusceus', 'pusceus', 'pus', 'pus cells /hpf', 'wbc /hpf', 'pus cells (wbc)'],
+        'range': (0, 20)
+    },
+    'Urine_RBC': {
+        'keywords': ['rbc', 'red blood cells', 'erythrocytes', 'nec', 'rbc /hpf', 'red cells /hpf', 'red blood cells (rbc)'],
+        'range': (0, 10)
+    },
+    'Urine_Epithelial_Cells': {
+        'keywords': ['epithelial', 'epithelial cells', 'epi cells', 'epi', 'epithelial /hpf', 'epi cells /hpf'],
+        'range': (0, 15)
+    },
+    'Urine_Casts': {
+        'keywords': ['casts', 'cast', 'nil casts', 'casts nil', 'casts /lpf'],
+        'range': (0, 5)
+    },
+    'Urine_Crystals': {
+        'keywords': ['crystals', 'crystal', 'cresta', 'nil crystals', 'crystals nil'],
+        'range': (0, 5)
+    },
+    'Urine_Bacteria': {
+        'keywords': ['bacteria', 'bac', 'nil bacteria', 'bacteria nil', 'no bacteria'],
+        'range': (0, 0)  # Should be 0
+    },
+    'Urine_Nitrite': {
+        'keywords': ['nitrite', 'nitrites', 'nit', 'negative nitrite', 'nitrite negative', 'nitrites: negative'],
+        'range': (0, 0)  # Should be 0
+    },
+    # Kidney Function Tests
+    'BUN': {
+        'keywords': ['bun', 'blood urea nitrogen', 'urea nitrogen'],
+        'range': (5, 30)
+    },
+    # Electrolytes
+    'Sodium': {
+        'keywords': ['sodium', 'na', 'na+'],
+        'range': (130, 150)
+    },
+    'Potassium': {
+        'keywords': ['potassium', 'k', 'k+'],
+        'range': (3.0, 6.0)
+    },
+    'Chloride': {
+        'keywords': ['chloride', 'cl', 'cl-'],
+        'range': (90, 110)
+    },
+    'Calcium': {
+        'keywords': ['calcium', 'ca', 'ca++'],
+        'range': (8.0, 11.0)
+    },
+    'Magnesium': {
+        'keywords': ['magnesium', 'mg', 'mg++'],
+        'range': (1.5, 2.5)
+    },
+    'Phosphorus': {
+        'keywords': ['phosphorus', 'phosphate', 'po4'],
+        'range': (2.0, 5.0)
+    },
+    # Liver Function Tests
+    'Albumin': {
+        'keywords': ['albumin', 'alb'],
+        'range': (3.0, 6.0)
+    },
+    'Total_Protein': {
+        'keywords': ['total protein', 'protein total', 'tp'],
+        'range': (5.5, 9.0)
+    },
+    'Globulin': {
+        'keywords': ['globulin', 'glob'],
+        'range': (1.5, 4.0)
+    },
+    'Alkaline_Phosphatase': {
+        'keywords': ['alkaline phosphatase', 'alp', 'alk phos'],
+        'range': (20, 140)
+    },
+    'GGT': {
+        'keywords': ['ggt', 'gamma gt', 'gamma glutamyl'],
+        'range': (0, 60)
+    },
+    'Total_Bilirubin': {
+        'keywords': ['total bilirubin', 'bilirubin total', 'tbil'],
+        'range': (0, 1.5)
+    },
+    'Direct_Bilirubin': {
+        'keywords': ['direct bilirubin', 'conjugated bilirubin', 'dbil'],
+        'range': (0, 0.5)
+    },
+    # Diabetes Tests
+    'HbA1c': {
+        'keywords': ['hba1c', 'a1c', 'glycated hemoglobin', 'glycosylated'],
+        'range': (4.0, 14.0)
+    },
+    'Fasting_Insulin': {
+        'keywords': ['fasting insulin', 'insulin fasting', 'insulin'],
+        'range': (2, 30)
+    },
+    # Lipid Panel Extended
+    'VLDL': {
+        'keywords': ['vldl', 'very low density'],
+        'range': (2, 50)
+    },
+    # Thyroid Panel
+    'T3': {
+        'keywords': ['t3', 'triiodothyronine'],
+        'range': (70, 220)
+    },
+    'T4': {
+        'keywords': ['t4', 'thyroxine'],
+        'range': (4.0, 13.0)
+    },
+    'Free_T3': {
+        'keywords': ['free t3', 'ft3'],
+        'range': (2.0, 5.0)
+    },
+    'Free_T4': {
+        'keywords': ['free t4', 'ft4'],
+        'range': (0.7, 2.0)
+    },
+    # Vitamins
+    'Vitamin_D': {
+        'keywords': ['vitamin d', 'vit d', '25-oh', 'cholecalciferol'],
+        'range': (20, 120)
+    },
+    'Vitamin_B12': {
+        'keywords': ['vitamin b12', 'vit b12', 'b12', 'cobalamin'],
+        'range': (150, 1000)
+    },
+    'Folate': {
+        'keywords': ['folate', 'folic acid', 'vitamin b9'],
+        'range': (2.0, 20.0)
+    },
+    # Iron Studies
+    'Iron': {
+        'keywords': ['iron', 'serum iron', 'fe'],
+        'range': (50, 180)
+    },
+    'TIBC': {
+        'keywords': ['tibc', 'total iron binding'],
+        'range': (240, 460)
+    },
+    'Ferritin': {
+        'keywords': ['ferritin'],
+        'range': (10, 350)
+    },
+    'Transferrin_Saturation': {
+        'keywords': ['transferrin saturation', 'tsat', 'iron saturation'],
+        'range': (15, 55)
+    },
+    # Inflammation Markers
+    'CRP': {
+        'keywords': ['crp', 'c-reactive protein', 'c reactive'],
+        'range': (0, 10)
+    },
+    'ESR': {
+        'keywords': ['esr', 'sed rate', 'sedimentation rate'],
+        'range': (0, 30)
+    },
+    # Uric Acid
+    'Uric_Acid': {
+        'keywords': ['uric acid', 'urate'],
+        'range': (2.5, 8.0)
+    },
+    # Cardiac Markers
+    'Troponin': {
+        'keywords': ['troponin', 'trop'],
+        'range': (0, 0.1)
+    },
+    'BNP': {
+        'keywords': ['bnp', 'brain natriuretic'],
+        'range': (0, 150)
+    },
+    # Hormones
+    'Testosterone_Total': {
+        'keywords': ['testosterone', 'total testosterone'],
+        'range': (250, 1100)
+    },
+    'Estradiol': {
+        'keywords': ['estradiol', 'e2', 'estrogen'],
+        'range': (10, 400)
+    },
+    'Cortisol': {
+        'keywords': ['cortisol'],
+        'range': (5, 25)
+    },
+    'TSH': {
+        'keywords': ['tsh', 'thyroid stimulating'],
+        'range': (0.3, 5.0)
+    },
+    # Tumor Markers
+    'PSA': {
+        'keywords': ['psa', 'prostate specific'],
+        'range': (0, 5)
+    },
+    'CEA': {
+        'keywords': ['cea', 'carcinoembryonic'],
+        'range': (0, 5)
+    },
+    # Additional CBC Parameters
+    'Monocytes': {
+        'keywords': ['monocytes', 'mono'],
+        'range': (1, 10)
+    },
+    'Eosinophils': {
+        'keywords': ['eosinophils', 'eos', 'eosino'],
+        'range': (0, 5)
+    },
+    'Basophils': {
+        'keywords': ['basophils', 'baso'],
+        'range': (0, 2)
+    },
+    'RDW': {
+        'keywords': ['rdw', 'red cell distribution'],
+        'range': (11, 16)
+    },
+    'MPV': {
+        'keywords': ['mpv', 'mean platelet volume'],
+        'range': (7, 12)
+    }
+}
+
+def keyword_trie_regex(keywords):
+    """Build a regex for a set of keywords shaped like a prefix trie
+    
+    e.g. ['hb', 'hgb', 'hemo', 'hemoglobin'] -> h(?:b|emo(?:globin)?|gb)
+    At any position at most one branch can continue, so the engine does not
+    retry hundreds of alternatives per character, and optional tails are
+    greedy so the longest keyword starting there wins.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[''] = True  # End-of-keyword marker
+    
+    def build(node):
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+    
+    return build(trie)
+
+def build_keyword_matcher(test_patterns):
+    """Compile all test keywords into one regex that finds every hit in a single pass
+    
+    The trie regex sits inside a lookahead so overlapping keywords are all
+    reported, one (longest) keyword per position; shorter keywords starting
+    at the same position are its prefixes and are recovered from a
+    precomputed table.
+    """
+    keyword_tests = {}
+    for test_name, config in test_patterns.items():
+        for keyword in config['keywords']:
+            keyword_tests.setdefault(keyword, []).append(test_name)
+    
+    pattern = re.compile('(?=(' + keyword_trie_regex(keyword_tests) + '))')
+    prefixes = {
+        keyword: [other for other in keyword_tests if other != keyword and keyword.startswith(other)]
+        for keyword in keyword_tests
+    }
+    return pattern, prefixes, keyword_tests
+
+KEYWORD_PATTERN, KEYWORD_PREFIXES, KEYWORD_TESTS = build_keyword_matcher(TEST_PATTERNS)
+
+def find_keyword_positions(text_lower):
+    """Map each keyword present in the text to the index of its first occurrence"""
+    positions = {}
+    for match in KEYWORD_PATTERN.finditer(text_lower):
+        idx = match.start()
+        keyword = match.group(1)
+        if keyword not in positions:
+            positions[keyword] = idx
+        for prefix in KEYWORD_PREFIXES[keyword]:
+            if prefix not in positions:
+                positions[prefix] = idx
+    return positions
+
+# Precompiled patterns shared by every extraction rule (context windows are lower-cased)
+NUMBER_PATTERN = re.compile(r'\b(\d+\.?\d*)\b')
+# Urine microscopy counts: "1-2 /HPF", "3 /HPF", "2 - 4 HPF" (in that order of preference)
+HPF_PATTERNS = (
+    ('range', re.compile(r'(\d+)-(\d+)\s*/?\s*hpf')),
+    ('single', re.compile(r'(\d+)\s*/?\s*hpf')),
+    ('range', re.compile(r'(\d+)\s*-\s*(\d+)\s*/?\s*hpf'))
+)
+NEGATIVE_INDICATORS = ('nil', 'negative', 'absent', 'neg', 'sen', 'eon', 'not seen', 'no', 'none', 'trace', 'clear', 'normal')
+SPECIAL_PATTERNS = {
+    test_name: re.compile(config['special_pattern'])
+    for test_name, config in TEST_PATTERNS.items()
+    if 'special_pattern' in config
+}
+# Characters after a keyword that are searched for its value
+CONTEXT_WINDOW = 100
+
+def tokenize_context(context):
+    """Parse a context window once so every rule (and every test sharing the
+    keyword position) reuses the same numbers; the urine-only fields are
+    filled in on first use"""
+    return {
+        'context': context,
+        'numbers': [float(num_str) for num_str in NUMBER_PATTERN.findall(context)],
+        'negative': None,
+        'hpf': None,
+        'special': {}
     }
+
+def context_is_negative(tokens):
+    """Whether the window contains a nil/negative/absent style indicator"""
+    if tokens['negative'] is None:
+        tokens['negative'] = any(indicator in tokens['context'] for indicator in NEGATIVE_INDICATORS)
+    return tokens['negative']
+
+def context_hpf_values(tokens):
+    """Per-HPF counts found in the window, in rule order (ranges averaged)"""
+    if tokens['hpf'] is None:
+        tokens['hpf'] = []
+        for kind, pattern in HPF_PATTERNS:
+            match = pattern.search(tokens['context'])
+            if match:
+                if kind == 'range':
+                    tokens['hpf'].append((int(match.group(1)) + int(match.group(2))) / 2)
+                else:
+                    tokens['hpf'].append(int(match.group(1)))
+    return tokens['hpf']
+
+def extract_medical_values(text, progress=None):
+    """Extract medical test values from OCR text - handles messy OCR
+    
+    Reports an 'extracted' event with the number of values to `progress`, if given."""
+    results = []
     
     text_lower = text.lower()
     
+    # Locate every keyword in one pass over the text
+    keyword_positions = find_keyword_positions(text_lower)
+    matched_tests = {test for keyword in keyword_positions for test in KEYWORD_TESTS[keyword]}
+    # Tokenized context windows by keyword position
+    windows = {}
+    
     # Try to find values for each test
-    for test_name, config in test_patterns.items():
+    for test_name, config in TEST_PATTERNS.items():
+        if test_name not in matched_tests:
+            continue
         keywords = config['keywords']
         min_val, max_val = config['range']
+        is_urine = test_name.startswith('Urine_')
+        special_pattern = SPECIAL_PATTERNS.get(test_name)
         
         for keyword in keywords:
             # Look for the keyword in text
-            if keyword in text_lower:
-                # Find the position of keyword
-                idx = text_lower.find(keyword)
-                # Get surrounding text (100 chars after keyword)
-                context = text_lower[idx:idx+100]
-                
-                # Check if there's a special pattern for this test
-                special_pattern = config.get('special_pattern')
-                if special_pattern:
-                    special_matches = re.findall(special_pattern, context)
-                    if special_matches:
-                        try:
-                            value = float(special_matches[0])
-                            if min_val <= value <= max_val:
-                                results.append({'test': test_name, 'value': value})
-                                break
-                        except ValueError:
-                            pass
-                
-                # Extract all numbers from context
-                numbers = re.findall(r'\b(\d+\.?\d*)\b', context)
-                
-                # Find first number in valid range
-                value_found = False
-                for num_str in numbers:
-                    try:
-                        value = float(num_str)
-                        if min_val <= value <= max_val:
-                            results.append({'test': test_name, 'value': value})
-                            value_found = True
-                            break
-                    except ValueError:
-                        continue
-                
-                # If no valid number found, check for negative/nil/absent indicators
-                if not value_found:
-                    negative_indicators = ['nil', 'negative', 'absent', 'neg', 'sen', 'eon', 'not seen', 'no', 'none', 'trace', 'clear', 'normal']
-                    if any(indicator in context.lower() for indicator in negative_indicators):
-                        # For urine tests, negative/nil means 0
-                        if test_name.startswith('Urine_'):
-                            results.append({'test': test_name, 'value': 0})
-                            value_found = True
-
-                # For urine tests, also check for range indicators like "1-2 /HPF" even if negative indicators weren't found
-                if not value_found and test_name.startswith('Urine_'):
-                    # Look for patterns like "1-2 /HPF" or "2-3 cells"
-                    range_pattern = re.findall(r'(\d+)-(\d+)\s*/?\s*HPF', context)
-                    if range_pattern:
-                        # Take the average of the range
-                        low, high = map(int, range_pattern[0])
-                        value = (low + high) / 2
-                        if min_val <= value <= max_val:
-                            results.append({'test': test_name, 'value': value})
-                            value_found = True
-
-                    # Look for single numbers with /HPF
-                    if not value_found:
-                        hpf_pattern = re.findall(r'(\d+)\s*/?\s*HPF', context)
-                        if hpf_pattern:
-                            value = int(hpf_pattern[0])
-                            if min_val <= value <= max_val:
-                                results.append({'test': test_name, 'value': value})
-                                value_found = True
-
-                    # Look for patterns like "2-3 /HPF" without the dash
-                    if not value_found:
-                        alt_range_pattern = re.findall(r'(\d+)\s*-\s*(\d+)\s*/?\s*HPF', context)
-                        if alt_range_pattern:
-                            low, high = map(int, alt_range_pattern[0])
-                            value = (low + high) / 2
-                            if min_val <= value <= max_val:
-                                results.append({'test': test_name, 'value': value})
-                                value_found = True
-                
-                if value_found or any(r['test'] == test_name for r in results):
-                    break  # Found value for this test
+            if keyword not in keyword_positions:
+                continue
+            
+            # Surrounding text (100 chars after the keyword's first occurrence)
+            idx = keyword_positions[keyword]
+            tokens = windows.get(idx)
+            if tokens is None:
+                tokens = windows[idx] = tokenize_context(text_lower[idx:idx + CONTEXT_WINDOW])
+            
+            # Check if there's a special pattern for this test
+            if special_pattern:
+                if test_name not in tokens['special']:
+                    special_match = special_pattern.search(tokens['context'])
+                    tokens['special'][test_name] = float(special_match.group(0)) if special_match else None
+                value = tokens['special'][test_name]
+                if value is not None and min_val <= value <= max_val:
+                    results.append({'test': test_name, 'value': value})
+                    break
+            
+            # Find first number in valid range
+            value_found = False
+            for value in tokens['numbers']:
+                if min_val <= value <= max_val:
+                    results.append({'test': test_name, 'value': value})
+                    value_found = True
+                    break
+            
+            # If no valid number found, check for negative/nil/absent indicators
+            if not value_found and is_urine and context_is_negative(tokens):
+                # For urine tests, negative/nil means 0
+                results.append({'test': test_name, 'value': 0})
+                value_found = True
+            
+            # For urine tests, also check for counts like "1-2 /HPF" (range averaged)
+            if not value_found and is_urine:
+                for value in context_hpf_values(tokens):
+                    if min_val <= value <= max_val:
+                        results.append({'test': test_name, 'value': value})
+                        value_found = True
+                        break
+            
+            if value_found:
+                break  # Found value for this test
     
+    if progress:
+        progress('extracted', {'values': len(results)})
     return results
 
-def compare_with_reference(extracted_values):
-    """Compare extracted values with reference ranges"""
-    comparison_results = []
+def compare_with_reference(extracted_values, reference_table=None):
+    """Compare extracted values with reference ranges
     
-    for item in extracted_values:
-        test_name = item['test']
-        value = item['value']
-        
-        ref_row = reference_df[reference_df['Test_Name'] == test_name]
-        
-        if not ref_row.empty:
-            min_val = ref_row['Min_Value'].values[0]
-            max_val = ref_row['Max_Value'].values[0]
-            unit = ref_row['Unit'].values[0]
-            description = ref_row['Description'].values[0]
-            
-            if value < min_val:
-                status = 'Low'
-                color = '#3498db'
-            elif value > max_val:
-                status = 'High'
-                color = '#e74c3c'
-            else:
-                status = 'Normal'
-                color = '#2ecc71'
-            
-            comparison_results.append({
-                'test': test_name,
-                'value': value,
-                'min': min_val,
-                'max': max_val,
-                'unit': unit,
-                'status': status,
-                'color': color,
-                'description': description
-            })
+    Uses the registry's current table unless a snapshot is passed in."""
+    if reference_table is None:
+        reference_table = reference_registry.current
+    comparison_results = []
+    if not extracted_values:
+        return comparison_results
+    
+    test_ids = reference_table.ids_for([item['test'] for item in extracted_values])
+    known = test_ids != UNKNOWN_TEST
+    known_items = [item for item, is_known in zip(extracted_values, known) if is_known]
+    if not known_items:
+        return comparison_results
+    
+    status_codes = reference_table.classify(test_ids[known], [item['value'] for item in known_items])
+    statuses = STATUS_LABELS[status_codes].tolist()
+    colors = STATUS_COLOR_VALUES[status_codes].tolist()
+    
+    for item, status, color in zip(known_items, statuses, colors):
+        ref = reference_table.get(item['test'])
+        comparison_results.append({
+            'test': item['test'],
+            'value': item['value'],
+            'min': ref.min,
+            'max': ref.max,
+            'unit': ref.unit,
+            'status': status,
+            'color': color,
+            'description': ref.description
+        })
     
     return comparison_results
 
@@ -822,578 +1009,9 @@ def generate_insights(comparison_results):
     
     return insights
 
-def create_visualization(comparison_results):
-    """Create interactive Plotly visualizations"""
-    if not comparison_results:
-        return None
-    
-    charts = {}
-    
-    # 1. Bar Chart with Range Indicators
-    fig_bar = go.Figure()
-    
-    tests = [r['test'] for r in comparison_results]
-    values = [r['value'] for r in comparison_results]
-    colors = [r['color'] for r in comparison_results]
-    min_vals = [r['min'] for r in comparison_results]
-    max_vals = [r['max'] for r in comparison_results]
-    
-    fig_bar.add_trace(go.Bar(
-        x=tests,
-        y=values,
-        marker_color=colors,
-        text=[f"{v} {r['unit']}" for v, r in zip(values, comparison_results)],
-        textposition='outside',
-        hovertemplate='<b>%{x}</b><br>Value: %{y}<br>Normal: %{customdata[0]} - %{customdata[1]}<extra></extra>',
-        customdata=list(zip(min_vals, max_vals)),
-        name='Your Value'
-    ))
-    
-    fig_bar.update_layout(
-        title='Medical Test Results Overview',
-        xaxis_title='Test Name',
-        yaxis_title='Value',
-        template='plotly_white',
-        height=450,
-        showlegend=False,
-        xaxis={'tickangle': -45}
-    )
-    
-    charts['bar'] = fig_bar.to_json()
-    
-    # 2. Gauge Charts for each test
-    gauges = []
-    for result in comparison_results[:6]:  # First 6 tests
-        fig_gauge = go.Figure(go.Indicator(
-            mode="gauge+number+delta",
-            value=result['value'],
-            domain={'x': [0, 1], 'y': [0, 1]},
-            title={'text': f"{result['test']}<br><span style='font-size:0.8em'>{result['unit']}</span>"},
-            delta={'reference': (result['min'] + result['max']) / 2},
-            gauge={
-                'axis': {'range': [None, result['max'] * 1.2]},
-                'bar': {'color': result['color']},
-                'steps': [
-                    {'range': [0, result['min']], 'color': "lightblue"},
-                    {'range': [result['min'], result['max']], 'color': "lightgreen"},
-                    {'range': [result['max'], result['max'] * 1.2], 'color': "lightcoral"}
-                ],
-                'threshold': {
-                    'line': {'color': "red", 'width': 4},
-                    'thickness': 0.75,
-                    'value': result['max']
-                }
-            }
-        ))
-        
-        fig_gauge.update_layout(
-            height=250,
-            margin={'t': 50, 'b': 0, 'l': 0, 'r': 0}
-        )
-        
-        gauges.append(fig_gauge.to_json())
-    
-    charts['gauges'] = gauges
-    
-    # 3. Status Distribution Pie Chart
-    status_counts = {}
-    for result in comparison_results:
-        status = result['status']
-        status_counts[status] = status_counts.get(status, 0) + 1
-    
-    fig_pie = go.Figure(data=[go.Pie(
-        labels=list(status_counts.keys()),
-        values=list(status_counts.values()),
-        marker=dict(colors=['#2ecc71', '#e74c3c', '#3498db']),
-        hole=0.4,
-        textinfo='label+percent',
-        hovertemplate='<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>'
-    )])
-    
-    fig_pie.update_layout(
-        title='Health Status Distribution',
-        height=350,
-        showlegend=True
-    )
-    
-    charts['pie'] = fig_pie.to_json()
-    
-    # 4. Radar/Spider Chart - Normalized values
-    fig_radar = go.Figure()
-    
-    # Normalize values to percentage of normal range
-    normalized_values = []
-    for result in comparison_results[:8]:  # Limit to 8 for readability
-        mid_point = (result['min'] + result['max']) / 2
-        normalized = (result['value'] / mid_point) * 100
-        normalized_values.append(normalized)
-    
-    radar_tests = [r['test'] for r in comparison_results[:8]]
-    
-    fig_radar.add_trace(go.Scatterpolar(
-        r=normalized_values,
-        theta=radar_tests,
-        fill='toself',
-        name='Your Results',
-        line=dict(color='#667eea', width=2),
-        fillcolor='rgba(102, 126, 234, 0.3)'
-    ))
-    
-    # Add reference line at 100%
-    fig_radar.add_trace(go.Scatterpolar(
-        r=[100] * len(radar_tests),
-        theta=radar_tests,
-        name='Normal Range',
-        line=dict(color='#2ecc71', width=2, dash='dash')
-    ))
-    
-    fig_radar.update_layout(
-        polar=dict(
-            radialaxis=dict(
-                visible=True,
-                range=[0, 150],
-                ticksuffix='%'
-            )
-        ),
-        showlegend=True,
-        title='Health Parameters Radar View',
-        height=500
-    )
-    
-    charts['radar'] = fig_radar.to_json()
-    
-    # 5. Simulated Trend Chart (Historical comparison)
-    fig_trend = go.Figure()
-    
-    # Simulate 6 months of data
-    months = ['6 months ago', '5 months ago', '4 months ago', '3 months ago', '2 months ago', 'Last month', 'Current']
-    
-    for i, result in enumerate(comparison_results[:4]):  # Show trends for first 4 tests
-        # Generate simulated historical data with some variation
-        base_value = result['value']
-        historical_values = []
-        for j in range(6):
-            variation = np.random.uniform(-0.15, 0.15)
-            historical_values.append(base_value * (1 + variation))
-        historical_values.append(result['value'])
-        
-        fig_trend.add_trace(go.Scatter(
-            x=months,
-            y=historical_values,
-            mode='lines+markers',
-            name=result['test'],
-            line=dict(width=3),
-            marker=dict(size=8),
-            hovertemplate='<b>%{fullData.name}</b><br>%{x}<br>Value: %{y:.2f}<extra></extra>'
-        ))
-        
-        # Add reference range bands
-        fig_trend.add_trace(go.Scatter(
-            x=months,
-            y=[result['max']] * len(months),
-            mode='lines',
-            name=f'{result["test"]} Max',
-            line=dict(color=result['color'], width=1, dash='dash'),
-            showlegend=False,
-            hoverinfo='skip'
-        ))
-        
-        fig_trend.add_trace(go.Scatter(
-            x=months,
-            y=[result['min']] * len(months),
-            mode='lines',
-            name=f'{result["test"]} Min',
-            line=dict(color=result['color'], width=1, dash='dash'),
-            fill='tonexty',
-            fillcolor=f'rgba({int(result["color"][1:3], 16)}, {int(result["color"][3:5], 16)}, {int(result["color"][5:7], 16)}, 0.1)',
-            showlegend=False,
-            hoverinfo='skip'
-        ))
-    
-    fig_trend.update_layout(
-        title='Simulated Health Trends Over Time',
-        xaxis_title='Time Period',
-        yaxis_title='Value',
-        template='plotly_white',
-        height=450,
-        hovermode='x unified'
-    )
-    
-    charts['trend'] = fig_trend.to_json()
-    
-    # 6. Box Plot - Distribution Analysis
-    fig_box = go.Figure()
-    
-    for result in comparison_results[:6]:
-        # Generate sample distribution around the value
-        samples = np.random.normal(result['value'], result['value'] * 0.1, 100)
-        
-        fig_box.add_trace(go.Box(
-            y=samples,
-            name=result['test'],
-            marker_color=result['color'],
-            boxmean='sd',
-            hovertemplate='<b>%{fullData.name}</b><br>Value: %{y:.2f}<extra></extra>'
-        ))
-    
-    fig_box.update_layout(
-        title='Test Results Distribution Analysis',
-        yaxis_title='Value',
-        template='plotly_white',
-        height=450,
-        showlegend=False
-    )
-    
-    charts['box'] = fig_box.to_json()
-    
-    # 7. Heatmap - Correlation Matrix (simulated)
-    if len(comparison_results) >= 4:
-        test_names = [r['test'] for r in comparison_results[:6]]
-        n = len(test_names)
-        
-        # Generate simulated correlation matrix
-        correlation_matrix = np.random.rand(n, n)
-        correlation_matrix = (correlation_matrix + correlation_matrix.T) / 2
-        np.fill_diagonal(correlation_matrix, 1)
-        
-        fig_heatmap = go.Figure(data=go.Heatmap(
-            z=correlation_matrix,
-            x=test_names,
-            y=test_names,
-            colorscale='RdYlGn',
-            zmid=0.5,
-            text=np.round(correlation_matrix, 2),
-            texttemplate='%{text}',
-            textfont={"size": 10},
-            hovertemplate='%{x} vs %{y}<br>Correlation: %{z:.2f}<extra></extra>'
-        ))
-        
-        fig_heatmap.update_layout(
-            title='Test Parameters Correlation Matrix',
-            height=450,
-            xaxis={'tickangle': -45}
-        )
-        
-        charts['heatmap'] = fig_heatmap.to_json()
-    
-    # 8. 3D Scatter Plot (for first 3 tests with sufficient data)
-    if len(comparison_results) >= 3:
-        fig_3d = go.Figure(data=[go.Scatter3d(
-            x=[comparison_results[0]['value']],
-            y=[comparison_results[1]['value']],
-            z=[comparison_results[2]['value']],
-            mode='markers',
-            marker=dict(
-                size=20,
-                color='#667eea',
-                symbol='diamond',
-                line=dict(color='white', width=2)
-            ),
-            text=['Your Results'],
-            hovertemplate=f'<b>Your Results</b><br>{comparison_results[0]["test"]}: %{{x}}<br>{comparison_results[1]["test"]}: %{{y}}<br>{comparison_results[2]["test"]}: %{{z}}<extra></extra>',
-            name='Your Results'
-        )])
-        
-        # Add reference point (midpoint of normal ranges)
-        fig_3d.add_trace(go.Scatter3d(
-            x=[(comparison_results[0]['min'] + comparison_results[0]['max']) / 2],
-            y=[(comparison_results[1]['min'] + comparison_results[1]['max']) / 2],
-            z=[(comparison_results[2]['min'] + comparison_results[2]['max']) / 2],
-            mode='markers',
-            marker=dict(
-                size=15,
-                color='#2ecc71',
-                symbol='circle',
-                line=dict(color='white', width=2)
-            ),
-            text=['Normal Range Center'],
-            hovertemplate='<b>Normal Range Center</b><extra></extra>',
-            name='Normal Center'
-        ))
-        
-        fig_3d.update_layout(
-            title='3D Health Parameters Visualization',
-            scene=dict(
-                xaxis_title=comparison_results[0]['test'],
-                yaxis_title=comparison_results[1]['test'],
-                zaxis_title=comparison_results[2]['test']
-            ),
-            height=500
-        )
-        
-        charts['scatter3d'] = fig_3d.to_json()
-    
-    # 9. Waterfall Chart - Show deviation from normal
-    fig_waterfall = go.Figure()
-    
-    waterfall_tests = []
-    waterfall_values = []
-    waterfall_colors = []
-    
-    for result in comparison_results[:6]:
-        mid_point = (result['min'] + result['max']) / 2
-        deviation = result['value'] - mid_point
-        waterfall_tests.append(result['test'])
-        waterfall_values.append(deviation)
-        waterfall_colors.append(result['color'])
-    
-    fig_waterfall.add_trace(go.Waterfall(
-        name='Deviation',
-        orientation='v',
-        x=waterfall_tests,
-        y=waterfall_values,
-        connector={'line': {'color': 'rgb(63, 63, 63)'}},
-        decreasing={'marker': {'color': '#3498db'}},
-        increasing={'marker': {'color': '#e74c3c'}},
-        totals={'marker': {'color': '#667eea'}},
-        hovertemplate='<b>%{x}</b><br>Deviation: %{y:.2f}<extra></extra>'
-    ))
-    
-    fig_waterfall.update_layout(
-        title='Deviation from Normal Range Midpoint',
-        xaxis_title='Test Name',
-        yaxis_title='Deviation',
-        template='plotly_white',
-        height=450,
-        showlegend=False,
-        xaxis={'tickangle': -45}
-    )
-    
-    charts['waterfall'] = fig_waterfall.to_json()
-    
-    # 10. Funnel Chart - Health Status Breakdown
-    status_counts = {}
-    for result in comparison_results:
-        status = result['status']
-        status_counts[status] = status_counts.get(status, 0) + 1
-    
-    fig_funnel = go.Figure()
-    
-    funnel_data = [
-        ('Total Tests', len(comparison_results)),
-        ('Normal', status_counts.get('Normal', 0)),
-        ('Needs Attention', status_counts.get('High', 0) + status_counts.get('Low', 0))
-    ]
-    
-    fig_funnel.add_trace(go.Funnel(
-        y=[item[0] for item in funnel_data],
-        x=[item[1] for item in funnel_data],
-        textposition='inside',
-        textinfo='value+percent initial',
-        marker={'color': ['#667eea', '#2ecc71', '#e74c3c']},
-        connector={'line': {'color': 'royalblue', 'dash': 'dot', 'width': 3}},
-        hovertemplate='<b>%{y}</b><br>Count: %{x}<extra></extra>'
-    ))
-    
-    fig_funnel.update_layout(
-        title='Health Status Funnel',
-        height=400
-    )
-    
-    charts['funnel'] = fig_funnel.to_json()
-    
-    # 11. Polar Bar Chart - Circular comparison
-    fig_polar = go.Figure()
-    
-    polar_tests = [r['test'] for r in comparison_results[:8]]
-    polar_values = []
-    polar_colors = [r['color'] for r in comparison_results[:8]]
-    
-    for result in comparison_results[:8]:
-        # Normalize to percentage of max range
-        percentage = (result['value'] / (result['max'] * 1.2)) * 100
-        polar_values.append(percentage)
-    
-    fig_polar.add_trace(go.Barpolar(
-        r=polar_values,
-        theta=polar_tests,
-        marker=dict(
-            color=polar_colors,
-            line=dict(color='white', width=2)
-        ),
-        hovertemplate='<b>%{theta}</b><br>%{r:.1f}%<extra></extra>',
-        name='Test Values'
-    ))
-    
-    fig_polar.update_layout(
-        title='Circular Test Comparison',
-        polar=dict(
-            radialaxis=dict(
-                visible=True,
-                range=[0, 100],
-                ticksuffix='%'
-            ),
-            angularaxis=dict(
-                direction='clockwise'
-            )
-        ),
-        height=500,
-        showlegend=False
-    )
-    
-    charts['polar'] = fig_polar.to_json()
-    
-    # 12. Sunburst Chart - Hierarchical view
-    sunburst_data = {
-        'labels': ['All Tests'],
-        'parents': [''],
-        'values': [len(comparison_results)],
-        'colors': ['#667eea']
-    }
-    
-    # Add status categories
-    for status in ['Normal', 'High', 'Low']:
-        count = sum(1 for r in comparison_results if r['status'] == status)
-        if count > 0:
-            sunburst_data['labels'].append(status)
-            sunburst_data['parents'].append('All Tests')
-            sunburst_data['values'].append(count)
-            color = '#2ecc71' if status == 'Normal' else ('#e74c3c' if status == 'High' else '#3498db')
-            sunburst_data['colors'].append(color)
-            
-            # Add individual tests
-            for result in comparison_results:
-                if result['status'] == status:
-                    sunburst_data['labels'].append(result['test'])
-                    sunburst_data['parents'].append(status)
-                    sunburst_data['values'].append(1)
-                    sunburst_data['colors'].append(result['color'])
-    
-    fig_sunburst = go.Figure(go.Sunburst(
-        labels=sunburst_data['labels'],
-        parents=sunburst_data['parents'],
-        values=sunburst_data['values'],
-        marker=dict(colors=sunburst_data['colors']),
-        branchvalues='total',
-        hovertemplate='<b>%{label}</b><br>Count: %{value}<extra></extra>'
-    ))
-    
-    fig_sunburst.update_layout(
-        title='Hierarchical Test Results View',
-        height=500
-    )
-    
-    charts['sunburst'] = fig_sunburst.to_json()
-    
-    # 13. Violin Plot - Distribution with statistics
-    fig_violin = go.Figure()
-    
-    for result in comparison_results[:6]:
-        # Generate sample distribution
-        samples = np.random.normal(result['value'], result['value'] * 0.08, 100)
-        
-        fig_violin.add_trace(go.Violin(
-            y=samples,
-            name=result['test'],
-            box_visible=True,
-            meanline_visible=True,
-            fillcolor=result['color'],
-            opacity=0.6,
-            x0=result['test'],
-            hovertemplate='<b>%{fullData.name}</b><br>Value: %{y:.2f}<extra></extra>'
-        ))
-    
-    fig_violin.update_layout(
-        title='Test Results Distribution (Violin Plot)',
-        yaxis_title='Value',
-        template='plotly_white',
-        height=450,
-        showlegend=False
-    )
-    
-    charts['violin'] = fig_violin.to_json()
-    
-    # 14. Indicator/KPI Cards
-    kpi_charts = []
-    for result in comparison_results[:4]:
-        fig_kpi = go.Figure()
-        
-        # Calculate percentage of normal range
-        mid_point = (result['min'] + result['max']) / 2
-        percentage = (result['value'] / mid_point) * 100
-        
-        fig_kpi.add_trace(go.Indicator(
-            mode='number+delta+gauge',
-            value=result['value'],
-            title={'text': f"{result['test']}<br><span style='font-size:0.8em'>{result['unit']}</span>"},
-            delta={
-                'reference': mid_point,
-                'relative': False,
-                'valueformat': '.2f'
-            },
-            gauge={
-                'shape': 'bullet',
-                'axis': {'range': [None, result['max'] * 1.2]},
-                'threshold': {
-                    'line': {'color': result['color'], 'width': 2},
-                    'thickness': 0.75,
-                    'value': result['value']
-                },
-                'steps': [
-                    {'range': [0, result['min']], 'color': 'lightblue'},
-                    {'range': [result['min'], result['max']], 'color': 'lightgreen'},
-                    {'range': [result['max'], result['max'] * 1.2], 'color': 'lightcoral'}
-                ],
-                'bar': {'color': result['color']}
-            },
-            domain={'x': [0, 1], 'y': [0, 1]}
-        ))
-        
-        fig_kpi.update_layout(
-            height=150,
-            margin={'t': 40, 'b': 0, 'l': 0, 'r': 0}
-        )
-        
-        kpi_charts.append(fig_kpi.to_json())
-    
-    charts['kpi'] = kpi_charts
-    
-    # 15. Sankey Diagram - Flow from status to tests
-    sankey_labels = ['All Tests', 'Normal', 'High', 'Low']
-    sankey_sources = []
-    sankey_targets = []
-    sankey_values = []
-    sankey_colors = []
-    
-    status_indices = {'Normal': 1, 'High': 2, 'Low': 3}
-    
-    for status, index in status_indices.items():
-        count = sum(1 for r in comparison_results if r['status'] == status)
-        if count > 0:
-            sankey_sources.append(0)
-            sankey_targets.append(index)
-            sankey_values.append(count)
-            color = 'rgba(46, 204, 113, 0.4)' if status == 'Normal' else ('rgba(231, 76, 60, 0.4)' if status == 'High' else 'rgba(52, 152, 219, 0.4)')
-            sankey_colors.append(color)
-    
-    fig_sankey = go.Figure(go.Sankey(
-        node=dict(
-            pad=15,
-            thickness=20,
-            line=dict(color='black', width=0.5),
-            label=sankey_labels,
-            color=['#667eea', '#2ecc71', '#e74c3c', '#3498db']
-        ),
-        link=dict(
-            source=sankey_sources,
-            target=sankey_targets,
-            value=sankey_values,
-            color=sankey_colors
-        )
-    ))
-    
-    fig_sankey.update_layout(
-        title='Test Results Flow Diagram',
-        height=400
-    )
-    
-    charts['sankey'] = fig_sankey.to_json()
-    
-    return charts
-
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', trend_history=trend_store is not None)
 
 @app.route('/chat', methods=['POST'])
 def chat():
@@ -1401,1064 +1019,129 @@ def chat():
     try:
         data = request.json
         question = data.get('question', '').lower()
-        report_data = data.get('report_data', None)
+        session = get_chat_session(data)
         
         # Generate AI-like responses based on question
-        response = generate_chat_response(question, report_data)
+        response, route = generate_chat_response(question, session)
+        print(f"Chat intent: {route.topic or '-'}/{route.intent}")
         
         return jsonify({
             'success': True,
-            'response': response
+            'response': response,
+            'intent': {'topic': route.topic, 'intent': route.intent}
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-def generate_chat_response(question, report_data):
-    """Generate intelligent responses to user questions"""
-    
-    # Enhanced knowledge base with comprehensive information
-    knowledge_base = {
-        'hemoglobin': {
-            'what': '''🔴 **Hemoglobin (Hb)** is a crucial protein found in red blood cells that carries oxygen from your lungs to all parts of your body and returns carbon dioxide back to your lungs.
-
-**Key Functions:**
-• Oxygen transport throughout the body
-• Gives blood its red color
-• Essential for cellular energy production
-• Maintains acid-base balance
-
-**Normal Ranges:**
-• Men: 14-18 g/dL
-• Women: 12-16 g/dL
-• Children: 11-13 g/dL''',
-            
-            'low': '''⚠️ **Low Hemoglobin (Anemia)** means your blood isn't carrying enough oxygen to your body's tissues.
-
-**Common Symptoms:**
-• Persistent fatigue and weakness
-• Pale skin and nail beds
-• Shortness of breath
-• Dizziness or lightheadedness
-• Cold hands and feet
-• Rapid or irregular heartbeat
-
-**Possible Causes:**
-• Iron deficiency (most common)
-• Vitamin B12 or folate deficiency
-• Chronic diseases (kidney disease, cancer)
-• Blood loss (menstruation, ulcers)
-• Bone marrow problems
-• Inherited conditions (sickle cell, thalassemia)
-
-**When to See a Doctor:**
-Consult immediately if you experience severe fatigue, chest pain, or difficulty breathing.''',
-            
-            'high': '''📈 **High Hemoglobin** means you have more red blood cells than normal, which can make your blood thicker.
-
-**Possible Causes:**
-• Dehydration (most common - easily fixed!)
-• Living at high altitude
-• Smoking
-• Lung diseases (COPD, pulmonary fibrosis)
-• Heart disease
-• Polycythemia vera (rare blood disorder)
-• Use of performance-enhancing drugs
-
-**Potential Risks:**
-• Increased blood viscosity
-• Higher risk of blood clots
-• Stroke or heart attack risk
-
-**Immediate Actions:**
-• Stay well-hydrated
-• Avoid smoking
-• Monitor oxygen levels
-• Consult your doctor for proper evaluation''',
-            
-            'improve': '''💪 **How to Improve Hemoglobin Naturally:**
-
-**Iron-Rich Foods (Best Sources):**
-• Red meat, liver, and organ meats
-• Shellfish (oysters, clams)
-• Dark leafy greens (spinach, kale)
-• Legumes (lentils, chickpeas, beans)
-• Fortified cereals and bread
-• Pumpkin seeds and quinoa
-
-**Vitamin C (Enhances Iron Absorption):**
-• Citrus fruits (oranges, lemons)
-• Bell peppers and tomatoes
-• Strawberries and kiwi
-• Broccoli and Brussels sprouts
-💡 Tip: Combine iron-rich foods with vitamin C!
-
-**Essential Vitamins:**
-• Vitamin B12: Eggs, dairy, fish, fortified foods
-• Folate: Leafy greens, beans, citrus fruits
-• Vitamin B6: Poultry, fish, potatoes, bananas
-
-**Lifestyle Changes:**
-• Avoid tea/coffee with meals (blocks iron absorption)
-• Cook in cast iron cookware
-• Consider iron supplements (consult doctor first)
-• Exercise regularly to stimulate RBC production
-• Get adequate sleep (7-9 hours)
-
-**Foods to Limit:**
-• Calcium-rich foods during iron-rich meals
-• Excessive dairy products
-• High-fiber foods with iron supplements'''
-        },
-        
-        'wbc': {
-            'what': '''🛡️ **White Blood Cells (WBC)** are your body's defense army, protecting you against infections, diseases, and foreign invaders.
-
-**Types of WBC:**
-• Neutrophils (60-70%): Fight bacterial infections
-• Lymphocytes (20-40%): Produce antibodies, fight viruses
-• Monocytes (2-8%): Clean up dead cells
-• Eosinophils (1-4%): Combat parasites, allergies
-• Basophils (<1%): Release histamine in allergic reactions
-
-**Normal Range:** 4,000-11,000 cells/μL
-
-**Functions:**
-• Identify and destroy pathogens
-• Produce antibodies
-• Remove dead or damaged cells
-• Trigger inflammatory responses''',
-            
-            'low': '''⚠️ **Low WBC Count (Leukopenia)** weakens your immune system, making you more susceptible to infections.
-
-**Common Causes:**
-• Viral infections (flu, HIV, hepatitis)
-• Autoimmune disorders (lupus, rheumatoid arthritis)
-• Bone marrow disorders
-• Medications (chemotherapy, antibiotics, antipsychotics)
-• Nutritional deficiencies (B12, folate, copper, zinc)
-• Severe infections (sepsis)
-• Radiation therapy
-
-**Symptoms to Watch:**
-• Frequent infections
-• Fever and chills
-• Mouth sores
-• Skin infections
-• Fatigue and weakness
-• Swollen lymph nodes
-
-**Precautions:**
-• Practice excellent hand hygiene
-• Avoid sick people and crowds
-• Cook food thoroughly
-• Avoid raw or undercooked foods
-• Stay up-to-date with vaccinations
-• Report fever >100.4°F immediately''',
-            
-            'high': '''📈 **High WBC Count (Leukocytosis)** usually indicates your body is fighting something.
-
-**Common Causes:**
-• Bacterial or viral infections
-• Inflammation or tissue damage
-• Allergic reactions
-• Physical or emotional stress
-• Smoking
-• Medications (corticosteroids, epinephrine)
-• Bone marrow disorders
-• Leukemia (rare, but requires evaluation)
-
-**Types of Elevation:**
-• Neutrophilia: Bacterial infection, inflammation
-• Lymphocytosis: Viral infection, chronic inflammation
-• Monocytosis: Chronic infections, autoimmune
-• Eosinophilia: Allergies, parasites
-• Basophilia: Rare, may indicate blood disorders
-
-**When to Worry:**
-• Persistent elevation without clear cause
-• Very high counts (>25,000)
-• Accompanied by fever, night sweats, weight loss
-• Unexplained bruising or bleeding
-
-**Next Steps:**
-• Identify and treat underlying infection
-• Manage stress levels
-• Quit smoking if applicable
-• Follow up with complete blood count (CBC)''',
-            
-            'improve': '''💪 **How to Support Healthy WBC Count:**
-
-**Immune-Boosting Foods:**
-• Citrus fruits (vitamin C)
-• Red bell peppers (highest vitamin C)
-• Garlic and ginger (antimicrobial)
-• Yogurt and kefir (probiotics)
-• Almonds and sunflower seeds (vitamin E)
-• Turmeric (anti-inflammatory)
-• Green tea (antioxidants)
-• Fatty fish (omega-3s)
-
-**Essential Nutrients:**
-• Vitamin C: 75-90mg daily
-• Vitamin E: 15mg daily
-• Vitamin B6: 1.3-1.7mg daily
-• Vitamin B12: 2.4mcg daily
-• Folate: 400mcg daily
-• Zinc: 8-11mg daily
-• Selenium: 55mcg daily
-
-**Lifestyle Strategies:**
-• Get 7-9 hours of quality sleep
-• Exercise regularly (moderate intensity)
-• Manage stress (meditation, yoga)
-• Stay hydrated (8-10 glasses water)
-• Avoid smoking and excessive alcohol
-• Maintain healthy weight
-• Practice good hygiene
-
-**Supplements (Consult Doctor):**
-• Multivitamin with minerals
-• Vitamin D (if deficient)
-• Probiotics for gut health
-• Omega-3 fatty acids'''
-        },
-        
-        'glucose': {
-            'what': '''🍬 **Blood Glucose (Blood Sugar)** is your body's primary energy source, fueling every cell, tissue, and organ.
-
-**How It Works:**
-• Comes from food you eat (carbohydrates)
-• Insulin helps cells absorb glucose
-• Liver stores excess as glycogen
-• Released when energy is needed
-
-**Normal Ranges:**
-• Fasting: 70-100 mg/dL (ideal)
-• 2 hours after eating: <140 mg/dL
-• Random: <200 mg/dL
-• HbA1c: <5.7% (3-month average)
-
-**Prediabetes:**
-• Fasting: 100-125 mg/dL
-• HbA1c: 5.7-6.4%
-
-**Diabetes:**
-• Fasting: ≥126 mg/dL
-• HbA1c: ≥6.5%''',
-            
-            'low': '''⚠️ **Low Blood Sugar (Hypoglycemia)** occurs when glucose drops below 70 mg/dL.
-
-**Immediate Symptoms (Act Fast!):**
-• Shakiness and trembling
-• Sweating and chills
-• Rapid heartbeat
-• Dizziness or lightheadedness
-• Hunger and nausea
-• Irritability or confusion
-• Blurred vision
-• Weakness and fatigue
-
-**Severe Symptoms (Emergency!):**
-• Confusion or unusual behavior
-• Seizures
-• Loss of consciousness
-• Inability to eat or drink
-
-**Common Causes:**
-• Skipping meals or eating too little
-• Too much insulin or diabetes medication
-• Excessive exercise without eating
-• Drinking alcohol without food
-• Certain medications
-
-**Immediate Treatment (Rule of 15):**
-1. Consume 15g fast-acting carbs:
-   • 4 glucose tablets
-   • 1/2 cup fruit juice
-   • 1 tablespoon honey
-   • 3-4 hard candies
-2. Wait 15 minutes
-3. Recheck blood sugar
-4. Repeat if still <70 mg/dL
-5. Eat a meal or snack once stable
-
-**Prevention:**
-• Eat regular, balanced meals
-• Don't skip breakfast
-• Carry glucose tablets
-• Monitor blood sugar if diabetic
-• Adjust medication with doctor's guidance''',
-            
-            'high': '''📈 **High Blood Sugar (Hyperglycemia)** indicates your body isn't processing glucose effectively.
-
-**Symptoms (May Develop Gradually):**
-• Increased thirst and dry mouth
-• Frequent urination (especially at night)
-• Fatigue and weakness
-• Blurred vision
-• Headaches
-• Slow-healing wounds
-• Frequent infections
-• Unexplained weight loss
-• Tingling in hands/feet
-
-**Serious Complications (Long-term):**
-• Heart disease and stroke
-• Kidney damage (nephropathy)
-• Eye damage (retinopathy, blindness)
-• Nerve damage (neuropathy)
-• Foot problems (poor circulation)
-• Skin conditions
-• Alzheimer's disease risk
-
-**Common Causes:**
-• Insulin resistance (prediabetes/diabetes)
-• Poor diet (high sugar, refined carbs)
-• Lack of physical activity
-• Obesity
-• Stress (raises cortisol)
-• Certain medications (steroids)
-• Illness or infection
-• Hormonal changes
-
-**Immediate Actions:**
-• Drink plenty of water
-• Avoid sugary foods and drinks
-• Take prescribed medication
-• Light exercise (if not too high)
-• Monitor blood sugar regularly
-• Seek medical help if >300 mg/dL''',
-            
-            'improve': '''💪 **How to Manage Blood Sugar Naturally:**
-
-**Best Foods for Blood Sugar Control:**
-• Non-starchy vegetables (unlimited!)
-• Leafy greens (spinach, kale, lettuce)
-• Whole grains (oats, quinoa, brown rice)
-• Legumes (beans, lentils, chickpeas)
-• Nuts and seeds (almonds, chia, flax)
-• Fatty fish (salmon, mackerel, sardines)
-• Lean proteins (chicken, turkey, tofu)
-• Berries (blueberries, strawberries)
-• Cinnamon (helps insulin sensitivity)
-• Apple cider vinegar (before meals)
-
-**Foods to Avoid/Limit:**
-• Sugary drinks (soda, juice, sweet tea)
-• White bread, pasta, rice
-• Pastries, cookies, cakes
-• Candy and sweets
-• Processed snacks
-• Fried foods
-• High-sugar fruits (watermelon, pineapple)
-
-**Eating Strategies:**
-• Eat smaller, frequent meals (5-6 times/day)
-• Never skip breakfast
-• Combine carbs with protein/fat
-• Use the plate method: 1/2 veggies, 1/4 protein, 1/4 carbs
-• Eat fiber-rich foods (25-30g daily)
-• Stay hydrated (water only)
-
-**Lifestyle Changes:**
-• Exercise 150 min/week (walking, swimming)
-• Lose 5-10% body weight if overweight
-• Get 7-9 hours quality sleep
-• Manage stress (meditation, yoga)
-• Quit smoking
-• Limit alcohol
-• Monitor blood sugar regularly
-
-**Supplements (Consult Doctor):**
-• Chromium picolinate
-• Alpha-lipoic acid
-• Berberine
-• Magnesium
-• Vitamin D
-• Cinnamon extract'''
-        },
-        
-        'cholesterol': {
-            'what': '''💛 **Cholesterol** is a waxy, fat-like substance essential for building cells, producing hormones, and making vitamin D.
-
-**Types of Cholesterol:**
-• LDL ("Bad"): Builds up in arteries, causes blockages
-• HDL ("Good"): Removes LDL from arteries
-• VLDL: Carries triglycerides
-• Total Cholesterol: Sum of all types
-
-**Optimal Levels:**
-• Total Cholesterol: <200 mg/dL
-• LDL: <100 mg/dL (optimal), <70 (very high risk)
-• HDL: >60 mg/dL (protective)
-• Triglycerides: <150 mg/dL
-• Total/HDL Ratio: <3.5
-
-**Why It Matters:**
-• Essential for cell membranes
-• Produces hormones (testosterone, estrogen, cortisol)
-• Makes bile acids for digestion
-• Synthesizes vitamin D
-• But too much LDL = heart disease risk!''',
-            
-            'low': '''📉 **Low Cholesterol** is rare but can occur.
-
-**Possible Causes:**
-• Malnutrition or malabsorption
-• Hyperthyroidism
-• Liver disease
-• Certain medications (statins overdose)
-• Genetic disorders
-• Chronic infections
-
-**Potential Issues:**
-• Hormone imbalances
-• Vitamin D deficiency
-• Depression or mood changes
-• Weakened immune system
-• Digestive problems
-
-**When to Worry:**
-• Total cholesterol <120 mg/dL
-• Accompanied by symptoms
-• Sudden drop from previous levels
-
-**What to Do:**
-• Eat healthy fats (avocados, nuts, olive oil)
-• Include eggs and fatty fish
-• Check thyroid function
-• Review medications with doctor
-• Rule out liver problems''',
-            
-            'high': '''⚠️ **High Cholesterol** is a major risk factor for heart disease and stroke.
-
-**Why It's Dangerous:**
-• LDL builds up in artery walls (plaque)
-• Narrows blood vessels
-• Reduces blood flow to heart and brain
-• Can cause heart attack or stroke
-• Often has NO symptoms (silent killer!)
-
-**Risk Factors:**
-• Poor diet (saturated fats, trans fats)
-• Lack of exercise
-• Obesity (especially belly fat)
-• Smoking
-• Diabetes
-• Family history
-• Age (men >45, women >55)
-• High blood pressure
-
-**Complications:**
-• Coronary artery disease
-• Heart attack
-• Stroke
-• Peripheral artery disease
-• Chest pain (angina)
-• Carotid artery disease
-
-**Warning Signs (Advanced):**
-• Chest pain or pressure
-• Shortness of breath
-• Pain in neck, jaw, upper abdomen
-• Numbness or coldness in extremities
-• Xanthomas (cholesterol deposits under skin)
-
-**Immediate Actions:**
-• Start heart-healthy diet TODAY
-• Begin regular exercise
-• Quit smoking
-• Lose weight if overweight
-• Consider medication (statins) if very high
-• Get lipid panel every 3-6 months''',
-            
-            'improve': '''💪 **How to Lower Cholesterol Naturally:**
-
-**Best Foods (Eat More):**
-• Oats and barley (soluble fiber)
-• Beans and lentils
-• Nuts (almonds, walnuts) - 1 handful daily
-• Fatty fish (salmon, mackerel) - 2x/week
-• Avocados
-• Olive oil (extra virgin)
-• Fruits (apples, berries, citrus)
-• Vegetables (especially leafy greens)
-• Soy products (tofu, edamame)
-• Dark chocolate (70%+ cocoa, small amounts)
-
-**Foods to Avoid:**
-• Red meat and processed meats
-• Full-fat dairy products
-• Butter and lard
-• Fried foods
-• Baked goods (cookies, cakes, pastries)
-• Trans fats (partially hydrogenated oils)
-• Fast food
-• Processed snacks
-
-**Powerful Cholesterol-Lowering Foods:**
-• Psyllium husk (5-10g daily)
-• Ground flaxseed (2 tablespoons daily)
-• Chia seeds
-• Plant sterols/stanols (2g daily)
-• Garlic (fresh or aged extract)
-• Green tea (3-4 cups daily)
-
-**Exercise Plan:**
-• 30 minutes moderate activity, 5 days/week
-• Aerobic: Walking, jogging, cycling, swimming
-• Strength training: 2 days/week
-• Even 10-minute walks help!
-• Aim for 10,000 steps daily
-
-**Lifestyle Changes:**
-• Lose 5-10% body weight
-• Quit smoking (raises HDL by 10%)
-• Limit alcohol (1 drink/day women, 2 men)
-• Manage stress
-• Get adequate sleep
-
-**Supplements (Consult Doctor):**
-• Fish oil (omega-3): 1-2g daily
-• Plant sterols: 2g daily
-• Red yeast rice (contains natural statin)
-• Niacin (vitamin B3)
-• Psyllium fiber
-• Coenzyme Q10 (if on statins)
-
-**Expected Results:**
-• Diet changes: 5-10% reduction in 6 weeks
-• Exercise: 5% reduction in 3 months
-• Weight loss: 1% reduction per 2 lbs lost
-• Combined approach: 20-30% reduction possible!'''
-        },
-        
-        'platelets': {
-            'what': '''🩸 **Platelets** are tiny blood cells that form clots to stop bleeding when you're injured.
-
-**Key Functions:**
-• Stop bleeding (hemostasis)
-• Form blood clots at injury sites
-• Release growth factors for healing
-• Maintain blood vessel integrity
-
-**Normal Range:** 150,000-400,000 cells/μL
-
-**Lifespan:** 7-10 days
-
-**How They Work:**
-1. Blood vessel is damaged
-2. Platelets rush to the site
-3. They stick together (aggregation)
-4. Form a plug to stop bleeding
-5. Clotting factors strengthen the plug
-
-**Production:**
-• Made in bone marrow
-• Regulated by thrombopoietin hormone
-• Destroyed in spleen and liver''',
-            
-            'low': '''⚠️ **Low Platelets (Thrombocytopenia)** increases bleeding risk.
-
-**Severity Levels:**
-• Mild: 100,000-150,000 (usually no symptoms)
-• Moderate: 50,000-100,000 (easy bruising)
-• Severe: <50,000 (spontaneous bleeding)
-• Critical: <20,000 (life-threatening)
-
-**Symptoms:**
-• Easy or excessive bruising (purpura)
-• Prolonged bleeding from cuts
-• Spontaneous bleeding (nose, gums)
-• Blood in urine or stool
-• Heavy menstrual periods
-• Tiny red spots on skin (petechiae)
-• Fatigue
-
-**Common Causes:**
-• Viral infections (dengue, HIV, hepatitis C)
-• Medications (heparin, antibiotics, seizure drugs)
-• Autoimmune disorders (ITP, lupus)
-• Pregnancy
-• Alcohol abuse
-• Bone marrow disorders
-• Enlarged spleen
-• Chemotherapy/radiation
-
-**When to Seek Emergency Care:**
-• Bleeding that won't stop
-• Blood in vomit or stool
-• Severe headache
-• Confusion or vision changes
-• Platelet count <20,000
-
-**Precautions:**
-• Avoid contact sports
-• Use soft toothbrush
-• Avoid aspirin and NSAIDs
-• Be careful with sharp objects
-• Avoid alcohol
-• Report any unusual bleeding''',
-            
-            'high': '''📈 **High Platelets (Thrombocytosis)** may increase blood clot risk.
-
-**Types:**
-• Primary (Essential): Bone marrow produces too many
-• Secondary (Reactive): Response to another condition
-
-**Symptoms (Often None):**
-• Headaches
-• Dizziness
-• Chest pain
-• Weakness or fatigue
-• Vision changes
-• Numbness or tingling
-• Blood clots (serious!)
-
-**Common Causes:**
-• Acute bleeding or blood loss
-• Iron deficiency anemia
-• Infections or inflammation
-• Cancer
-• Recent surgery
-• Removal of spleen
-• Inflammatory bowel disease
-• Rheumatoid arthritis
-• Bone marrow disorders
-
-**Complications:**
-• Blood clots in legs (DVT)
-• Pulmonary embolism
-• Stroke
-• Heart attack
-• Pregnancy complications
-
-**When to Worry:**
-• Platelet count >450,000
-• Persistent elevation
-• Symptoms of blood clots
-• No obvious cause
-
-**Management:**
-• Treat underlying condition
-• Aspirin (low dose) if high risk
-• Hydroxyurea (for primary)
-• Stay hydrated
-• Avoid smoking
-• Regular monitoring''',
-            
-            'improve': '''💪 **How to Support Healthy Platelet Count:**
-
-**For Low Platelets:**
-
-**Foods to Increase Platelets:**
-• Leafy greens (vitamin K): Kale, spinach, collards
-• Fatty fish (omega-3): Salmon, mackerel, sardines
-• Eggs (vitamin B12)
-• Lean meats (iron, B12)
-• Pumpkin seeds (zinc)
-• Pomegranate (antioxidants)
-• Papaya and papaya leaf extract
-• Wheatgrass juice
-• Beetroot
-• Indian gooseberry (amla)
-
-**Essential Nutrients:**
-• Vitamin B12: 2.4mcg daily
-• Folate: 400mcg daily
-• Vitamin K: 90-120mcg daily
-• Iron: 8-18mg daily
-• Vitamin C: 75-90mg daily
-• Vitamin D: 600-800 IU daily
-
-**Lifestyle Tips:**
-• Avoid alcohol (suppresses production)
-• Don't take aspirin or NSAIDs
-• Get adequate sleep
-• Manage stress
-• Avoid activities that risk bleeding
-• Stay hydrated
-
-**For High Platelets:**
-
-**Anti-Inflammatory Foods:**
-• Fatty fish (omega-3s)
-• Berries (antioxidants)
-• Turmeric and ginger
-• Green tea
-• Dark chocolate
-• Olive oil
-• Tomatoes
-• Leafy greens
-
-**Foods with Natural Blood Thinners:**
-• Garlic
-• Ginger
-• Turmeric
-• Cinnamon
-• Cayenne pepper
-• Vitamin E-rich foods
-
-**Lifestyle:**
-• Stay well-hydrated
-• Exercise regularly
-• Maintain healthy weight
-• Avoid smoking
-• Limit alcohol
-• Manage underlying conditions
-
-**Supplements (Consult Doctor):**
-• Omega-3 fish oil
-• Vitamin D (if deficient)
-• Folate and B12 (for low platelets)
-• Papaya leaf extract (for low platelets)
-• Avoid vitamin K supplements if on blood thinners'''
-        },
-        
-        'urine': {
-            'what': '''💧 **Urine Test (Urinalysis)** is a comprehensive examination of urine that provides valuable information about kidney function, urinary tract health, and overall metabolic status.
-
-**What It Includes:**
-• Physical examination (color, clarity, odor)
-• Chemical analysis (pH, protein, glucose, ketones)
-• Microscopic examination (cells, crystals, bacteria)
-
-**Why It's Important:**
-• Detects urinary tract infections (UTIs)
-• Monitors kidney function
-• Screens for diabetes
-• Identifies liver problems
-• Detects kidney stones
-• Monitors chronic conditions
-
-**Normal Urine Characteristics:**
-• Color: Pale yellow to amber
-• Clarity: Clear
-• Odor: Mild, not foul
-• pH: 4.5-8.0
-• No protein, glucose, ketones, or blood
-• Few or no cells/bacteria''',
-            
-            'protein': '''🔬 **Protein in Urine (Proteinuria)** is abnormal and may indicate kidney damage.
-
-**What It Means:**
-• Healthy kidneys filter waste but keep protein in blood
-• Damaged kidneys leak protein into urine
-• Can be temporary or chronic
-
-**Common Causes:**
-• Kidney disease (glomerulonephritis, nephrotic syndrome)
-• Diabetes (diabetic nephropathy)
-• High blood pressure
-• Urinary tract infection
-• Dehydration
-• Intense exercise (temporary)
-• Fever or stress (temporary)
-• Pregnancy (preeclampsia)
-• Multiple myeloma
-
-**Symptoms (Often None Early):**
-• Foamy or frothy urine
-• Swelling in hands, feet, face (edema)
-• Fatigue
-• Loss of appetite
-• Nausea
-
-**What to Do:**
-• Consult a doctor immediately
-• Get kidney function tests (creatinine, BUN, GFR)
-• Monitor blood pressure
-• Control blood sugar if diabetic
-• Reduce salt intake
-• Stay hydrated
-• Avoid NSAIDs (ibuprofen, aspirin)''',
-            
-            'blood': '''🩸 **Blood in Urine (Hematuria)** requires immediate medical attention.
-
-**Types:**
-• Gross hematuria: Visible blood (pink, red, or brown urine)
-• Microscopic hematuria: Only detected under microscope
-
-**Common Causes:**
-• Urinary tract infection (UTI)
-• Kidney stones
-• Enlarged prostate (men)
-• Kidney infection (pyelonephritis)
-• Bladder or kidney cancer
-• Kidney disease (glomerulonephritis)
-• Inherited disorders (sickle cell, Alport syndrome)
-• Medications (blood thinners, aspirin)
-• Strenuous exercise (runner's hematuria)
-• Trauma or injury
-
-**Warning Signs:**
-• Painful urination
-• Frequent urination
-• Fever and chills
-• Back or side pain
-• Abdominal pain
-• Blood clots in urine
-
-**Immediate Actions:**
-• See a doctor immediately
-• Don't ignore even if painless
-• Provide urine sample for testing
-• May need imaging (ultrasound, CT scan)
-• May need cystoscopy (bladder examination)
-
-**Prevention:**
-• Drink plenty of water (8-10 glasses daily)
-• Urinate after sexual activity
-• Avoid holding urine for long periods
-• Maintain good hygiene
-• Limit salt and protein if prone to stones''',
-            
-            'infection': '''🦠 **Urinary Tract Infection (UTI)** is a bacterial infection of the urinary system.
-
-**Common Signs in Urine Test:**
-• White blood cells (WBC/pus cells) elevated
-• Bacteria present
-• Nitrite positive
-• Leukocyte esterase positive
-• Blood may be present
-• Cloudy or foul-smelling urine
-
-**Symptoms:**
-• Burning sensation during urination
-• Frequent urge to urinate
-• Cloudy, dark, or strong-smelling urine
-• Pelvic pain (women)
-• Lower abdominal discomfort
-• Fever and chills (if kidney infection)
-• Back or side pain (kidney infection)
-
-**Risk Factors:**
-• Female anatomy (shorter urethra)
-• Sexual activity
-• Certain birth control methods
-• Menopause
-• Urinary tract abnormalities
-• Catheter use
-• Weakened immune system
-• Diabetes
-• Kidney stones
-
-**Treatment:**
-• Antibiotics (prescribed by doctor)
-• Drink plenty of water
-• Cranberry juice (may help prevent)
-• Avoid irritants (caffeine, alcohol, spicy foods)
-• Urinate frequently
-• Complete full antibiotic course
-
-**Prevention:**
-• Drink 8-10 glasses of water daily
-• Urinate after sexual activity
-• Wipe front to back (women)
-• Avoid holding urine
-• Wear cotton underwear
-• Avoid harsh soaps and douches
-• Take showers instead of baths''',
-            
-            'ph': '''⚖️ **Urine pH** measures the acidity or alkalinity of urine.
-
-**Normal Range:** 4.5-8.0 (typically 6.0)
-
-**Acidic Urine (pH <5.5):**
-**Causes:**
-• High-protein diet (meat, fish, eggs)
-• Diabetes (diabetic ketoacidosis)
-• Diarrhea
-• Starvation or fasting
-• Certain medications
-• Metabolic acidosis
-• Respiratory diseases
-
-**Concerns:**
-• May increase risk of uric acid kidney stones
-• May indicate metabolic problems
-
-**Alkaline Urine (pH >7.5):**
-**Causes:**
-• Vegetarian or vegan diet
-• Urinary tract infection (bacteria produce ammonia)
-• Vomiting
-• Kidney disease
-• Certain medications (antacids)
-• Respiratory alkalosis
-
-**Concerns:**
-• May increase risk of calcium phosphate stones
-• May indicate infection
-
-**How to Balance:**
-**To Reduce Acidity:**
-• Eat more fruits and vegetables
-• Reduce meat and protein intake
-• Drink alkaline water
-• Add lemon to water (becomes alkaline in body)
-
-**To Reduce Alkalinity:**
-• Increase protein intake
-• Eat more whole grains
-• Limit alkaline foods temporarily
-• Treat underlying infection''',
-            
-            'improve': '''💪 **How to Maintain Healthy Urinary System:**
-
-**Best Practices:**
-• Drink 8-10 glasses of water daily
-• Urinate when you feel the urge (don't hold it)
-• Urinate after sexual activity
-• Maintain good hygiene
-• Wear breathable cotton underwear
-• Avoid tight-fitting pants
-• Wipe front to back (women)
-
-**Foods for Urinary Health:**
-• Water (most important!)
-• Cranberries and cranberry juice (prevent UTIs)
-• Blueberries (antioxidants)
-• Watermelon (hydration, flushes system)
-• Celery (diuretic, anti-inflammatory)
-• Parsley (natural diuretic)
-• Garlic (antibacterial)
-• Probiotics (yogurt, kefir)
-• Vitamin C-rich foods (boost immunity)
-
-**Foods to Limit:**
-• Caffeine (irritates bladder)
-• Alcohol (dehydrates, irritates)
-• Spicy foods (may irritate bladder)
-• Artificial sweeteners
-• Acidic foods (if prone to stones)
-• High-sodium foods
-• Excessive protein (if prone to stones)
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Stream a chatbot answer section by section as Server-Sent Events
+    
+    Events: 'intent' (the matched route), one 'chunk' per paragraph block
+    of the answer, then 'done' - or 'error' if the answer failed."""
+    data = request.json or {}
+    question = data.get('question', '').lower()
+    session = get_chat_session(data)
+    
+    def generate():
+        try:
+            response, route = generate_chat_response(question, session)
+            print(f"Chat intent: {route.topic or '-'}/{route.intent}")
+            yield sse_event('intent', {'topic': route.topic, 'intent': route.intent})
+            for section in response.split('\n\n'):
+                yield sse_event('chunk', {'text': section})
+            yield sse_event('done', {})
+        except Exception as e:
+            yield sse_event('error', {'error': str(e)})
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
-**For Kidney Stone Prevention:**
-• Drink plenty of water (most important!)
-• Limit sodium (<2,300mg daily)
-• Moderate protein intake
-• Limit oxalate-rich foods (spinach, nuts, chocolate)
-• Get adequate calcium (don't restrict)
-• Limit vitamin C supplements
-• Reduce animal protein
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-**Supplements (Consult Doctor):**
-• Cranberry extract (UTI prevention)
-• D-mannose (UTI prevention)
-• Probiotics (urinary health)
-• Vitamin C (immune support, but not excessive)
+def get_chat_session(data):
+    """Report session for a chat request
+    
+    Reports are referenced by the ID from /analyze; full report_data is still accepted."""
+    session = report_sessions.get(data.get('report_id'))
+    report_data = data.get('report_data', None)
+    if session is None and report_data and 'results' in report_data:
+        session = ReportSession(None, report_data['results'])
+    return session
 
-**Warning Signs to See Doctor:**
-• Blood in urine
-• Painful urination
-• Frequent urination with little output
-• Fever with urinary symptoms
-• Back or side pain
-• Cloudy or foul-smelling urine
-• Protein or glucose in urine'''
-        }
-    }
+def generate_chat_response(question, session):
+    """Generate intelligent responses to user questions
+    
+    `session` is the ReportSession of the user's analyzed report, or None.
+    Returns the response text and the Route (topic, intent) that produced it."""
+    knowledge_base = get_knowledge_base()
     
     # Check if user is asking about their specific results
-    if report_data and 'results' in report_data:
-        for result in report_data['results']:
+    if session:
+        result = session.find_mentioned_test(question)
+        if result:
             test_name = result['test'].lower()
-            if test_name in question:
-                status = result['status']
-                value = result['value']
-                unit = result['unit']
-                min_val = result['min']
-                max_val = result['max']
-                
-                # Enhanced personalized response
-                if status == 'Normal':
-                    response = f"✅ **Great news!** Your {result['test']} level is {value} {unit}, which is within the healthy normal range of {min_val}-{max_val} {unit}.\n\n"
-                    response += f"**What this means:**\n{result.get('description', '')}\n\n"
-                    response += f"**Keep it up!** Continue your current healthy habits to maintain these good levels."
-                elif status == 'Low':
-                    response = f"⚠️ **Attention needed:** Your {result['test']} level is {value} {unit}, which is below the normal range of {min_val}-{max_val} {unit}.\n\n"
-                    response += f"**What this means:**\n{result.get('description', '')}\n\n"
-                    response += f"**Next steps:**\n• Consult your doctor for proper evaluation\n• Ask me 'How to improve {test_name}?' for dietary and lifestyle tips\n• Consider getting retested in 4-6 weeks"
-                else:  # High
-                    response = f"⚠️ **Attention needed:** Your {result['test']} level is {value} {unit}, which is above the normal range of {min_val}-{max_val} {unit}.\n\n"
-                    response += f"**What this means:**\n{result.get('description', '')}\n\n"
-                    response += f"**Next steps:**\n• Consult your doctor for proper evaluation\n• Ask me 'How to lower {test_name}?' for dietary and lifestyle tips\n• Monitor your levels regularly"
-                
-                return response
-    
-    # Answer general questions
-    if 'what is' in question or 'what are' in question:
-        for test, info in knowledge_base.items():
-            if test in question:
-                return info['what']
-    
-    if 'low' in question or 'decrease' in question:
-        for test, info in knowledge_base.items():
-            if test in question:
-                return info['low']
-    
-    if 'high' in question or 'increase' in question or 'elevated' in question:
-        for test, info in knowledge_base.items():
-            if test in question:
-                return info['high']
-    
-    if 'improve' in question or 'increase' in question or 'how to' in question or 'what can i do' in question:
-        for test, info in knowledge_base.items():
-            if test in question:
-                return info['improve']
-    
-    # Urine-specific questions
-    if 'urine' in question or 'urinalysis' in question:
-        if 'protein' in question:
-            if 'what' in question or 'mean' in question:
-                return knowledge_base['urine']['protein']
-            return knowledge_base['urine']['protein']
-        elif 'blood' in question:
-            return knowledge_base['urine']['blood']
-        elif 'infection' in question or 'uti' in question:
-            return knowledge_base['urine']['infection']
-        elif 'ph' in question:
-            return knowledge_base['urine']['ph']
-        elif 'what' in question or 'about' in question:
-            return knowledge_base['urine']['what']
-        elif 'improve' in question or 'healthy' in question:
-            return knowledge_base['urine']['improve']
-    
-    # General health questions
-    if 'normal range' in question:
-        return "Normal ranges vary by test:\n\n**Blood Tests:**\n• Hemoglobin: 12-16 g/dL (women), 14-18 g/dL (men)\n• WBC: 4,000-11,000 cells/μL\n• Glucose: 70-100 mg/dL (fasting)\n• Cholesterol: <200 mg/dL\n• Platelets: 150,000-400,000 cells/μL\n\n**Urine Tests:**\n• pH: 4.5-8.0\n• Specific Gravity: 1.005-1.030\n• Protein: Negative (0 mg/dL)\n• Glucose: Negative (0 mg/dL)\n• Blood: Negative (0 cells/hpf)\n• WBC: 0-5 cells/hpf\n• RBC: 0-3 cells/hpf"
-    
-    if 'how often' in question and 'test' in question:
-        return "Testing frequency depends on your health:\n• Healthy adults: Annual checkup with basic tests\n• Chronic conditions: Every 3-6 months\n• Diabetes: HbA1c every 3 months\n• High cholesterol: Every 4-6 months\nAlways follow your doctor's recommendations."
-    
-    if 'diet' in question or 'food' in question or 'eat' in question:
-        return "For optimal health:\n• Eat plenty of fruits and vegetables\n• Choose whole grains over refined carbs\n• Include lean proteins (fish, chicken, beans)\n• Limit processed foods and added sugars\n• Stay hydrated with water\n• Consider Mediterranean diet patterns\nConsult a nutritionist for personalized advice."
-    
-    if 'exercise' in question or 'workout' in question:
-        return "Exercise recommendations:\n• 150 minutes moderate activity per week\n• Or 75 minutes vigorous activity\n• Include strength training 2x/week\n• Start slowly and build up gradually\n• Walking, swimming, cycling are great options\nConsult your doctor before starting new exercise programs."
-    
-    if 'doctor' in question or 'when to see' in question:
-        return "See a doctor if:\n• Any test results are significantly abnormal\n• You have concerning symptoms\n• Results show a sudden change from previous tests\n• You have multiple abnormal results\n• You're unsure about what results mean\nAlways consult healthcare professionals for medical advice."
-    
-    # Greeting responses
-    greetings = ['hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening']
-    if any(greeting in question for greeting in greetings):
-        return "👋 Hello! I'm your AI Health Assistant. I'm here to help you understand your medical test results and answer health questions.\n\n**I can help you with:**\n• Blood tests (hemoglobin, WBC, glucose, cholesterol, etc.)\n• Urine tests (protein, blood, pH, infection markers)\n• Understanding what medical tests mean\n• Explaining your specific test results\n• Providing dietary and lifestyle recommendations\n• Answering questions about normal ranges\n• Offering health improvement tips\n\n**Try asking:**\n• 'What is hemoglobin?'\n• 'Why is my glucose high?'\n• 'What is a urine test?'\n• 'What does protein in urine mean?'\n• 'Tell me about my results'"
-    
-    # Thank you responses
-    if 'thank' in question or 'thanks' in question:
-        return "😊 You're very welcome! I'm happy to help you understand your health better. Feel free to ask me anything else about your medical results or health questions!"
-    
-    # Help requests
-    if 'help' in question or 'what can you do' in question:
-        return "🤖 **I'm your AI Health Assistant!**\n\nI can help you:\n\n**Understand Medical Tests:**\n• Blood tests: hemoglobin, WBC, glucose, cholesterol, platelets\n• Urine tests: protein, blood, pH, infection markers\n• What do these tests measure?\n• Why are they important?\n\n**Explain Your Results:**\n• Why is my [test] high or low?\n• What does my result mean?\n• Should I be concerned?\n\n**Provide Health Guidance:**\n• How to improve [test]?\n• What foods should I eat?\n• What lifestyle changes help?\n• When should I see a doctor?\n\n**General Health Info:**\n• What are normal ranges?\n• How often should I test?\n• Diet and exercise tips\n• Urinary health and kidney function\n\n💡 **Tip:** Upload your medical report first, then ask me about your specific results!"
+            status = result['status']
+            value = result['value']
+            unit = result['unit']
+            min_val = result['min']
+            max_val = result['max']
+            
+            # Enhanced personalized response
+            if status == 'Normal':
+                response = f"✅ **Great news!** Your {result['test']} level is {value} {unit}, which is within the healthy normal range of {min_val}-{max_val} {unit}.\n\n"
+                response += f"**What this means:**\n{result.get('description', '')}\n\n"
+                response += f"**Keep it up!** Continue your current healthy habits to maintain these good levels."
+            elif status == 'Low':
+                response = f"⚠️ **Attention needed:** Your {result['test']} level is {value} {unit}, which is below the normal range of {min_val}-{max_val} {unit}.\n\n"
+                response += f"**What this means:**\n{result.get('description', '')}\n\n"
+                response += f"**Next steps:**\n• Consult your doctor for proper evaluation\n• Ask me 'How to improve {test_name}?' for dietary and lifestyle tips\n• Consider getting retested in 4-6 weeks"
+            else:  # High
+                response = f"⚠️ **Attention needed:** Your {result['test']} level is {value} {unit}, which is above the normal range of {min_val}-{max_val} {unit}.\n\n"
+                response += f"**What this means:**\n{result.get('description', '')}\n\n"
+                response += f"**Next steps:**\n• Consult your doctor for proper evaluation\n• Ask me 'How to lower {test_name}?' for dietary and lifestyle tips\n• Monitor your levels regularly"
+            
+            return response, Route(result['test'], 'result')
+    
+    # Route the question to a knowledge-base topic or a general intent
+    route = get_chat_router().route(question)
+    
+    if route.topic:
+        return knowledge_base.get(route.topic, route.intent), route
+    
+    if route.intent == 'normal_range':
+        return "Normal ranges vary by test:\n\n**Blood Tests:**\n• Hemoglobin: 12-16 g/dL (women), 14-18 g/dL (men)\n• WBC: 4,000-11,000 cells/μL\n• Glucose: 70-100 mg/dL (fasting)\n• Cholesterol: <200 mg/dL\n• Platelets: 150,000-400,000 cells/μL\n\n**Urine Tests:**\n• pH: 4.5-8.0\n• Specific Gravity: 1.005-1.030\n• Protein: Negative (0 mg/dL)\n• Glucose: Negative (0 mg/dL)\n• Blood: Negative (0 cells/hpf)\n• WBC: 0-5 cells/hpf\n• RBC: 0-3 cells/hpf", route
+    
+    if route.intent == 'test_frequency':
+        return "Testing frequency depends on your health:\n• Healthy adults: Annual checkup with basic tests\n• Chronic conditions: Every 3-6 months\n• Diabetes: HbA1c every 3 months\n• High cholesterol: Every 4-6 months\nAlways follow your doctor's recommendations.", route
+    
+    if route.intent == 'diet':
+        return "For optimal health:\n• Eat plenty of fruits and vegetables\n• Choose whole grains over refined carbs\n• Include lean proteins (fish, chicken, beans)\n• Limit processed foods and added sugars\n• Stay hydrated with water\n• Consider Mediterranean diet patterns\nConsult a nutritionist for personalized advice.", route
+    
+    if route.intent == 'exercise':
+        return "Exercise recommendations:\n• 150 minutes moderate activity per week\n• Or 75 minutes vigorous activity\n• Include strength training 2x/week\n• Start slowly and build up gradually\n• Walking, swimming, cycling are great options\nConsult your doctor before starting new exercise programs.", route
+    
+    if route.intent == 'doctor':
+        return "See a doctor if:\n• Any test results are significantly abnormal\n• You have concerning symptoms\n• Results show a sudden change from previous tests\n• You have multiple abnormal results\n• You're unsure about what results mean\nAlways consult healthcare professionals for medical advice.", route
+    
+    if route.intent == 'greeting':
+        return "👋 Hello! I'm your AI Health Assistant. I'm here to help you understand your medical test results and answer health questions.\n\n**I can help you with:**\n• Blood tests (hemoglobin, WBC, glucose, cholesterol, etc.)\n• Urine tests (protein, blood, pH, infection markers)\n• Understanding what medical tests mean\n• Explaining your specific test results\n• Providing dietary and lifestyle recommendations\n• Answering questions about normal ranges\n• Offering health improvement tips\n\n**Try asking:**\n• 'What is hemoglobin?'\n• 'Why is my glucose high?'\n• 'What is a urine test?'\n• 'What does protein in urine mean?'\n• 'Tell me about my results'", route
+    
+    if route.intent == 'thanks':
+        return "😊 You're very welcome! I'm happy to help you understand your health better. Feel free to ask me anything else about your medical results or health questions!", route
+    
+    if route.intent == 'help':
+        return "🤖 **I'm your AI Health Assistant!**\n\nI can help you:\n\n**Understand Medical Tests:**\n• Blood tests: hemoglobin, WBC, glucose, cholesterol, platelets\n• Urine tests: protein, blood, pH, infection markers\n• What do these tests measure?\n• Why are they important?\n\n**Explain Your Results:**\n• Why is my [test] high or low?\n• What does my result mean?\n• Should I be concerned?\n\n**Provide Health Guidance:**\n• How to improve [test]?\n• What foods should I eat?\n• What lifestyle changes help?\n• When should I see a doctor?\n\n**General Health Info:**\n• What are normal ranges?\n• How often should I test?\n• Diet and exercise tips\n• Urinary health and kidney function\n\n💡 **Tip:** Upload your medical report first, then ask me about your specific results!", route
     
     # Summary request
-    if 'summary' in question or 'overview' in question or 'all results' in question or 'my results' in question:
-        if report_data and 'results' in report_data:
-            results = report_data['results']
+    if route.intent == 'summary':
+        if session:
+            results = session.results
             normal_count = sum(1 for r in results if r['status'] == 'Normal')
             high_count = sum(1 for r in results if r['status'] == 'High')
             low_count = sum(1 for r in results if r['status'] == 'Low')
@@ -2479,9 +1162,9 @@ Consult immediately if you experience severe fatigue, chest pain, or difficulty
             else:
                 response += "🎉 **Excellent!** All your test results are within normal ranges. Keep up the great work with your health!"
             
-            return response
+            return response, route
         else:
-            return "📋 I don't have your test results yet. Please upload your medical report first, then I can provide a detailed summary of your results!"
+            return "📋 I don't have your test results yet. Please upload your medical report first, then I can provide a detailed summary of your results!", route
     
     # Default responses
     default_responses = [
@@ -2490,10 +1173,17 @@ Consult immediately if you experience severe fatigue, chest pain, or difficulty
         "🩺 I specialize in explaining medical test results! You can ask me:\n• What a specific test means\n• Why your results are high or low\n• How to improve your health markers\n• General health and nutrition questions\n\nWhat's on your mind?"
     ]
     
-    return random.choice(default_responses)
+    return random.choice(default_responses), FALLBACK_ROUTE
 
 @app.route('/analyze', methods=['POST'])
 def analyze_report():
+    """Analyze an uploaded report
+    
+    In async mode (ANALYZE_ASYNC or form field async=1) the upload is queued
+    and the response is a job ID right away; poll /jobs/<job_id> or
+    subscribe to /jobs/<job_id>/events for the result. Otherwise, with form
+    field stream=1, the analysis runs in this request and the response is
+    the same event stream as /jobs/<job_id>/events."""
     if 'file' not in request.files:
         return jsonify({'error': 'No file uploaded'}), 400
     
@@ -2505,74 +1195,324 @@ def analyze_report():
     if not allowed_file(file.filename):
         return jsonify({'error': 'Invalid file type. Please upload PNG, JPG, or PDF'}), 400
     
+    patient_id = history_patient(request.form)
+    run_async = app.config['ANALYZE_ASYNC'] or request.form.get('async') in ('1', 'true')
+    
     try:
         filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(filepath)
+        data = file.read()
         
-        # Extract text based on file type
-        if filename.lower().endswith('.pdf'):
-            text = extract_text_from_pdf(filepath)
-        else:
-            text = extract_text_from_image(filepath)
+        if run_async:
+            job = submit_analysis_job(filename, data, patient_id)
+            return jsonify({'success': True, 'job_id': job.job_id, 'status': job.status}), 202
+        
+        if request.form.get('stream') in ('1', 'true'):
+            return job_event_stream(stream_analysis(filename, data, patient_id))
+        
+        # Extract text based on file type (cached by content hash)
+        text, ocr_info = extract_text_from_upload(filename, data)
+        payload, status_code = analyze_text(text, ocr_info, patient_id, content_hash=upload_hash(data))
+        return jsonify(payload), status_code
+    
+    except Exception as e:
+        return jsonify({'error': f'Error processing file: {str(e)}'}), 500
+
+def submit_analysis_job(filename, data, patient_id):
+    """Queue the OCR of an upload on the job pool; the analysis runs when it finishes
+    
+    Cached uploads need no OCR and come back as an already finished job."""
+    is_pdf = filename.lower().endswith('.pdf')
+    strategy = app.config['OCR_STRATEGY']
+    profile = app.config['PREPROCESS_PROFILE']
+    backend = app.config['OCR_BACKEND']
+    cache_key = ocr_cache_key(filename, data)
+    
+    content_hash = upload_hash(data)
+    
+    def analyze(text, ocr_info, progress):
+        payload, status_code = analyze_text(text, ocr_info, patient_id, progress, content_hash)
+        if status_code != 200:
+            raise ValueError(payload['error'])
+        return payload
+    
+    def finish(result, progress):
+        ocr_cache.put(cache_key, result['text'])
+        return analyze(result['text'], {'cached': False, 'pages': result['pages']}, progress)
+    
+    text = ocr_cache.get(cache_key)
+    if text is not None:
+        return analysis_jobs.run_here(analyze, text, {'cached': True, 'pages': []})
+    
+    # Jobs already run in parallel, so a PDF's pages are OCR'd one after another in the job's process
+    if is_pdf:
+        return analysis_jobs.submit(
+            ocr_pdf_bytes, data, 1, app.config['PDF_DPI'], app.config['PDF_PAGE_BATCH'], strategy, profile, backend,
+            finish=finish
+        )
+    return analysis_jobs.submit(ocr_image_bytes, data, strategy, profile, backend, finish=finish)
+
+def stream_analysis(filename, data, patient_id):
+    """Analyze an upload on a thread of this process, as a Job whose progress can be streamed
+    
+    The synchronous counterpart of submit_analysis_job: no pool process, so
+    it needs neither ANALYZE_ASYNC nor a single worker process."""
+    content_hash = upload_hash(data)
+    
+    def analyze(progress):
+        text, ocr_info = extract_text_from_upload(filename, data, progress)
+        payload, status_code = analyze_text(text, ocr_info, patient_id, progress, content_hash)
+        if status_code != 200:
+            raise ValueError(payload['error'])
+        return payload
+    
+    return analysis_jobs.run_thread(analyze)
+
+def analyze_text(text, ocr_info, patient_id=None, progress=None, content_hash=None):
+    """Analyze OCR'd report text into the /analyze response
+    
+    Returns (payload, HTTP status code). Stage events ('extracted',
+    'compared', 'charts') go to `progress(event, data)`, if given."""
+    print(f"OCR strategy: {[page['strategy'] for page in ocr_info['pages']] or 'cached'}")
+    print(f"Extracted text length: {len(text)}")
+    print(f"First 500 chars: {text[:500]}")
+    
+    # Extract medical values
+    extracted_values = extract_medical_values(text, progress)
+    
+    print(f"Extracted values: {extracted_values}")
+    
+    if not extracted_values:
+        return {
+            'error': 'No medical values detected in the report. Please ensure the image is clear and contains medical test results.',
+            'debug_text': text[:1000]  # Return first 1000 chars for debugging
+        }, 400
+    
+    payload = build_analysis(extracted_values, patient_id, progress, content_hash)
+    payload['ocr'] = ocr_info
+    payload['extracted_text'] = text[:500]  # First 500 chars for debugging
+    return payload, 200
+
+def build_analysis(extracted_values, patient_id=None, progress=None, content_hash=None):
+    """Compare extracted values with the reference ranges and build the analysis
+    
+    Everything in the /analyze response that does not depend on the OCR.
+    `content_hash` (see upload_hash()) keeps re-uploads out of the patient's history."""
+    # Compare with reference (one snapshot of the ranges for the whole request)
+    reference_table = reference_registry.current
+    comparison_results = compare_with_reference(extracted_values, reference_table)
+    if progress:
+        progress('compared', {'abnormal': sum(result['status'] != 'Normal' for result in comparison_results)})
+    
+    # Keep the results server-side so /chat only needs the report ID
+    session = report_sessions.create(comparison_results, patient_id)
+    
+    # Add the results to the patient's history for the trend charts
+    if patient_id and trend_store is not None:
+        trend_store.append(patient_id, comparison_results, session.created, session.report_id, content_hash)
+    session.chart_frame = report_chart_frame(session)
+    
+    # Generate insights
+    insights = generate_insights(comparison_results)
+    
+    # Get doctor suggestions
+    doctor_recommendations = get_specialist_recommendations(comparison_results)
+    
+    # Get health tips
+    health_tips = get_health_tips_by_condition(comparison_results)
+    
+    # Get relevant health news
+    relevant_news = get_relevant_news(comparison_results)
+    
+    # Get food recommendations for abnormal tests
+    food_recommendations = {}
+    for result in comparison_results:
+        if result['status'] != 'Normal':
+            food_rec = get_food_recommendations(result['test'], result['status'])
+            if food_rec.get('eat_more') or food_rec.get('eat_less'):
+                food_recommendations[result['test']] = food_rec
+    
+    # History charts are only listed when the patient has past reports
+    charts = available_charts(session.chart_frame)
+    if progress:
+        progress('charts', {'charts': charts})
+    
+    return {
+        'success': True,
+        'report_id': session.report_id,
+        'patient_token': patient_id,
+        'results': comparison_results,
+        'insights': insights,
+        'charts': charts,  # Loaded on demand from /charts/<report_id>/<name>
+        'doctor_recommendations': doctor_recommendations,
+        'health_tips': health_tips,
+        'relevant_news': relevant_news,
+        'food_recommendations': food_recommendations,
+        'reference_version': reference_table.version
+    }
+
+@app.route('/analyze/batch', methods=['POST'])
+def analyze_batch():
+    """Analyze several reports of one patient (e.g. CBC, lipid panel, urinalysis) together
+    
+    The files are OCR'd concurrently, their values merged into one set of
+    results (the first file to report a test wins), and the analysis runs
+    once on the combined results. 'files' tells what each file contributed."""
+    files = [file for file in request.files.getlist('files') if file.filename != '']
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+    
+    if len(files) > app.config['BATCH_MAX_FILES']:
+        return jsonify({'error': f"Too many files. Please upload at most {app.config['BATCH_MAX_FILES']} at once"}), 400
+    
+    invalid = [file.filename for file in files if not allowed_file(file.filename)]
+    if invalid:
+        return jsonify({'error': f"Invalid file type: {', '.join(invalid)}. Please upload PNG, JPG, or PDF"}), 400
+    
+    patient_id = history_patient(request.form)
+    
+    try:
+        uploads = [(secure_filename(file.filename), file.read()) for file in files]
         
-        print(f"Extracted text length: {len(text)}")
-        print(f"First 500 chars: {text[:500]}")
+        # PDFs already spread their pages over the OCR process pool; threads keep several files in flight
+        with ThreadPoolExecutor(max_workers=min(len(uploads), app.config['BATCH_OCR_THREADS'])) as pool:
+            ocr_results = list(pool.map(lambda upload: try_extract_text(*upload), uploads))
         
-        # Extract medical values
-        extracted_values = extract_medical_values(text)
+        file_summaries = []
+        extracted_values = []
+        sources = {}
+        for (filename, _), (text, ocr_info, error) in zip(uploads, ocr_results):
+            summary = {'filename': filename}
+            file_summaries.append(summary)
+            if error is not None:
+                summary['error'] = error
+                continue
+            values = extract_medical_values(text)
+            summary['ocr'] = ocr_info
+            summary['tests'] = [item['test'] for item in values]
+            summary['duplicates'] = []
+            for item in values:
+                if item['test'] in sources:
+                    summary['duplicates'].append(item['test'])
+                else:
+                    sources[item['test']] = filename
+                    extracted_values.append(item)
         
-        print(f"Extracted values: {extracted_values}")
+        print(f"Batch extracted values: {extracted_values}")
         
         if not extracted_values:
             return jsonify({
-                'error': 'No medical values detected in the report. Please ensure the image is clear and contains medical test results.',
-                'debug_text': text[:1000]  # Return first 1000 chars for debugging
+                'error': 'No medical values detected in any of the reports. Please ensure the images are clear and contain medical test results.',
+                'files': file_summaries
             }), 400
         
-        # Compare with reference
-        comparison_results = compare_with_reference(extracted_values)
-        
-        # Generate insights
-        insights = generate_insights(comparison_results)
-        
-        # Create visualization
-        chart_json = create_visualization(comparison_results)
-        
-        # Get doctor suggestions
-        doctor_recommendations = get_specialist_recommendations(comparison_results)
-        
-        # Get health tips
-        health_tips = get_health_tips_by_condition(comparison_results)
-        
-        # Get relevant health news
-        relevant_news = get_relevant_news(comparison_results)
-        
-        # Get food recommendations for abnormal tests
-        food_recommendations = {}
-        for result in comparison_results:
-            if result['status'] != 'Normal':
-                food_rec = get_food_recommendations(result['test'], result['status'])
-                if food_rec.get('eat_more') or food_rec.get('eat_less'):
-                    food_recommendations[result['test']] = food_rec
-        
-        # Clean up uploaded file
-        os.remove(filepath)
-        
-        return jsonify({
-            'success': True,
-            'results': comparison_results,
-            'insights': insights,
-            'chart': chart_json,
-            'doctor_recommendations': doctor_recommendations,
-            'health_tips': health_tips,
-            'relevant_news': relevant_news,
-            'food_recommendations': food_recommendations,
-            'extracted_text': text[:500]  # First 500 chars for debugging
-        })
+        payload = build_analysis(extracted_values, patient_id, content_hash=upload_hash(*(data for _, data in uploads)))
+        payload['files'] = file_summaries
+        payload['sources'] = sources
+        return jsonify(payload)
     
     except Exception as e:
-        return jsonify({'error': f'Error processing file: {str(e)}'}), 500
+        return jsonify({'error': f'Error processing files: {str(e)}'}), 500
+
+def try_extract_text(filename, data):
+    """extract_text_from_upload for one file of a batch: (text, OCR details, error message)"""
+    try:
+        text, ocr_info = extract_text_from_upload(filename, data)
+        return text, ocr_info, None
+    except Exception as e:
+        return None, None, str(e)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Status of an /analyze job, with the analysis once it is done"""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Follow an /analyze job as Server-Sent Events
+    
+    Events: 'status' whenever the status changes, 'progress' for each stage
+    ({'stage': 'rasterized'|'ocr'|'extracted'|'compared'|'charts', ...}),
+    then 'done' (the analysis) or 'error'."""
+    job = analysis_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found or expired'}), 404
+    return job_event_stream(job)
+
+def job_event_stream(job):
+    """Server-Sent Events response following a job until it finishes (see job_events)"""
+    def generate():
+        status = None
+        sent = 0
+        finished = False
+        while not finished:
+            events, finished = job.next_events(sent, timeout=1)
+            if not finished and job.status != status:
+                status = job.status
+                yield sse_event('status', {'job_id': job.job_id, 'status': status})
+            for event, data in events:
+                yield sse_event('progress', dict(data, stage=event))
+            sent += len(events)
+        yield sse_event('status', {'job_id': job.job_id, 'status': job.status})
+        if job.error is not None:
+            yield sse_event('error', {'error': job.error})
+        else:
+            yield sse_event('done', job.result)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/ocr_cache/stats', methods=['GET'])
+def ocr_cache_stats():
+    """Report OCR cache hit/miss counters"""
+    return jsonify({
+        'success': True,
+        'stats': ocr_cache.stats()
+    })
+
+@app.route('/charts/<report_id>/<chart_name>')
+def get_chart(report_id, chart_name):
+    """Build one chart of an analyzed report on demand, cached per report"""
+    session = report_sessions.get(report_id)
+    if session is None:
+        return jsonify({'error': 'Report not found or expired. Please analyze it again.'}), 404
+    
+    try:
+        chart_format = app.config['CHART_FORMAT']
+        chart_json = session.charts.get((chart_name, chart_format))
+        if chart_json is None:
+            if session.chart_frame is None:
+                session.chart_frame = report_chart_frame(session)
+            chart_json = build_chart_json(chart_name, session.chart_frame, chart_format)
+            if chart_json is None:
+                return jsonify({'error': f'Chart not available: {chart_name}'}), 404
+            session.charts[(chart_name, chart_format)] = chart_json
+        return Response(chart_json, mimetype='application/json')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def report_chart_frame(session):
+    """ChartFrame of a report, with its patient's results up to the report when it has one"""
+    history = None
+    if session.patient_id and trend_store is not None:
+        tests = [result['test'] for result in session.results]
+        history = trend_store.history(session.patient_id, tests, until=session.created)
+    return ChartFrame(session.results, history)
+
+@app.route('/chart_templates/<name>')
+def get_chart_template(name):
+    """Plotly template referenced by name from compact chart specs"""
+    if name not in CHART_TEMPLATES:
+        return jsonify({'error': f'Unknown chart template: {name}'}), 404
+    response = jsonify(template_json(name))
+    response.cache_control.public = True
+    response.cache_control.max_age = 86400
+    return response
 
 @app.route('/get_doctor_suggestions', methods=['POST'])
 def get_doctor_suggestions():
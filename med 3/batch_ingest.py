@@ -0,0 +1,274 @@
+"""
+Batch Ingest
+Offline OCR, extraction and reference comparison for archives of scanned reports
+
+Usage (from the project folder):
+    python batch_ingest.py ARCHIVE [ARCHIVE ...] [--output results.parquet]
+                           [--workers 8] [--checkpoint results.checkpoint.jsonl]
+
+Every PDF/PNG/JPG under the given folders (or the given files) is OCR'd,
+its values extracted and compared with reference_data.csv on a process
+pool. Each finished file is appended to a JSON-lines checkpoint as soon as
+it completes, so an interrupted run started again with the same arguments
+skips the files already done (unless they changed since). A report that
+kills its worker process (out of memory, a crash in poppler or Tesseract)
+is retried on a process of its own and recorded as failed if it crashes
+again, so it cannot stop the run. At the end all
+results are written as one row per test to a columnar file: Parquet when
+pyarrow is installed, CSV otherwise.
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PROJECT_DIR)
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+REPORT_EXTENSIONS = ('.pdf', '.png', '.jpg', '.jpeg')
+
+# Output columns, one row per extracted test
+COLUMNS = ('source', 'test', 'value', 'unit', 'min', 'max', 'status', 'reference_version')
+
+# Files submitted to the pool ahead of the results being collected
+MAX_PENDING_PER_WORKER = 4
+
+# Checkpoint lines written between fsyncs
+FSYNC_EVERY = 50
+
+
+def find_reports(paths):
+    """Report files under `paths` (folders are searched recursively), sorted"""
+    reports = []
+    for path in paths:
+        if os.path.isdir(path):
+            for folder, _, names in os.walk(path):
+                reports.extend(os.path.join(folder, name) for name in names
+                               if name.lower().endswith(REPORT_EXTENSIONS))
+        elif path.lower().endswith(REPORT_EXTENSIONS):
+            reports.append(path)
+    return sorted(os.path.abspath(report) for report in reports)
+
+
+def file_signature(path):
+    """(size, mtime) of a file; a changed file is processed again on resume"""
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def load_checkpoint(path):
+    """{source: entry} of every complete line in a checkpoint file"""
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Partial last line of an interrupted run
+            done[entry['source']] = entry
+    return done
+
+
+def init_worker():
+    """Pool initializer: load the app's extraction and reference code once per process"""
+    os.chdir(PROJECT_DIR)  # app.py loads reference_data.csv relative to the project folder
+    import app  # noqa: F401
+
+
+def process_report(path, dpi):
+    """OCR one report and compare its values with the reference ranges (runs in pool workers)"""
+    from app import extract_medical_values, compare_with_reference, reference_registry
+    from ocr_engine import extract_text_from_image_bytes, extract_text_from_pdf
+
+    entry = {'source': path, 'signature': None}
+    start = time.perf_counter()
+    try:
+        entry['signature'] = file_signature(path)
+        if path.lower().endswith('.pdf'):
+            # The pool already runs one report per process, so pages are read one after another
+            text = extract_text_from_pdf(path, workers=1, dpi=dpi)
+        else:
+            # From memory: the file-based path writes a preprocessed copy next to the original
+            with open(path, 'rb') as f:
+                text = extract_text_from_image_bytes(f.read())
+        reference_table = reference_registry.current
+        results = compare_with_reference(extract_medical_values(text), reference_table)
+        entry['reference_version'] = reference_table.version
+        entry['results'] = [
+            {key: result[key] for key in ('test', 'value', 'unit', 'min', 'max', 'status')}
+            for result in results
+        ]
+    except Exception as e:
+        entry['error'] = f'{type(e).__name__}: {e}'
+    entry['seconds'] = round(time.perf_counter() - start, 3)
+    return entry
+
+
+def process_isolated(path, dpi):
+    """process_report on a process of its own, so if it crashes only this report fails"""
+    with ProcessPoolExecutor(max_workers=1, initializer=init_worker) as pool:
+        try:
+            return pool.submit(process_report, path, dpi).result()
+        except BrokenProcessPool:
+            pass
+    # Signed like any other result, so a resume skips it unless the file changes (or --retry-errors)
+    try:
+        signature = file_signature(path)
+    except OSError:
+        signature = None
+    return {'source': path, 'signature': signature, 'seconds': None,
+            'error': 'BrokenProcessPool: the worker process died (out of memory or crashed in OCR)'}
+
+
+def process_on_pool(paths, workers, dpi, record):
+    """
+    Process reports from the iterator `paths` on a new pool, handing each entry to `record`
+
+    Returns None once `paths` is exhausted. If a worker process dies the pool
+    is unusable; the reports that were in flight are returned instead (their
+    finished neighbours are still recorded) and `paths` is left after them.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as pool:
+        pending = {}
+        while True:
+            # Keep a bounded number of files in flight instead of queuing the whole archive
+            for path in paths:
+                try:
+                    pending[pool.submit(process_report, path, dpi)] = path
+                except BrokenProcessPool:
+                    return [path, *pending.values()]
+                if len(pending) >= workers * MAX_PENDING_PER_WORKER:
+                    break
+            if not pending:
+                return None
+            future = next(as_completed(pending))
+            path = pending.pop(future)
+            try:
+                entry = future.result()
+            except BrokenProcessPool:
+                # The pool fails every unfinished future; collect the ones that finished first
+                crashed = [path]
+                for other, other_path in pending.items():
+                    try:
+                        record(other.result())
+                    except BrokenProcessPool:
+                        crashed.append(other_path)
+                return crashed
+            record(entry)
+
+
+def to_columns(entries):
+    """Column lists (see COLUMNS) for the results of checkpoint entries"""
+    columns = {name: [] for name in COLUMNS}
+    for entry in entries:
+        for result in entry.get('results', ()):
+            columns['source'].append(entry['source'])
+            columns['reference_version'].append(entry['reference_version'])
+            for name in ('test', 'value', 'unit', 'min', 'max', 'status'):
+                columns[name].append(result[name])
+    columns['value'] = [float(value) for value in columns['value']]
+    return columns
+
+
+def write_output(columns, path, output_format):
+    """Write the result columns as Parquet or CSV"""
+    if output_format == 'parquet':
+        pq.write_table(pa.table(columns), path)
+        return
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows(zip(*(columns[name] for name in COLUMNS)))
+
+
+def run(reports, checkpoint_path, workers, dpi, retry_errors=False):
+    """Process the reports not already in the checkpoint; return every checkpoint entry"""
+    done = load_checkpoint(checkpoint_path)
+    todo = [path for path in reports
+            if path not in done
+            or done[path]['signature'] != file_signature(path)
+            or (retry_errors and 'error' in done[path])]
+    print(f'{len(reports)} reports, {len(reports) - len(todo)} already in {checkpoint_path}, {len(todo)} to process')
+
+    if todo:
+        start = time.time()
+        finished = 0
+        with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint:
+            def record(entry):
+                nonlocal finished
+                done[entry['source']] = entry
+                checkpoint.write(json.dumps(entry) + '\n')
+                checkpoint.flush()
+                finished += 1
+                if finished % FSYNC_EVERY == 0:
+                    os.fsync(checkpoint.fileno())
+                if finished % 100 == 0 or finished == len(todo):
+                    rate = finished / max(time.time() - start, 1e-9)
+                    print(f'  {finished}/{len(todo)} done ({rate:.1f} reports/sec)')
+
+            remaining = iter(todo)
+            while True:
+                crashed = process_on_pool(remaining, workers, dpi, record)
+                if crashed is None:
+                    break
+                # One of these killed its worker; run each alone so only that one fails
+                print(f'  a worker process died; retrying {len(crashed)} in-flight reports one at a time')
+                for path in crashed:
+                    record(process_isolated(path, dpi))
+
+    wanted = set(reports)
+    return [entry for source, entry in done.items() if source in wanted]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('paths', nargs='+', help='report files or folders to search for PDF/PNG/JPG files')
+    parser.add_argument('--output', default='ingest_results.parquet',
+                        help='results file (.parquet, or .csv; .csv is used when pyarrow is missing)')
+    parser.add_argument('--checkpoint', help='progress file for resuming (default: OUTPUT.checkpoint.jsonl)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='processes OCRing reports')
+    parser.add_argument('--dpi', type=int, default=None, help='PDF rasterization DPI (default: the app setting)')
+    parser.add_argument('--retry-errors', action='store_true', help='process files that failed last time again')
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output)
+    output_format = 'csv' if output.lower().endswith('.csv') else 'parquet'
+    if output_format == 'parquet' and pa is None:
+        output = os.path.splitext(output)[0] + '.csv'
+        output_format = 'csv'
+        print(f'pyarrow is not installed; writing CSV to {output}')
+    checkpoint_path = os.path.abspath(args.checkpoint or output + '.checkpoint.jsonl')
+
+    reports = find_reports(args.paths)
+    if not reports:
+        sys.exit('No PDF/PNG/JPG reports found')
+
+    if args.dpi is None:
+        from ocr_engine import DEFAULT_PDF_DPI
+        args.dpi = DEFAULT_PDF_DPI
+
+    entries = run(reports, checkpoint_path, args.workers, args.dpi, args.retry_errors)
+
+    columns = to_columns(entries)
+    write_output(columns, output, output_format)
+    failed = [entry for entry in entries if 'error' in entry]
+    print(f"Wrote {len(columns['test'])} results from {len(entries) - len(failed)} reports to {output}")
+    if failed:
+        print(f'{len(failed)} reports failed (see {checkpoint_path}), e.g. {failed[0]["source"]}: {failed[0]["error"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,202 @@
+"""
+Extraction Benchmark
+Latency, throughput and accuracy of extract_medical_values / compare_with_reference
+
+Usage (from the project folder):
+    python benchmarks/extraction_benchmark.py [--iterations 200] [--json results.json]
+                                              [--baseline old.json] [--min-precision 0.8]
+
+Every benchmarks/corpus/<name>.txt is an OCR text fixture and
+<name>.expected.json holds its golden {"values": {test: value}}. The runner
+times each stage per report, prints p50/p90/p99 latencies and reports/sec,
+and scores the extracted (test, value) pairs against the golden files.
+With --baseline it prints the change against a previous --json run, and
+--min-precision / --min-recall make it exit non-zero on a regression.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CORPUS_DIR = os.path.join(PROJECT_DIR, 'benchmarks', 'corpus')
+sys.path.insert(0, PROJECT_DIR)
+os.chdir(PROJECT_DIR)  # app.py loads reference_data.csv relative to the project folder
+
+from app import extract_medical_values, compare_with_reference
+
+# Relative tolerance when comparing an extracted value with the golden value
+VALUE_TOLERANCE = 1e-6
+
+
+def load_corpus(folder=CORPUS_DIR):
+    """Return [(name, text, expected_values)] for every fixture with a golden file"""
+    corpus = []
+    for text_path in sorted(glob.glob(os.path.join(folder, '*.txt'))):
+        name = os.path.splitext(os.path.basename(text_path))[0]
+        golden_path = os.path.join(folder, f'{name}.expected.json')
+        if not os.path.exists(golden_path):
+            print(f'Skipping {name}: no {name}.expected.json')
+            continue
+        with open(text_path, encoding='utf-8') as f:
+            text = f.read()
+        with open(golden_path, encoding='utf-8') as f:
+            expected = json.load(f)['values']
+        corpus.append((name, text, expected))
+    return corpus
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[rank]
+
+
+def values_match(found, expected):
+    return abs(found - expected) <= VALUE_TOLERANCE * max(1.0, abs(expected))
+
+
+def score(extracted, expected):
+    """True positives, false positives and false negatives of one report"""
+    found = {item['test']: item['value'] for item in extracted}
+    tp = sum(1 for test, value in found.items() if test in expected and values_match(value, expected[test]))
+    fp = len(found) - tp
+    fn = len(expected) - tp
+    missed = sorted(test for test in expected if test not in found or not values_match(found[test], expected[test]))
+    spurious = sorted(test for test in found if test not in expected)
+    return tp, fp, fn, missed, spurious
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+
+def run(corpus, iterations, warmup):
+    """Time both stages over the corpus and score the extraction output"""
+    timings = {'extract': [], 'compare': [], 'total': []}
+    reports = {}
+
+    for _ in range(warmup):
+        for _, text, _ in corpus:
+            compare_with_reference(extract_medical_values(text))
+
+    for _ in range(iterations):
+        for _, text, _ in corpus:
+            start = time.perf_counter()
+            extracted = extract_medical_values(text)
+            extracted_at = time.perf_counter()
+            compare_with_reference(extracted)
+            done = time.perf_counter()
+            timings['extract'].append(extracted_at - start)
+            timings['compare'].append(done - extracted_at)
+            timings['total'].append(done - start)
+
+    for name, text, expected in corpus:
+        tp, fp, fn, missed, spurious = score(extract_medical_values(text), expected)
+        reports[name] = {
+            'tp': tp, 'fp': fp, 'fn': fn,
+            'precision': ratio(tp, tp + fp),
+            'recall': ratio(tp, tp + fn),
+            'missed': missed,
+            'spurious': spurious
+        }
+
+    tp = sum(r['tp'] for r in reports.values())
+    fp = sum(r['fp'] for r in reports.values())
+    fn = sum(r['fn'] for r in reports.values())
+    stages = {
+        stage: {
+            'p50_us': percentile(samples, 50) * 1e6,
+            'p90_us': percentile(samples, 90) * 1e6,
+            'p99_us': percentile(samples, 99) * 1e6,
+            'mean_us': sum(samples) / len(samples) * 1e6
+        }
+        for stage, samples in timings.items()
+    }
+    return {
+        'reports': reports,
+        'stages': stages,
+        'throughput_reports_per_sec': ratio(len(timings['total']), sum(timings['total'])),
+        'precision': ratio(tp, tp + fp),
+        'recall': ratio(tp, tp + fn),
+        'iterations': iterations,
+        'corpus_size': len(corpus)
+    }
+
+
+def print_results(results, baseline=None):
+    def delta(current, key_path, lower_is_better=False):
+        if not baseline:
+            return ''
+        previous = baseline
+        for key in key_path:
+            previous = previous.get(key, {}) if isinstance(previous, dict) else {}
+        if not isinstance(previous, (int, float)) or not previous:
+            return ''
+        change = (current - previous) / previous * 100
+        marker = '' if abs(change) < 5 else (' (worse)' if (change > 0) == lower_is_better else ' (better)')
+        return f'  {change:+.1f}%{marker}'
+
+    print(f"Corpus: {results['corpus_size']} reports x {results['iterations']} iterations\n")
+    print(f"{'fixture':<28}{'precision':>10}{'recall':>8}   missed / spurious")
+    for name, report in results['reports'].items():
+        notes = ', '.join(report['missed']) or '-'
+        if report['spurious']:
+            notes += ' / ' + ', '.join(report['spurious'])
+        print(f"{name:<28}{report['precision']:>10.2f}{report['recall']:>8.2f}   {notes}")
+
+    print(f"\n{'stage':<10}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}")
+    for stage, stats in results['stages'].items():
+        print(f"{stage:<10}{stats['p50_us']:>10.1f}{stats['p90_us']:>10.1f}{stats['p99_us']:>10.1f}"
+              f"{delta(stats['p50_us'], ['stages', stage, 'p50_us'], lower_is_better=True)}")
+
+    print(f"\nThroughput: {results['throughput_reports_per_sec']:.0f} reports/sec"
+          f"{delta(results['throughput_reports_per_sec'], ['throughput_reports_per_sec'])}")
+    print(f"Precision:  {results['precision']:.3f}{delta(results['precision'], ['precision'])}")
+    print(f"Recall:     {results['recall']:.3f}{delta(results['recall'], ['recall'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--iterations', type=int, default=200, help='timed passes over the corpus')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed passes before measuring')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='previous --json results to compare against')
+    parser.add_argument('--min-precision', type=float, help='exit 1 if overall precision is lower')
+    parser.add_argument('--min-recall', type=float, help='exit 1 if overall recall is lower')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    if not corpus:
+        sys.exit(f'No fixtures found in {CORPUS_DIR}')
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+
+    results = run(corpus, args.iterations, args.warmup)
+    print_results(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if args.min_precision is not None and results['precision'] < args.min_precision:
+        print(f"\nFAIL: precision {results['precision']:.3f} < {args.min_precision}")
+        failed = True
+    if args.min_recall is not None and results['recall'] < args.min_recall:
+        print(f"\nFAIL: recall {results['recall']:.3f} < {args.min_recall}")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+Preprocessing Benchmark
+Compares the 'quality' and 'fast' preprocessing profiles on the sample reports
+
+Usage (from the project folder):
+    python benchmarks/preprocess_benchmark.py [--repeat 3] [--tesseract-cmd tesseract]
+
+For every image in uploads/ it reports preprocessing and OCR wall time per
+profile. When Tesseract is available it also compares each profile's OCR
+output against the 'quality' (original) pipeline: character similarity of
+the text and agreement of the values found by extract_medical_values.
+"""
+
+import argparse
+import difflib
+import os
+import statistics
+import sys
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+os.chdir(PROJECT_DIR)  # app.py loads reference_data.csv relative to the project folder
+
+import cv2
+import pytesseract
+
+from ocr_engine import preprocess_array, run_ocr, PREPROCESS_PROFILES
+from app import extract_medical_values
+
+
+def sample_images(folder):
+    """Sample report images, skipping leftovers of the old file-based pipeline"""
+    for name in sorted(os.listdir(folder)):
+        if name.lower().endswith(('.png', '.jpg', '.jpeg')) and '_processed' not in name:
+            yield os.path.join(folder, name)
+
+
+def time_call(func, repeat):
+    """Run func `repeat` times, return (median seconds, last result)"""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), result
+
+
+def value_agreement(reference, candidate):
+    """Share of reference (test, value) pairs that the candidate also found"""
+    expected = {(v['test'], v['value']) for v in reference}
+    found = {(v['test'], v['value']) for v in candidate}
+    if not expected:
+        return 1.0 if not found else 0.0
+    return len(expected & found) / len(expected)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--folder', default='uploads', help='folder with sample report images')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per image and profile')
+    parser.add_argument('--tesseract-cmd', help='path to the tesseract binary')
+    args = parser.parse_args()
+
+    if args.tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = args.tesseract_cmd
+    try:
+        pytesseract.get_tesseract_version()
+        ocr_available = True
+    except (pytesseract.TesseractNotFoundError, OSError):
+        ocr_available = False
+        print('Tesseract not found - reporting preprocessing time only\n')
+
+    header = f"{'image':<28}{'profile':<10}{'size':>12}{'prep ms':>10}{'ocr ms':>10}{'text sim':>10}{'values':>9}"
+    print(header)
+    print('-' * len(header))
+
+    totals = {profile: {'prep': 0.0, 'ocr': 0.0} for profile in PREPROCESS_PROFILES}
+    for path in sample_images(args.folder):
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        reference = None
+        for profile in PREPROCESS_PROFILES:
+            prep_time, processed = time_call(lambda: preprocess_array(img, profile), args.repeat)
+            totals[profile]['prep'] += prep_time
+
+            ocr_ms, similarity, agreement = '-', '-', '-'
+            if ocr_available:
+                ocr_time, result = time_call(lambda: run_ocr(processed), 1)
+                totals[profile]['ocr'] += ocr_time
+                values = extract_medical_values(result['text'])
+                if reference is None:
+                    reference = (result['text'], values)
+                similarity = f"{difflib.SequenceMatcher(None, reference[0], result['text']).ratio():.2f}"
+                agreement = f"{value_agreement(reference[1], values):.0%}"
+                ocr_ms = f"{ocr_time * 1000:.0f}"
+
+            size = f"{processed.shape[1]}x{processed.shape[0]}"
+            print(f"{os.path.basename(path):<28}{profile:<10}{size:>12}{prep_time * 1000:>10.1f}"
+                  f"{ocr_ms:>10}{similarity:>10}{agreement:>9}")
+
+    print('\nTotals (median per image, summed):')
+    for profile, total in totals.items():
+        line = f"  {profile:<8} preprocess {total['prep'] * 1000:8.1f} ms"
+        if ocr_available:
+            line += f"   ocr {total['ocr'] * 1000:8.1f} ms"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
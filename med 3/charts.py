@@ -0,0 +1,795 @@
+"""
+Report Charts
+Plotly figures for analyzed reports, built one chart at a time on demand
+"""
+
+import time
+from functools import lru_cache
+
+import numpy as np
+import plotly.graph_objects as go
+import plotly.io as pio
+from plotly.io.json import to_json_plotly
+
+from reference_ranges import STATUS_COLORS
+
+# Serialization formats: 'plotly' (fig.to_json(), template embedded in every figure)
+# or 'compact' (data + layout with the template replaced by its name)
+CHART_FORMATS = ('plotly', 'compact')
+DEFAULT_CHART_FORMAT = 'compact'
+
+# Templates the builders use; compact specs refer to these by name
+CHART_TEMPLATES = ('plotly', 'plotly_white')
+
+# Chart name -> (builder, minimum number of results it needs, whether it needs history), in display order
+CHART_BUILDERS = {}
+
+# Shared past reports two tests need before their correlation is shown
+MIN_CORRELATION_REPORTS = 3
+
+
+class ChartFrame:
+    """
+    Column view of comparison results shared by every chart builder
+
+    Built in one pass over the results: test/unit/color/status columns,
+    value and range columns as NumPy arrays (`value_list` keeps the values
+    as extracted, ints included, for labels), status counts and the test
+    positions per status (in report order), and each distinct color parsed
+    once into an RGB tuple.
+
+    `history` is the patient's past results from the trend store,
+    {test: (timestamps, values)}; the trend, distribution and correlation
+    charts are only offered when there is one.
+    """
+
+    def __init__(self, comparison_results, history=None):
+        self.history = history or {}
+        size = len(comparison_results)
+        self.tests = []
+        self.units = []
+        self.colors = []
+        self.statuses = []
+        self.value_list = []
+        self.values = np.empty(size)
+        self.mins = np.empty(size)
+        self.maxs = np.empty(size)
+        self.status_counts = {}
+        self.indices_by_status = {}
+        self.rgb = {}
+
+        for i, result in enumerate(comparison_results):
+            status = result['status']
+            color = result['color']
+            self.tests.append(result['test'])
+            self.units.append(result['unit'])
+            self.colors.append(color)
+            self.statuses.append(status)
+            self.value_list.append(result['value'])
+            self.values[i] = result['value']
+            self.mins[i] = result['min']
+            self.maxs[i] = result['max']
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+            self.indices_by_status.setdefault(status, []).append(i)
+            if color not in self.rgb:
+                self.rgb[color] = hex_to_rgb(color)
+
+        self.mids = (self.mins + self.maxs) / 2
+        # Python numbers for per-test figure properties
+        self._rows = list(zip(self.value_list, self.mins.tolist(), self.maxs.tolist(), self.mids.tolist()))
+
+    def __len__(self):
+        return len(self.tests)
+
+    def row(self, i):
+        """
+        (value, min, max, midpoint) of the i-th test as Python numbers
+        """
+        return self._rows[i]
+
+    def series(self, i):
+        """
+        (timestamps, values) history of the i-th test, or None with fewer than 2 results
+        """
+        series = self.history.get(self.tests[i])
+        if series is None or len(series[0]) < 2:
+            return None
+        return series
+
+    @property
+    def has_history(self):
+        return any(len(timestamps) >= 2 for timestamps, _ in self.history.values())
+
+    def rgba(self, color, alpha):
+        """
+        CSS rgba() string for a hex color
+        """
+        rgb = self.rgb.get(color) or hex_to_rgb(color)
+        return f'rgba({rgb[0]}, {rgb[1]}, {rgb[2]}, {alpha})'
+
+
+def hex_to_rgb(color):
+    return int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
+
+
+def format_timestamp(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M', time.localtime(timestamp))
+
+
+def history_correlation(frame, count):
+    """
+    Correlation matrix of the first `count` tests over the patient's reports
+
+    Reports are matched by timestamp. A pair that shares fewer than
+    MIN_CORRELATION_REPORTS reports, or has a constant value, gets None.
+    """
+    tests = frame.tests[:count]
+    timestamps = sorted({t for test in tests if test in frame.history for t in frame.history[test][0].tolist()})
+    positions = {t: row for row, t in enumerate(timestamps)}
+    samples = np.full((len(timestamps), count), np.nan)
+    for column, test in enumerate(tests):
+        if test in frame.history:
+            test_timestamps, values = frame.history[test]
+            samples[[positions[t] for t in test_timestamps.tolist()], column] = values
+
+    matrix = [[None] * count for _ in range(count)]
+    for a in range(count):
+        matrix[a][a] = 1.0
+        for b in range(a + 1, count):
+            shared = ~np.isnan(samples[:, a]) & ~np.isnan(samples[:, b])
+            x, y = samples[shared, a], samples[shared, b]
+            if len(x) >= MIN_CORRELATION_REPORTS and x.std() > 0 and y.std() > 0:
+                matrix[a][b] = matrix[b][a] = float(np.corrcoef(x, y)[0, 1])
+    return matrix
+
+
+def percent_of(values, bases):
+    """
+    values / bases * 100 as a list, with None (a gap) where the base is 0
+
+    Urine tests with a 0-0 reference range have a zero midpoint and max.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = (values / bases) * 100
+    return [p if base != 0 else None for p, base in zip(percentages.tolist(), bases.tolist())]
+
+
+def chart(name, min_results=1, history=False):
+    """
+    Register a chart builder under `name`
+
+    A builder takes a ChartFrame and returns a go.Figure, or a list of
+    figures for multi-figure charts (gauges, KPI cards). `history` charts
+    are built from the patient's past results and need a frame with some.
+    """
+    def register(builder):
+        CHART_BUILDERS[name] = (builder, min_results, history)
+        return builder
+    return register
+
+
+def available_charts(comparison_results):
+    """
+    Names of the charts that can be built for these results (or ChartFrame)
+
+    Plain results have no history, so they leave out the history charts.
+    """
+    has_history = isinstance(comparison_results, ChartFrame) and comparison_results.has_history
+    return [name for name, (_, min_results, history) in CHART_BUILDERS.items()
+            if len(comparison_results) >= min_results and (has_history or not history)]
+
+
+def build_chart(name, frame):
+    """
+    Build one chart from a ChartFrame; None for an unknown chart or too few results
+    """
+    if name not in CHART_BUILDERS or name not in available_charts(frame):
+        return None
+    builder = CHART_BUILDERS[name][0]
+    return builder(frame)
+
+
+@lru_cache(maxsize=None)
+def template_json(name):
+    """
+    A named Plotly template as a JSON-ready dict
+    """
+    return pio.templates[name].to_plotly_json()
+
+
+def compact_spec(fig):
+    """
+    Figure as {'data', 'layout', 'template'} with the template given by name
+
+    The client fetches each named template once (see /chart_templates) and
+    puts it back into the layout. A template that is not one of
+    CHART_TEMPLATES stays inline and 'template' is None.
+    """
+    spec = fig.to_plotly_json()
+    template = spec['layout'].pop('template', None)
+    spec['template'] = None
+    for name in CHART_TEMPLATES:
+        if template == template_json(name):
+            spec['template'] = name
+            break
+    else:
+        if template is not None:
+            spec['layout']['template'] = template
+    return spec
+
+
+def build_chart_json(name, frame, chart_format=DEFAULT_CHART_FORMAT):
+    """
+    Build one chart as a JSON document (a figure, or an array of figures)
+    """
+    figure = build_chart(name, frame)
+    if figure is None:
+        return None
+    figures = figure if isinstance(figure, list) else [figure]
+    if chart_format == 'compact':
+        parts = [to_json_plotly(compact_spec(fig)) for fig in figures]
+    else:
+        parts = [fig.to_json() for fig in figures]
+    if isinstance(figure, list):
+        return '[' + ','.join(parts) + ']'
+    return parts[0]
+
+
+@chart('bar')
+def build_bar(frame):
+    """Bar Chart with Range Indicators"""
+    fig_bar = go.Figure()
+
+    values = frame.value_list
+
+    fig_bar.add_trace(go.Bar(
+        x=frame.tests,
+        y=values,
+        marker_color=frame.colors,
+        text=[f"{v} {unit}" for v, unit in zip(values, frame.units)],
+        textposition='outside',
+        hovertemplate='<b>%{x}</b><br>Value: %{y}<br>Normal: %{customdata[0]} - %{customdata[1]}<extra></extra>',
+        customdata=list(zip(frame.mins.tolist(), frame.maxs.tolist())),
+        name='Your Value'
+    ))
+
+    fig_bar.update_layout(
+        title='Medical Test Results Overview',
+        xaxis_title='Test Name',
+        yaxis_title='Value',
+        template='plotly_white',
+        height=450,
+        showlegend=False,
+        xaxis={'tickangle': -45}
+    )
+
+    return fig_bar
+
+
+@chart('gauges')
+def build_gauges(frame):
+    """Gauge Charts for each test"""
+    gauges = []
+    for i in range(min(6, len(frame))):  # First 6 tests
+        value, min_val, max_val, mid = frame.row(i)
+        fig_gauge = go.Figure(go.Indicator(
+            mode="gauge+number+delta",
+            value=value,
+            domain={'x': [0, 1], 'y': [0, 1]},
+            title={'text': f"{frame.tests[i]}<br><span style='font-size:0.8em'>{frame.units[i]}</span>"},
+            delta={'reference': mid},
+            gauge={
+                'axis': {'range': [None, max_val * 1.2]},
+                'bar': {'color': frame.colors[i]},
+                'steps': [
+                    {'range': [0, min_val], 'color': "lightblue"},
+                    {'range': [min_val, max_val], 'color': "lightgreen"},
+                    {'range': [max_val, max_val * 1.2], 'color': "lightcoral"}
+                ],
+                'threshold': {
+                    'line': {'color': "red", 'width': 4},
+                    'thickness': 0.75,
+                    'value': max_val
+                }
+            }
+        ))
+
+        fig_gauge.update_layout(
+            height=250,
+            margin={'t': 50, 'b': 0, 'l': 0, 'r': 0}
+        )
+
+        gauges.append(fig_gauge)
+
+    return gauges
+
+
+@chart('pie')
+def build_pie(frame):
+    """Status Distribution Pie Chart"""
+    fig_pie = go.Figure(data=[go.Pie(
+        labels=list(frame.status_counts.keys()),
+        values=list(frame.status_counts.values()),
+        marker=dict(colors=['#2ecc71', '#e74c3c', '#3498db']),
+        hole=0.4,
+        textinfo='label+percent',
+        hovertemplate='<b>%{label}</b><br>Count: %{value}<br>Percentage: %{percent}<extra></extra>'
+    )])
+
+    fig_pie.update_layout(
+        title='Health Status Distribution',
+        height=350,
+        showlegend=True
+    )
+
+    return fig_pie
+
+
+@chart('radar')
+def build_radar(frame):
+    """Radar/Spider Chart - Normalized values"""
+    fig_radar = go.Figure()
+
+    # Normalize values to percentage of normal range (limit to 8 for readability)
+    normalized_values = percent_of(frame.values[:8], frame.mids[:8])
+    radar_tests = frame.tests[:8]
+
+    fig_radar.add_trace(go.Scatterpolar(
+        r=normalized_values,
+        theta=radar_tests,
+        fill='toself',
+        name='Your Results',
+        line=dict(color='#667eea', width=2),
+        fillcolor='rgba(102, 126, 234, 0.3)'
+    ))
+
+    # Add reference line at 100%
+    fig_radar.add_trace(go.Scatterpolar(
+        r=[100] * len(radar_tests),
+        theta=radar_tests,
+        name='Normal Range',
+        line=dict(color='#2ecc71', width=2, dash='dash')
+    ))
+
+    fig_radar.update_layout(
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 150],
+                ticksuffix='%'
+            )
+        ),
+        showlegend=True,
+        title='Health Parameters Radar View',
+        height=500
+    )
+
+    return fig_radar
+
+
+@chart('trend', history=True)
+def build_trend(frame):
+    """Trend Chart of the patient's past results for the first 4 tests with history"""
+    fig_trend = go.Figure()
+    shown = [i for i in range(len(frame)) if frame.series(i) is not None][:4]
+    first = min(frame.series(i)[0][0] for i in shown)
+    last = max(frame.series(i)[0][-1] for i in shown)
+    band_x = [format_timestamp(first), format_timestamp(last)]
+
+    for i in shown:
+        test, color = frame.tests[i], frame.colors[i]
+        _, min_val, max_val, _ = frame.row(i)
+        timestamps, values = frame.series(i)
+
+        fig_trend.add_trace(go.Scatter(
+            x=[format_timestamp(t) for t in timestamps.tolist()],
+            y=values.tolist(),
+            mode='lines+markers',
+            name=test,
+            line=dict(width=3),
+            marker=dict(size=8),
+            hovertemplate='<b>%{fullData.name}</b><br>%{x}<br>Value: %{y:.2f}<extra></extra>'
+        ))
+
+        # Add reference range bands
+        fig_trend.add_trace(go.Scatter(
+            x=band_x,
+            y=[max_val, max_val],
+            mode='lines',
+            name=f'{test} Max',
+            line=dict(color=color, width=1, dash='dash'),
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+
+        fig_trend.add_trace(go.Scatter(
+            x=band_x,
+            y=[min_val, min_val],
+            mode='lines',
+            name=f'{test} Min',
+            line=dict(color=color, width=1, dash='dash'),
+            fill='tonexty',
+            fillcolor=frame.rgba(color, 0.1),
+            showlegend=False,
+            hoverinfo='skip'
+        ))
+
+    fig_trend.update_layout(
+        title='Health Trends Over Time',
+        xaxis_title='Report Date',
+        yaxis_title='Value',
+        template='plotly_white',
+        height=450,
+        hovermode='x unified'
+    )
+
+    return fig_trend
+
+
+@chart('box', history=True)
+def build_box(frame):
+    """Box Plot - Distribution Analysis of the patient's history (the current value for tests without one)"""
+    fig_box = go.Figure()
+
+    for i in range(min(6, len(frame))):
+        series = frame.series(i)
+        samples = series[1].tolist() if series is not None else [frame.row(i)[0]]
+
+        fig_box.add_trace(go.Box(
+            y=samples,
+            name=frame.tests[i],
+            marker_color=frame.colors[i],
+            boxmean='sd',
+            hovertemplate='<b>%{fullData.name}</b><br>Value: %{y:.2f}<extra></extra>'
+        ))
+
+    fig_box.update_layout(
+        title='Test Results Distribution Analysis',
+        yaxis_title='Value',
+        template='plotly_white',
+        height=450,
+        showlegend=False
+    )
+
+    return fig_box
+
+
+@chart('heatmap', min_results=4, history=True)
+def build_heatmap(frame):
+    """Heatmap - Correlation Matrix over the patient's history (blank where too few reports are shared)"""
+    test_names = frame.tests[:6]
+
+    correlation_matrix = history_correlation(frame, len(test_names))
+    text = [[None if r is None else round(r, 2) for r in row] for row in correlation_matrix]
+
+    fig_heatmap = go.Figure(data=go.Heatmap(
+        z=correlation_matrix,
+        x=test_names,
+        y=test_names,
+        colorscale='RdYlGn',
+        zmid=0.5,
+        text=text,
+        texttemplate='%{text}',
+        textfont={"size": 10},
+        hovertemplate='%{x} vs %{y}<br>Correlation: %{z:.2f}<extra></extra>'
+    ))
+
+    fig_heatmap.update_layout(
+        title='Test Parameters Correlation Matrix',
+        height=450,
+        xaxis={'tickangle': -45}
+    )
+
+    return fig_heatmap
+
+
+@chart('scatter3d', min_results=3)
+def build_scatter3d(frame):
+    """3D Scatter Plot (for first 3 tests with sufficient data)"""
+    x_test, y_test, z_test = frame.tests[:3]
+    x_value, y_value, z_value = frame.value_list[:3]
+    x_mid, y_mid, z_mid = frame.mids[:3].tolist()
+
+    fig_3d = go.Figure(data=[go.Scatter3d(
+        x=[x_value],
+        y=[y_value],
+        z=[z_value],
+        mode='markers',
+        marker=dict(
+            size=20,
+            color='#667eea',
+            symbol='diamond',
+            line=dict(color='white', width=2)
+        ),
+        text=['Your Results'],
+        hovertemplate=f'<b>Your Results</b><br>{x_test}: %{{x}}<br>{y_test}: %{{y}}<br>{z_test}: %{{z}}<extra></extra>',
+        name='Your Results'
+    )])
+
+    # Add reference point (midpoint of normal ranges)
+    fig_3d.add_trace(go.Scatter3d(
+        x=[x_mid],
+        y=[y_mid],
+        z=[z_mid],
+        mode='markers',
+        marker=dict(
+            size=15,
+            color='#2ecc71',
+            symbol='circle',
+            line=dict(color='white', width=2)
+        ),
+        text=['Normal Range Center'],
+        hovertemplate='<b>Normal Range Center</b><extra></extra>',
+        name='Normal Center'
+    ))
+
+    fig_3d.update_layout(
+        title='3D Health Parameters Visualization',
+        scene=dict(
+            xaxis_title=x_test,
+            yaxis_title=y_test,
+            zaxis_title=z_test
+        ),
+        height=500
+    )
+
+    return fig_3d
+
+
+@chart('waterfall')
+def build_waterfall(frame):
+    """Waterfall Chart - Show deviation from normal"""
+    fig_waterfall = go.Figure()
+
+    fig_waterfall.add_trace(go.Waterfall(
+        name='Deviation',
+        orientation='v',
+        x=frame.tests[:6],
+        y=(frame.values[:6] - frame.mids[:6]).tolist(),
+        connector={'line': {'color': 'rgb(63, 63, 63)'}},
+        decreasing={'marker': {'color': '#3498db'}},
+        increasing={'marker': {'color': '#e74c3c'}},
+        totals={'marker': {'color': '#667eea'}},
+        hovertemplate='<b>%{x}</b><br>Deviation: %{y:.2f}<extra></extra>'
+    ))
+
+    fig_waterfall.update_layout(
+        title='Deviation from Normal Range Midpoint',
+        xaxis_title='Test Name',
+        yaxis_title='Deviation',
+        template='plotly_white',
+        height=450,
+        showlegend=False,
+        xaxis={'tickangle': -45}
+    )
+
+    return fig_waterfall
+
+
+@chart('funnel')
+def build_funnel(frame):
+    """Funnel Chart - Health Status Breakdown"""
+    status_counts = frame.status_counts
+
+    fig_funnel = go.Figure()
+
+    funnel_data = [
+        ('Total Tests', len(frame)),
+        ('Normal', status_counts.get('Normal', 0)),
+        ('Needs Attention', status_counts.get('High', 0) + status_counts.get('Low', 0))
+    ]
+
+    fig_funnel.add_trace(go.Funnel(
+        y=[item[0] for item in funnel_data],
+        x=[item[1] for item in funnel_data],
+        textposition='inside',
+        textinfo='value+percent initial',
+        marker={'color': ['#667eea', '#2ecc71', '#e74c3c']},
+        connector={'line': {'color': 'royalblue', 'dash': 'dot', 'width': 3}},
+        hovertemplate='<b>%{y}</b><br>Count: %{x}<extra></extra>'
+    ))
+
+    fig_funnel.update_layout(
+        title='Health Status Funnel',
+        height=400
+    )
+
+    return fig_funnel
+
+
+@chart('polar')
+def build_polar(frame):
+    """Polar Bar Chart - Circular comparison"""
+    fig_polar = go.Figure()
+
+    # Normalize to percentage of max range
+    polar_values = percent_of(frame.values[:8], frame.maxs[:8] * 1.2)
+
+    fig_polar.add_trace(go.Barpolar(
+        r=polar_values,
+        theta=frame.tests[:8],
+        marker=dict(
+            color=frame.colors[:8],
+            line=dict(color='white', width=2)
+        ),
+        hovertemplate='<b>%{theta}</b><br>%{r:.1f}%<extra></extra>',
+        name='Test Values'
+    ))
+
+    fig_polar.update_layout(
+        title='Circular Test Comparison',
+        polar=dict(
+            radialaxis=dict(
+                visible=True,
+                range=[0, 100],
+                ticksuffix='%'
+            ),
+            angularaxis=dict(
+                direction='clockwise'
+            )
+        ),
+        height=500,
+        showlegend=False
+    )
+
+    return fig_polar
+
+
+@chart('sunburst')
+def build_sunburst(frame):
+    """Sunburst Chart - Hierarchical view"""
+    labels = ['All Tests']
+    parents = ['']
+    values = [len(frame)]
+    colors = ['#667eea']
+
+    # Add status categories, each followed by its tests
+    for status in ['Normal', 'High', 'Low']:
+        indices = frame.indices_by_status.get(status)
+        if indices:
+            labels.append(status)
+            parents.append('All Tests')
+            values.append(len(indices))
+            colors.append(STATUS_COLORS[status])
+
+            labels.extend(frame.tests[i] for i in indices)
+            parents.extend([status] * len(indices))
+            values.extend([1] * len(indices))
+            colors.extend(frame.colors[i] for i in indices)
+
+    fig_sunburst = go.Figure(go.Sunburst(
+        labels=labels,
+        parents=parents,
+        values=values,
+        marker=dict(colors=colors),
+        branchvalues='total',
+        hovertemplate='<b>%{label}</b><br>Count: %{value}<extra></extra>'
+    ))
+
+    fig_sunburst.update_layout(
+        title='Hierarchical Test Results View',
+        height=500
+    )
+
+    return fig_sunburst
+
+
+@chart('violin', history=True)
+def build_violin(frame):
+    """Violin Plot - Distribution with statistics of the patient's history (the current value for tests without one)"""
+    fig_violin = go.Figure()
+
+    for i in range(min(6, len(frame))):
+        test = frame.tests[i]
+        series = frame.series(i)
+        samples = series[1].tolist() if series is not None else [frame.row(i)[0]]
+
+        fig_violin.add_trace(go.Violin(
+            y=samples,
+            name=test,
+            box_visible=True,
+            meanline_visible=True,
+            fillcolor=frame.colors[i],
+            opacity=0.6,
+            x0=test,
+            hovertemplate='<b>%{fullData.name}</b><br>Value: %{y:.2f}<extra></extra>'
+        ))
+
+    fig_violin.update_layout(
+        title='Test Results Distribution (Violin Plot)',
+        yaxis_title='Value',
+        template='plotly_white',
+        height=450,
+        showlegend=False
+    )
+
+    return fig_violin
+
+
+@chart('kpi')
+def build_kpi(frame):
+    """Indicator/KPI Cards"""
+    kpi_charts = []
+    for i in range(min(4, len(frame))):
+        value, min_val, max_val, mid = frame.row(i)
+        color = frame.colors[i]
+        fig_kpi = go.Figure()
+
+        fig_kpi.add_trace(go.Indicator(
+            mode='number+delta+gauge',
+            value=value,
+            title={'text': f"{frame.tests[i]}<br><span style='font-size:0.8em'>{frame.units[i]}</span>"},
+            delta={
+                'reference': mid,
+                'relative': False,
+                'valueformat': '.2f'
+            },
+            gauge={
+                'shape': 'bullet',
+                'axis': {'range': [None, max_val * 1.2]},
+                'threshold': {
+                    'line': {'color': color, 'width': 2},
+                    'thickness': 0.75,
+                    'value': value
+                },
+                'steps': [
+                    {'range': [0, min_val], 'color': 'lightblue'},
+                    {'range': [min_val, max_val], 'color': 'lightgreen'},
+                    {'range': [max_val, max_val * 1.2], 'color': 'lightcoral'}
+                ],
+                'bar': {'color': color}
+            },
+            domain={'x': [0, 1], 'y': [0, 1]}
+        ))
+
+        fig_kpi.update_layout(
+            height=150,
+            margin={'t': 40, 'b': 0, 'l': 0, 'r': 0}
+        )
+
+        kpi_charts.append(fig_kpi)
+
+    return kpi_charts
+
+
+@chart('sankey')
+def build_sankey(frame):
+    """Sankey Diagram - Flow from status to tests"""
+    sankey_labels = ['All Tests', 'Normal', 'High', 'Low']
+    sankey_sources = []
+    sankey_targets = []
+    sankey_values = []
+    sankey_colors = []
+
+    status_indices = {'Normal': 1, 'High': 2, 'Low': 3}
+
+    for status, index in status_indices.items():
+        count = frame.status_counts.get(status, 0)
+        if count > 0:
+            sankey_sources.append(0)
+            sankey_targets.append(index)
+            sankey_values.append(count)
+            sankey_colors.append(frame.rgba(STATUS_COLORS[status], 0.4))
+
+    fig_sankey = go.Figure(go.Sankey(
+        node=dict(
+            pad=15,
+            thickness=20,
+            line=dict(color='black', width=0.5),
+            label=sankey_labels,
+            color=['#667eea', '#2ecc71', '#e74c3c', '#3498db']
+        ),
+        link=dict(
+            source=sankey_sources,
+            target=sankey_targets,
+            value=sankey_values,
+            color=sankey_colors
+        )
+    ))
+
+    fig_sankey.update_layout(
+        title='Test Results Flow Diagram',
+        height=400
+    )
+
+    return fig_sankey
@@ -0,0 +1,155 @@
+"""
+Chat Intent Router
+Maps a chat question to a (topic, intent) pair through an inverted token index
+"""
+
+import re
+import threading
+from collections import namedtuple
+
+from knowledge_base import get_knowledge_base
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+# Longest cue phrase in words ('what can you do')
+MAX_PHRASE_WORDS = 4
+
+# Extra words that name a knowledge-base topic besides the topic key itself
+TOPIC_ALIASES = {
+    'hemoglobin': ('haemoglobin', 'hb', 'hgb'),
+    'wbc': ('white blood cell', 'white blood cells', 'leukocytes', 'leucocytes'),
+    'glucose': ('sugar', 'blood sugar'),
+    'cholesterol': ('ldl', 'hdl'),
+    'platelets': ('platelet', 'plt'),
+    'urine': ('urinalysis', 'urinary', 'uti', 'proteinuria', 'hematuria')
+}
+
+# Cue phrases for the intents stored per topic in knowledge_base.json. When a
+# question cues several intents the first one listed wins: specific sub-topics,
+# then advice, then low/high, then the generic explanation.
+TOPIC_INTENT_CUES = {
+    'protein': ('protein', 'proteinuria'),
+    'blood': ('blood', 'hematuria'),
+    'infection': ('infection', 'uti', 'bacteria'),
+    'ph': ('ph', 'acidic', 'acidity'),
+    'improve': ('improve', 'how to', 'what can i do', 'increase', 'raise', 'lower', 'reduce',
+                'boost', 'healthy', 'diet', 'food', 'foods', 'eat'),
+    'low': ('low', 'decrease', 'decreased', 'deficiency'),
+    'high': ('high', 'increased', 'elevated'),
+    'what': ('what is', 'what are', 'what does', 'mean', 'means', 'meaning', 'explain')
+}
+
+# Intents answered without a topic, in tie-break order. Each intent is a list
+# of cue groups and every group must match (e.g. 'how often' and 'test').
+GENERAL_INTENT_CUES = {
+    'normal_range': [('normal range', 'normal ranges', 'reference range')],
+    'test_frequency': [('how often',), ('test', 'tests', 'tested', 'testing', 'checkup')],
+    'diet': [('diet', 'food', 'foods', 'eat', 'eating', 'nutrition')],
+    'exercise': [('exercise', 'workout', 'workouts')],
+    'doctor': [('doctor', 'when to see', 'physician')],
+    'greeting': [('hi', 'hello', 'hey', 'good morning', 'good afternoon', 'good evening')],
+    'thanks': [('thank', 'thanks', 'thank you')],
+    'help': [('help', 'what can you do')],
+    'summary': [('summary', 'overview', 'all results', 'my results', 'all my results')]
+}
+
+# Intent used for a topic mentioned without any intent cue
+DEFAULT_TOPIC_INTENT = 'what'
+
+Route = namedtuple('Route', ['topic', 'intent'])
+FALLBACK_ROUTE = Route(None, 'fallback')
+
+
+def question_terms(question):
+    """
+    Words of a question plus every phrase of up to MAX_PHRASE_WORDS words
+    """
+    words = TOKEN_PATTERN.findall(question.lower())
+    terms = set()
+    for size in range(1, MAX_PHRASE_WORDS + 1):
+        for start in range(len(words) - size + 1):
+            terms.add(' '.join(words[start:start + size]))
+    return terms
+
+
+class ChatRouter:
+    """
+    Inverted index from cue words and phrases to topics and intents
+
+    Built once from the knowledge base; routing a question looks up each of
+    its terms, so the cost grows with the question, not with the number of
+    topics. Precedence: a topic with an intent cue, then a general intent,
+    then a bare topic (answered with its DEFAULT_TOPIC_INTENT answer).
+    """
+
+    def __init__(self, knowledge_base):
+        self.topic_order = {topic: i for i, topic in enumerate(knowledge_base.topics)}
+        self.topic_intents = {topic: set(intents) for topic, intents in knowledge_base.intents.items()}
+        self.intent_order = {intent: i for i, intent in enumerate(TOPIC_INTENT_CUES)}
+        self.general_order = {intent: i for i, intent in enumerate(GENERAL_INTENT_CUES)}
+        self.index = {}
+
+        for topic in knowledge_base.topics:
+            for term in (topic,) + TOPIC_ALIASES.get(topic, ()):
+                self._add(term, ('topic', topic))
+        for intent, cues in TOPIC_INTENT_CUES.items():
+            for term in cues:
+                self._add(term, ('cue', intent))
+        for intent, groups in GENERAL_INTENT_CUES.items():
+            for group_index, cues in enumerate(groups):
+                for term in cues:
+                    self._add(term, ('general', intent, group_index))
+
+    def _add(self, term, target):
+        self.index.setdefault(term, []).append(target)
+
+    def route(self, question):
+        """
+        Return the Route (topic, intent) for a question
+
+        topic is None for general intents and for the fallback route.
+        """
+        topics = {}
+        cues = set()
+        general = {}
+        for term in question_terms(question):
+            for target in self.index.get(term, ()):
+                kind = target[0]
+                if kind == 'topic':
+                    topics[target[1]] = topics.get(target[1], 0) + 1
+                elif kind == 'cue':
+                    cues.add(target[1])
+                else:
+                    general.setdefault(target[1], set()).add(target[2])
+
+        best_topic = None
+        if topics:
+            best_topic = min(topics, key=lambda topic: (-topics[topic], self.topic_order[topic]))
+            candidates = [intent for intent in cues if intent in self.topic_intents[best_topic]]
+            if candidates:
+                return Route(best_topic, min(candidates, key=self.intent_order.get))
+
+        matched = [intent for intent, groups in general.items()
+                   if len(groups) == len(GENERAL_INTENT_CUES[intent])]
+        if matched:
+            return Route(None, min(matched, key=self.general_order.get))
+
+        if best_topic and DEFAULT_TOPIC_INTENT in self.topic_intents[best_topic]:
+            return Route(best_topic, DEFAULT_TOPIC_INTENT)
+        return FALLBACK_ROUTE
+
+
+_chat_router = None
+_chat_router_lock = threading.Lock()
+
+
+def get_chat_router():
+    """
+    The process-wide router, built on first use from the knowledge base
+    """
+    global _chat_router
+    if _chat_router is None:
+        with _chat_router_lock:
+            if _chat_router is None:
+                _chat_router = ChatRouter(get_knowledge_base())
+    return _chat_router
@@ -0,0 +1,288 @@
+"""
+Analysis Jobs
+Local process-pool job queue so slow reports do not hold a web worker
+"""
+
+import multiprocessing
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Seconds a finished job waits for its worker's last progress events
+PROGRESS_FLUSH_TIMEOUT = 1.0
+
+# Set in each pool process by _init_worker: the queue progress events go back on
+_progress_queue = None
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _run_job(job_id, fn, args):
+    """
+    Pool entry point: call fn(*args, progress=...) and relay its progress events
+    """
+    def progress(event, data=None):
+        _progress_queue.put((job_id, event, data or {}))
+
+    progress('started')
+    try:
+        return fn(*args, progress=progress)
+    finally:
+        progress('returned')
+
+
+class Job:
+    """
+    One queued call: its status ('queued', 'running', 'done' or 'error'),
+    then its result or error message
+
+    The heavy call runs in a pool process; `finish` (if given) then runs in
+    this process on the call's return value, and its return value is the
+    job result. Both report progress as (event, data) pairs, kept in
+    `events`; subscribers block on `next_events` until something changes.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.created = time.time()
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self._started = False
+        self._returned = threading.Event()
+        self._done = False
+        self._changed = threading.Condition()
+
+    @property
+    def status(self):
+        if self._done:
+            return 'error' if self.error is not None else 'done'
+        return 'running' if self._started else 'queued'
+
+    @property
+    def done(self):
+        return self._done
+
+    def publish(self, event, data=None):
+        """
+        Record a progress event and wake the subscribers
+        """
+        with self._changed:
+            if event == 'started':
+                self._started = True
+            elif event == 'returned':
+                self._returned.set()
+            else:
+                self.events.append((event, data or {}))
+            self._changed.notify_all()
+
+    def next_events(self, index, timeout=None):
+        """
+        Progress events after the first `index`, and whether the job is done
+
+        Blocks up to `timeout` seconds while there is nothing new.
+        """
+        with self._changed:
+            if len(self.events) <= index and not self._done:
+                self._changed.wait(timeout)
+            return self.events[index:], self._done
+
+    def wait(self, timeout=None):
+        """
+        Block until the job finishes or `timeout` seconds pass; True if finished
+        """
+        with self._changed:
+            if not self._done:
+                self._changed.wait_for(lambda: self._done, timeout)
+            return self._done
+
+    def _finish(self, result=None, error=None):
+        with self._changed:
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+            self._done = True
+            self._changed.notify_all()
+
+    def to_dict(self):
+        """
+        Job status as a JSON-ready dict, with the result or error once finished
+        """
+        data = {'job_id': self.job_id, 'status': self.status}
+        if self.events:
+            event, event_data = self.events[-1]
+            data['progress'] = dict(event_data, stage=event)
+        if self.status == 'done':
+            data['result'] = self.result
+        elif self.status == 'error':
+            data['error'] = self.error
+        return data
+
+
+class JobQueue:
+    """
+    Runs jobs on a lazily started pool of `workers` processes
+
+    No broker: jobs live in this process, so clients must poll or subscribe
+    on the same server process that accepted them. Pool processes send
+    progress events back on one multiprocessing queue, which a relay
+    thread hands to the jobs. Each job's `finish` step runs on a pool of
+    `finishers` threads (default: one per worker), not on the executor's
+    result-handling thread, so a slow finish does not hold up other jobs.
+    If a pool process dies (e.g. killed for memory) the jobs it broke fail
+    and the next job starts a new pool. Finished jobs are kept for `ttl` seconds, and at most `max_jobs` jobs
+    are remembered.
+    """
+
+    def __init__(self, workers=2, ttl=3600, max_jobs=1024, finishers=None):
+        self.workers = workers
+        self.finishers = finishers or workers
+        self.ttl = ttl
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self._pool = None
+        self._finish_pool = None
+        self._progress_queue = None
+
+    def _get_pool(self):
+        if self._pool is None:
+            context = multiprocessing.get_context()
+            self._progress_queue = context.Queue()
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=context,
+                initializer=_init_worker, initargs=(self._progress_queue,)
+            )
+            threading.Thread(target=self._relay_progress, args=(self._progress_queue,), daemon=True).start()
+        if self._finish_pool is None:
+            self._finish_pool = ThreadPoolExecutor(max_workers=self.finishers, thread_name_prefix='job-finisher')
+        return self._pool
+
+    def _discard_pool(self, pool):
+        """
+        Drop `pool` after one of its processes died, if it is still the current one (lock held)
+        """
+        if self._pool is pool:
+            pool.shutdown(wait=False, cancel_futures=True)
+            # A killed process may have left the progress queue half-written; the next pool gets a new one
+            self._progress_queue.put(None)
+            self._pool = None
+
+    def _relay_progress(self, progress_queue):
+        while True:
+            item = progress_queue.get()
+            if item is None:
+                break
+            job = self.get(item[0])
+            if job is not None:
+                job.publish(item[1], item[2])
+
+    def submit(self, fn, *args, finish=None):
+        """
+        Queue fn(*args, progress=...) on the pool and return its Job right away
+
+        `fn` and its arguments must be picklable (a module-level function).
+        `finish(result, progress)` runs in this process once fn returns.
+        """
+        job = Job(secrets.token_urlsafe(12))
+        with self._lock:
+            self._expire(time.time())
+            self._jobs[job.job_id] = job
+            pool = self._get_pool()
+            try:
+                future = pool.submit(_run_job, job.job_id, fn, args)
+            except BrokenProcessPool:
+                # A process died since the last job and the pool refuses work; start a new one
+                self._discard_pool(pool)
+                pool = self._get_pool()
+                future = pool.submit(_run_job, job.job_id, fn, args)
+            finish_pool = self._finish_pool
+        # Done callbacks run on the executor's single result thread; only hand the job over there
+        future.add_done_callback(lambda future: finish_pool.submit(self._complete, job, future, finish, pool))
+        return job
+
+    def run_here(self, fn, *args):
+        """
+        Run fn(*args, progress=...) in this process and return it as a finished Job
+
+        For work that needs no pool process (e.g. an OCR cache hit).
+        """
+        job = Job(secrets.token_urlsafe(12))
+        self._run(job, fn, args)
+        with self._lock:
+            self._expire(time.time())
+            self._jobs[job.job_id] = job
+        return job
+
+    def run_thread(self, fn, *args):
+        """
+        Run fn(*args, progress=...) on a new thread of this process and return its Job right away
+
+        For work done inside the request (no pool process) whose progress
+        the caller streams while it runs.
+        """
+        job = Job(secrets.token_urlsafe(12))
+        with self._lock:
+            self._expire(time.time())
+            self._jobs[job.job_id] = job
+        threading.Thread(target=self._run, args=(job, fn, args), daemon=True).start()
+        return job
+
+    def _run(self, job, fn, args):
+        job.publish('started')
+        try:
+            job._finish(fn(*args, progress=job.publish))
+        except Exception as e:
+            job._finish(error=str(e) or type(e).__name__)
+
+    def get(self, job_id):
+        """
+        Return the Job for `job_id`, or None if unknown or expired
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _complete(self, job, future, finish, pool):
+        try:
+            result = future.result()
+            # Progress travels on another channel; let the worker's last events arrive first
+            job._returned.wait(PROGRESS_FLUSH_TIMEOUT)
+            if finish is not None:
+                result = finish(result, job.publish)
+            job._finish(result)
+        except BrokenProcessPool:
+            # Every job in flight on the pool ends up here; the next submit starts a new pool
+            with self._lock:
+                self._discard_pool(pool)
+            job._finish(error='The analysis process stopped unexpectedly. Please try again.')
+        except Exception as e:
+            job._finish(error=str(e) or type(e).__name__)
+
+    def _expire(self, now):
+        for job_id, job in list(self._jobs.items()):
+            if job.done and now - job.finished > self.ttl:
+                del self._jobs[job_id]
+        while len(self._jobs) >= self.max_jobs:
+            finished = next((job_id for job_id, job in self._jobs.items() if job.done), None)
+            if finished is None:
+                break
+            del self._jobs[finished]
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._progress_queue.put(None)
+            self._pool = None
+        if self._finish_pool is not None:
+            self._finish_pool.shutdown(wait=False)
+            self._finish_pool = None
+
+    def __len__(self):
+        return len(self._jobs)
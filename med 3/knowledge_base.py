@@ -0,0 +1,59 @@
+"""
+Chatbot Knowledge Base
+Topic answers for the health assistant, loaded once from knowledge_base.json
+"""
+
+import json
+import os
+import threading
+
+KNOWLEDGE_BASE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'knowledge_base.json')
+
+
+class KnowledgeBase:
+    """
+    Answers indexed by (topic, intent)
+
+    knowledge_base.json maps a topic ('hemoglobin', 'urine', ...) to its
+    intents ('what', 'low', 'high', 'improve', ...) and the answer text.
+    Topic order is kept because the chat routing checks topics in file order.
+    """
+
+    def __init__(self, topics):
+        self.topics = tuple(topics)
+        self.intents = {topic: tuple(intents) for topic, intents in topics.items()}
+        self.answers = {
+            (topic, intent): answer
+            for topic, intents in topics.items()
+            for intent, answer in intents.items()
+        }
+
+    def get(self, topic, intent):
+        """
+        Answer text for a topic and intent, or None if there is none
+        """
+        return self.answers.get((topic, intent))
+
+
+_knowledge_base = None
+_knowledge_base_lock = threading.Lock()
+
+
+def load_knowledge_base(path=KNOWLEDGE_BASE_PATH):
+    """
+    Read a knowledge base JSON file
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        return KnowledgeBase(json.load(f))
+
+
+def get_knowledge_base():
+    """
+    The process-wide knowledge base, loaded on first use
+    """
+    global _knowledge_base
+    if _knowledge_base is None:
+        with _knowledge_base_lock:
+            if _knowledge_base is None:
+                _knowledge_base = load_knowledge_base()
+    return _knowledge_base
@@ -0,0 +1,196 @@
+"""
+OCR Result Cache
+Content-hash cache so re-uploaded reports skip preprocessing and Tesseract
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+class OCRCache:
+    """
+    Two-tier cache of OCR text keyed by a hash of the uploaded bytes
+
+    The in-process tier is an LRU dict holding up to `max_entries` texts.
+    When `disk_dir` is set, entries are also written there as text files
+    and the oldest files are evicted once the directory grows beyond
+    `disk_max_bytes`. The directory size is tracked as files are written,
+    so it is only scanned when eviction is due. Disk errors (a full disk,
+    permissions) only cost the disk copy; the entry stays in memory.
+    """
+
+    def __init__(self, max_entries=128, disk_dir=None, disk_max_bytes=256 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self._disk_bytes = None  # Estimated disk tier size, from a scan plus our own writes
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(data, *parts):
+        """
+        Hash the upload bytes together with anything that changes the OCR output
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.txt')
+
+    def get(self, key):
+        """
+        Return cached text for `key`, or None on a miss
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                self.memory_hits += 1
+                return self._memory[key]
+
+        text = None
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    text = f.read()
+                os.utime(path)  # Refresh mtime so eviction stays least-recently-used
+            except OSError:
+                text = None
+
+        with self._lock:
+            if text is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.disk_hits += 1
+            self._store_in_memory(key, text)
+            return text
+
+    def put(self, key, text):
+        """
+        Store OCR text in memory and, if enabled, on disk
+        """
+        with self._lock:
+            self._store_in_memory(key, text)
+        if self.disk_dir:
+            try:
+                self._store_on_disk(key, text)
+            except OSError as e:
+                print(f"OCR cache: could not write to {self.disk_dir}: {e}")
+
+    def _store_on_disk(self, key, text):
+        path = self._disk_path(key)
+        temp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                f.write(text)
+            size = os.path.getsize(temp_path)
+        except OSError:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+        with self._lock:
+            # Rewriting a key (two misses on one re-upload) replaces the file, so its old size goes
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(temp_path, path)
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+            else:
+                self._disk_bytes += size - replaced
+            evict = self._disk_bytes > self.disk_max_bytes
+        if evict:
+            self._evict_disk()
+
+    def _store_in_memory(self, key, text):
+        self._memory[key] = text
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_entries(self):
+        entries = []
+        for entry in os.scandir(self.disk_dir):
+            if entry.name.endswith('.txt'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue  # Evicted by another process meanwhile
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _evict_disk(self):
+        """
+        Delete the least recently used files until the disk tier is 90% of its budget
+
+        Freeing a margin below the budget means a full cache is not rescanned on every write.
+        """
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_max_bytes * 0.9
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+    def clear(self):
+        """
+        Drop every cached entry and reset the counters
+        """
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.misses = self.memory_hits = self.disk_hits = 0
+        if self.disk_dir:
+            for _, _, path in self._disk_entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            with self._lock:
+                self._disk_bytes = 0
+
+    def stats(self):
+        """
+        Hit/miss counters and current tier sizes
+        """
+        with self._lock:
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'memory_entries': len(self._memory),
+                'max_entries': self.max_entries
+            }
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        if self.disk_dir:
+            entries = self._disk_entries()
+            stats['disk_entries'] = len(entries)
+            stats['disk_bytes'] = sum(size for _, size, _ in entries)
+            stats['disk_max_bytes'] = self.disk_max_bytes
+        return stats
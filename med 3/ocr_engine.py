@@ -0,0 +1,493 @@
+"""
+OCR Engine
+Image preprocessing and text extraction for uploaded medical reports
+"""
+
+import atexit
+import os
+import time
+import queue
+import tempfile
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import cv2
+import numpy as np
+import pytesseract
+import pdf2image
+from PIL import Image
+
+try:
+    import tesserocr  # Optional: warm Tesseract instances through the C API
+except ImportError:
+    tesserocr = None
+
+# Configure Tesseract path
+pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+
+# Default number of processes used to OCR the pages of a PDF concurrently
+DEFAULT_OCR_WORKERS = os.cpu_count() or 1
+# PDF rasterization resolution and number of pages rendered per pdftoppm call
+DEFAULT_PDF_DPI = 200
+DEFAULT_PDF_PAGE_BATCH = 1
+
+# Page segmentation strategies picked by the layout analysis (name -> Tesseract --psm)
+OCR_STRATEGIES = {
+    'table': 6,    # Ruled lab tables: read row by row as one uniform block
+    'block': 6,    # Dense free-flowing report text
+    'sparse': 4    # Few, scattered lines: single column of variable-size text
+}
+# 'adaptive' picks one of OCR_STRATEGIES per page; 'legacy' runs --psm 6 then --psm 4
+DEFAULT_OCR_STRATEGY = 'adaptive'
+
+# Preprocessing profiles:
+#   'quality' - full resolution, Otsu threshold, non-local means denoising (original pipeline)
+#   'fast'    - downscale to FAST_PROFILE_DPI, Otsu threshold, median filter on the binary image
+PREPROCESS_PROFILES = ('quality', 'fast')
+DEFAULT_PREPROCESS_PROFILE = 'quality'
+FAST_PROFILE_DPI = 200
+# Long edge of an A4 page, used to turn a target DPI into a pixel size for photos
+PAGE_LONG_EDGE_INCHES = 11.69
+
+# OCR backends:
+#   'pytesseract' - spawns a tesseract process per call (reloads the language model each time)
+#   'tesserocr'   - keeps initialised Tesseract instances alive in this process and reuses them
+OCR_BACKENDS = ('pytesseract', 'tesserocr')
+DEFAULT_OCR_BACKEND = 'pytesseract'
+TESSERACT_LANG = 'eng'
+# tessdata folder for tesserocr (None = library default)
+TESSDATA_PATH = None
+
+_page_pool = None
+_page_pool_workers = 0
+_page_pool_lock = threading.Lock()
+
+# Idle, already initialised tesserocr.PyTessBaseAPI instances of this process
+_tess_apis = queue.LifoQueue()
+
+
+def preprocess_array(img, profile=DEFAULT_PREPROCESS_PROFILE):
+    """
+    Enhance an in-memory BGR image for better OCR
+    """
+    if profile == 'fast':
+        return preprocess_array_fast(img)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    # Apply thresholding
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    # Denoise
+    return cv2.fastNlMeansDenoising(thresh, None, 10, 7, 21)
+
+
+def preprocess_array_fast(img, target_dpi=FAST_PROFILE_DPI):
+    """
+    Cheaper preprocessing for large phone photos
+
+    Downscales so the long edge matches an A4 page at `target_dpi`, then
+    thresholds and removes speckle with a 3x3 median filter on the binary
+    image instead of the (much slower) non-local means denoiser.
+    """
+    h, w = img.shape[:2]
+    max_side = int(PAGE_LONG_EDGE_INCHES * target_dpi)
+    if max(h, w) > max_side:
+        scale = max_side / max(h, w)
+        img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    _, thresh = cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    return cv2.medianBlur(thresh, 3)
+
+
+def ocr_array(processed, backend=DEFAULT_OCR_BACKEND):
+    """
+    Run Tesseract on a preprocessed (grayscale) image array
+    """
+    img = Image.fromarray(processed)
+    # Try multiple OCR configurations for better results
+    text = image_to_string(img, 6, backend)
+    if len(text.strip()) < 50:  # If not much text, try different config
+        text = image_to_string(img, 4, backend)
+    return text
+
+
+# ---------------------------------------------------------------------------
+# Tesseract backends
+# ---------------------------------------------------------------------------
+
+def _acquire_tess_api():
+    """
+    Take a warm Tesseract instance, initialising a new one only when all are busy
+    """
+    try:
+        return _tess_apis.get_nowait()
+    except queue.Empty:
+        if TESSDATA_PATH:
+            return tesserocr.PyTessBaseAPI(path=TESSDATA_PATH, lang=TESSERACT_LANG)
+        return tesserocr.PyTessBaseAPI(lang=TESSERACT_LANG)
+
+
+def image_to_string(img, psm, backend=DEFAULT_OCR_BACKEND):
+    """
+    Run a single Tesseract pass on a PIL image with the selected backend
+    """
+    if backend == 'tesserocr':
+        if tesserocr is None:
+            raise RuntimeError("OCR backend 'tesserocr' selected but the tesserocr package is not installed")
+        api = _acquire_tess_api()
+        try:
+            api.SetPageSegMode(psm)
+            api.SetImage(img)
+            return api.GetUTF8Text()
+        finally:
+            api.Clear()
+            _tess_apis.put(api)
+    return pytesseract.image_to_string(img, config=f'--psm {psm}')
+
+
+def close_tess_apis():
+    """
+    Release every idle tesserocr instance of this process (also run at interpreter exit)
+    """
+    while True:
+        try:
+            _tess_apis.get_nowait().End()
+        except queue.Empty:
+            break
+
+
+atexit.register(close_tess_apis)
+
+
+def decode_image_bytes(data):
+    """
+    Decode uploaded image bytes into a BGR array without touching disk
+    """
+    buffer = np.frombuffer(data, dtype=np.uint8)
+    img = cv2.imdecode(buffer, cv2.IMREAD_COLOR)
+    if img is None:
+        raise ValueError('Could not decode image data')
+    return img
+
+
+def pil_to_array(page):
+    """
+    Convert a PIL page image (e.g. from pdf2image) into a BGR array
+    """
+    return cv2.cvtColor(np.asarray(page.convert('RGB')), cv2.COLOR_RGB2BGR)
+
+
+# ---------------------------------------------------------------------------
+# OCR strategy selection
+# ---------------------------------------------------------------------------
+
+def analyze_layout(processed, max_side=1000):
+    """
+    Cheap layout statistics of a binarized page
+
+    Works on a downscaled copy: ink coverage, share of pixel rows that
+    contain text, and the number of long horizontal/vertical rules.
+    """
+    h, w = processed.shape[:2]
+    scale = min(1.0, max_side / max(h, w))
+    if scale < 1.0:
+        processed = cv2.resize(processed, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+        h, w = processed.shape[:2]
+
+    # Text is dark on a light background after Otsu thresholding
+    ink = (processed < 128).astype(np.uint8) * 255
+    row_ink = ink.mean(axis=1) / 255
+
+    # Long thin structures survive an opening with a line-shaped kernel
+    horizontal = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (max(w // 4, 1), 1)))
+    vertical = cv2.morphologyEx(ink, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (1, max(h // 4, 1))))
+    horizontal_lines, _ = cv2.connectedComponents(horizontal)
+    vertical_lines, _ = cv2.connectedComponents(vertical)
+
+    return {
+        'ink_ratio': round(float(ink.mean() / 255), 4),
+        'text_row_ratio': round(float((row_ink > 0.01).mean()), 4),
+        'horizontal_lines': int(horizontal_lines - 1),  # Minus the background label
+        'vertical_lines': int(vertical_lines - 1)
+    }
+
+
+def choose_strategy(layout):
+    """
+    Map layout statistics to one of OCR_STRATEGIES
+    """
+    if layout['horizontal_lines'] >= 3 or layout['vertical_lines'] >= 2:
+        return 'table'
+    if layout['text_row_ratio'] < 0.25 or layout['ink_ratio'] < 0.01:
+        return 'sparse'
+    return 'block'
+
+
+def run_ocr(processed, strategy=DEFAULT_OCR_STRATEGY, backend=DEFAULT_OCR_BACKEND):
+    """
+    OCR a preprocessed array and report which strategy ran and how long it took
+
+    The layout is only analyzed for 'adaptive'; a fixed strategy name from
+    OCR_STRATEGIES is used as is (and 'layout' is None).
+    """
+    start = time.perf_counter()
+    if strategy == 'legacy':
+        text = ocr_array(processed, backend)
+        return {
+            'text': text,
+            'strategy': 'legacy',
+            'psm': None,
+            'backend': backend,
+            'layout_ms': 0.0,
+            'ocr_ms': round((time.perf_counter() - start) * 1000, 1)
+        }
+
+    if strategy in OCR_STRATEGIES:
+        layout = None
+        name = strategy
+    else:
+        layout = analyze_layout(processed)
+        name = choose_strategy(layout)
+    psm = OCR_STRATEGIES[name]
+    layout_done = time.perf_counter()
+    text = image_to_string(Image.fromarray(processed), psm, backend)
+    return {
+        'text': text,
+        'strategy': name,
+        'psm': psm,
+        'backend': backend,
+        'layout': layout,
+        'layout_ms': round((layout_done - start) * 1000, 1),
+        'ocr_ms': round((time.perf_counter() - layout_done) * 1000, 1)
+    }
+
+
+# ---------------------------------------------------------------------------
+# File based pipeline (original behaviour)
+# ---------------------------------------------------------------------------
+
+def preprocess_image(image_path, profile=DEFAULT_PREPROCESS_PROFILE):
+    """Enhance image quality for better OCR"""
+    img = cv2.imread(image_path)
+    denoised = preprocess_array(img, profile)
+    temp_path = image_path.replace('.', '_processed.')
+    cv2.imwrite(temp_path, denoised)
+    return temp_path
+
+
+def ocr_image_file(image_path, strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                   backend=DEFAULT_OCR_BACKEND, progress=None):
+    """
+    OCR an image file and return the text with strategy/timing details
+    """
+    processed_path = preprocess_image(image_path, profile)
+    result = run_ocr(cv2.imread(processed_path, cv2.IMREAD_GRAYSCALE), strategy, backend)
+    # Clean up processed image
+    if os.path.exists(processed_path):
+        os.remove(processed_path)
+    if progress:
+        progress('ocr', {'page': 1, 'pages': 1})
+    return {'text': result['text'], 'pages': [strip_page_text(result)]}
+
+
+def ocr_pdf_file(pdf_path, workers=None, dpi=DEFAULT_PDF_DPI, batch_size=DEFAULT_PDF_PAGE_BATCH,
+                 strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                 backend=DEFAULT_OCR_BACKEND, progress=None):
+    """
+    OCR a PDF file page by page and return the text with per-page details
+
+    `progress(event, data)`, if given, is called with 'rasterized' and
+    'ocr' events as each page is rendered and read.
+    """
+    return ocr_pages(iter_pdf_pages(pdf_path, dpi, batch_size, progress), workers, strategy, profile, backend,
+                     progress)
+
+
+def extract_text_from_image(image_path, strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                            backend=DEFAULT_OCR_BACKEND):
+    """Extract text using OCR with preprocessing"""
+    return ocr_image_file(image_path, strategy, profile, backend)['text']
+
+
+def extract_text_from_pdf(pdf_path, workers=None, dpi=DEFAULT_PDF_DPI, batch_size=DEFAULT_PDF_PAGE_BATCH,
+                          strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                          backend=DEFAULT_OCR_BACKEND, progress=None):
+    """Convert PDF to images and extract text"""
+    return ocr_pdf_file(pdf_path, workers, dpi, batch_size, strategy, profile, backend, progress)['text']
+
+
+# ---------------------------------------------------------------------------
+# In-memory pipeline (no files written by us)
+# ---------------------------------------------------------------------------
+
+def ocr_image_bytes(data, strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                    backend=DEFAULT_OCR_BACKEND, progress=None):
+    """
+    OCR uploaded image bytes in memory and return the text with strategy/timing details
+    """
+    result = ocr_page(decode_image_bytes(data), strategy, profile, backend)
+    if progress:
+        progress('ocr', {'page': 1, 'pages': 1})
+    return {'text': result['text'], 'pages': [strip_page_text(result)]}
+
+
+def ocr_pdf_bytes(data, workers=None, dpi=DEFAULT_PDF_DPI, batch_size=DEFAULT_PDF_PAGE_BATCH,
+                  strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                  backend=DEFAULT_OCR_BACKEND, progress=None):
+    """
+    OCR uploaded PDF bytes page by page and return the text with per-page details
+    """
+    return ocr_pages(iter_pdf_pages_from_bytes(data, dpi, batch_size, progress), workers, strategy, profile, backend,
+                     progress)
+
+
+def extract_text_from_image_bytes(data, strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                                  backend=DEFAULT_OCR_BACKEND):
+    """
+    Extract text from uploaded image bytes, decoding and preprocessing in memory
+    """
+    return ocr_image_bytes(data, strategy, profile, backend)['text']
+
+
+def extract_text_from_pdf_bytes(data, workers=None, dpi=DEFAULT_PDF_DPI, batch_size=DEFAULT_PDF_PAGE_BATCH,
+                                strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+                                backend=DEFAULT_OCR_BACKEND, progress=None):
+    """
+    Extract text from uploaded PDF bytes, handling every page as an array
+    """
+    return ocr_pdf_bytes(data, workers, dpi, batch_size, strategy, profile, backend, progress)['text']
+
+
+# ---------------------------------------------------------------------------
+# Streaming PDF rasterization
+# ---------------------------------------------------------------------------
+
+def iter_pdf_pages(pdf_path, dpi=DEFAULT_PDF_DPI, batch_size=DEFAULT_PDF_PAGE_BATCH, progress=None):
+    """
+    Yield PDF pages as BGR arrays, rendering one small page range at a time
+
+    Only `batch_size` pages are rasterized at once and each PIL page is
+    released as soon as it has been converted, so peak memory depends on
+    the page size rather than the length of the document.
+    """
+    page_count = pdf2image.pdfinfo_from_path(pdf_path)['Pages']
+    for first_page in range(1, page_count + 1, batch_size):
+        last_page = min(first_page + batch_size - 1, page_count)
+        images = pdf2image.convert_from_path(
+            pdf_path, dpi=dpi, first_page=first_page, last_page=last_page
+        )
+        page = first_page
+        while images:
+            array = pil_to_array(images.pop(0))
+            if progress:
+                progress('rasterized', {'page': page, 'pages': page_count})
+            page += 1
+            yield array
+
+
+def iter_pdf_pages_from_bytes(data, dpi=DEFAULT_PDF_DPI, batch_size=DEFAULT_PDF_PAGE_BATCH, progress=None):
+    """
+    Stream the pages of an in-memory PDF
+
+    poppler needs a real file, so the bytes are written once to a private
+    temp file (as pdf2image.convert_from_bytes does) instead of once per
+    page range.
+    """
+    fd, temp_path = tempfile.mkstemp(suffix='.pdf')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        yield from iter_pdf_pages(temp_path, dpi, batch_size, progress)
+    finally:
+        os.remove(temp_path)
+
+
+# ---------------------------------------------------------------------------
+# Parallel page OCR
+# ---------------------------------------------------------------------------
+
+def ocr_page(img, strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+             backend=DEFAULT_OCR_BACKEND):
+    """
+    Preprocess and OCR a single page array (runs inside pool workers)
+    """
+    start = time.perf_counter()
+    processed = preprocess_array(img, profile)
+    preprocess_ms = round((time.perf_counter() - start) * 1000, 1)
+    result = run_ocr(processed, strategy, backend)
+    result['profile'] = profile
+    result['preprocess_ms'] = preprocess_ms
+    return result
+
+
+def strip_page_text(result):
+    """
+    Per-page OCR details without the (already joined) text
+    """
+    return {key: value for key, value in result.items() if key != 'text'}
+
+
+def get_page_pool(workers):
+    """
+    Return the shared process pool, recreating it if the worker count changed
+    """
+    global _page_pool, _page_pool_workers
+    with _page_pool_lock:
+        if _page_pool is None or _page_pool_workers != workers:
+            if _page_pool is not None:
+                _page_pool.shutdown(wait=False)
+            _page_pool = ProcessPoolExecutor(max_workers=workers)
+            _page_pool_workers = workers
+        return _page_pool
+
+
+def discard_page_pool(pool):
+    """
+    Stop sharing a pool that broke (a worker died), so the next call starts a new one
+    """
+    global _page_pool
+    with _page_pool_lock:
+        if _page_pool is pool:
+            _page_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def ocr_pages(pages, workers=None, strategy=DEFAULT_OCR_STRATEGY, profile=DEFAULT_PREPROCESS_PROFILE,
+              backend=DEFAULT_OCR_BACKEND, progress=None):
+    """
+    OCR page arrays concurrently and join the text back in page order
+
+    `pages` may be a lazy iterator; at most `workers` pages are in flight
+    at a time so streamed pages are not all buffered in memory.
+    `progress('ocr', {'page': n})`, if given, is called as each page's
+    text comes back, in page order. If a pool worker dies (e.g. killed
+    for memory on a huge scan) this call raises BrokenProcessPool and the
+    pool is replaced for later calls.
+    """
+    workers = workers or DEFAULT_OCR_WORKERS
+    results = []
+
+    def collect(result):
+        results.append(result)
+        if progress:
+            progress('ocr', {'page': len(results)})
+
+    if workers <= 1:
+        for page in pages:
+            collect(ocr_page(page, strategy, profile, backend))
+    else:
+        pool = get_page_pool(workers)
+        pending = deque()
+        try:
+            for page in pages:
+                pending.append(pool.submit(ocr_page, page, strategy, profile, backend))
+                if len(pending) >= workers:
+                    collect(pending.popleft().result())
+            while pending:
+                collect(pending.popleft().result())
+        except BrokenProcessPool:
+            discard_page_pool(pool)
+            raise
+    return {
+        'text': "".join(result['text'] for result in results),
+        'pages': [strip_page_text(result) for result in results]
+    }
@@ -0,0 +1,202 @@
+"""
+Reference Ranges
+Normal ranges from reference_data.csv indexed by test name
+"""
+
+import hashlib
+import io
+import os
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# One row of reference_data.csv; a namedtuple keeps the record slotted and compact
+ReferenceRange = namedtuple('ReferenceRange', ['test', 'min', 'max', 'unit', 'description'])
+
+# Status codes returned by ReferenceTable.classify, indexing STATUS_LABELS / STATUS_COLOR_VALUES
+STATUS_NORMAL, STATUS_LOW, STATUS_HIGH = 0, 1, 2
+STATUS_LABELS = np.array(['Normal', 'Low', 'High'])
+
+# Status -> chart/table color
+STATUS_COLORS = {
+    'Low': '#3498db',
+    'High': '#e74c3c',
+    'Normal': '#2ecc71'
+}
+STATUS_COLOR_VALUES = np.array([STATUS_COLORS[label] for label in STATUS_LABELS])
+
+# Test id used for names that are not in the reference table
+UNKNOWN_TEST = -1
+
+
+class ReferenceTable:
+    """
+    Reference ranges held both as records and as NumPy columns
+
+    `ranges` maps a test name to its ReferenceRange for per-test lookups.
+    Every test also gets an integer id (its row in `min_values` /
+    `max_values`) so whole batches of results can be classified with one
+    gather and two comparisons instead of a Python loop. A table is never
+    modified after it is built; reloads build a new one.
+    """
+
+    def __init__(self, ranges, version=None):
+        self.ranges = ranges
+        self.version = version
+        self.tests = list(ranges)
+        self.test_ids = {test: i for i, test in enumerate(self.tests)}
+        self.min_values = np.array([ranges[test].min for test in self.tests], dtype=np.float64)
+        self.max_values = np.array([ranges[test].max for test in self.tests], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.tests)
+
+    def get(self, test_name):
+        """
+        ReferenceRange for a test, or None if the test is unknown
+        """
+        return self.ranges.get(test_name)
+
+    def ids_for(self, test_names):
+        """
+        Map test names to ids as an int array (UNKNOWN_TEST for unknown names)
+        """
+        get_id = self.test_ids.get
+        return np.fromiter(
+            (get_id(name, UNKNOWN_TEST) for name in test_names), dtype=np.intp, count=len(test_names)
+        )
+
+    def classify(self, test_ids, values):
+        """
+        Classify arrays of test ids and values against their ranges
+
+        Returns an int8 array of status codes; index STATUS_LABELS and
+        STATUS_COLOR_VALUES with it to get names and colors. Every id must
+        be known, so filter out UNKNOWN_TEST first.
+        """
+        test_ids = np.asarray(test_ids, dtype=np.intp)
+        values = np.asarray(values, dtype=np.float64)
+        status = np.full(values.shape, STATUS_NORMAL, dtype=np.int8)
+        # High first so Low wins on a malformed row with max < min, like the old if-chain
+        status[values > self.max_values[test_ids]] = STATUS_HIGH
+        status[values < self.min_values[test_ids]] = STATUS_LOW
+        return status
+
+
+def load_reference_table(csv_path='reference_data.csv'):
+    """
+    Read the reference CSV into a ReferenceTable
+
+    The table version is a short hash of the file contents, so every
+    worker that loads the same CSV reports the same version.
+    """
+    with open(csv_path, 'rb') as f:
+        data = f.read()
+    version = hashlib.sha256(data).hexdigest()[:12]
+    return ReferenceTable(build_reference_index(pd.read_csv(io.BytesIO(data))), version)
+
+
+def build_reference_index(reference_df):
+    """
+    Build {test name: ReferenceRange} from the reference DataFrame
+
+    Like the old per-test DataFrame filter, the first row wins when a
+    test name appears more than once.
+    """
+    index = {}
+    for row in reference_df.itertuples(index=False):
+        if row.Test_Name not in index:
+            index[row.Test_Name] = ReferenceRange(
+                row.Test_Name, float(row.Min_Value), float(row.Max_Value), row.Unit, row.Description
+            )
+    return index
+
+
+
+class ReferenceRegistry:
+    """
+    Current ReferenceTable for a CSV, reloaded when the file changes
+
+    A daemon thread polls the CSV's mtime every `interval` seconds and
+    rebuilds the table off the request path. The new table replaces the
+    old one with a single attribute assignment, so readers always see a
+    complete table: take `registry.current` once per request and use that
+    snapshot throughout. A change is loaded only once the file's mtime and
+    size are the same on two polls in a row, so a CSV still being written
+    is not put live half-finished. If the edited file cannot be parsed the
+    previous table stays in service.
+    """
+
+    def __init__(self, csv_path='reference_data.csv', interval=5.0):
+        self.csv_path = csv_path
+        self.interval = interval
+        self.last_error = None
+        self._signature = self._stat()
+        self._pending = None  # Signature of a change seen on the last poll, not loaded yet
+        self.current = load_reference_table(csv_path)
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def version(self):
+        return self.current.version
+
+    def _stat(self):
+        stat = os.stat(self.csv_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload_if_changed(self):
+        """
+        Rebuild the table if the CSV was modified; return True when swapped
+
+        A modification is picked up on the poll after it is first seen, if
+        the file has not changed again in between.
+        """
+        try:
+            signature = self._stat()
+        except OSError as e:
+            self.last_error = str(e)
+            return False
+        if signature == self._signature:
+            self._pending = None
+            return False
+        if signature != self._pending:
+            # Changed since the last poll; wait until the file has settled
+            self._pending = signature
+            return False
+        try:
+            table = load_reference_table(self.csv_path)
+        except Exception as e:
+            # Half-written or invalid file; keep serving the old table and retry next poll
+            self.last_error = str(e)
+            return False
+        self._signature = signature
+        self._pending = None
+        self.last_error = None
+        if table.version == self.current.version:
+            return False
+        self.current = table
+        print(f"Reference ranges reloaded: version {table.version}, {len(table)} tests")
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.interval):
+            self.reload_if_changed()
+
+    def start(self):
+        """
+        Start the background watcher (no-op if already running or interval <= 0)
+        """
+        if self.interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._watch, name='reference-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
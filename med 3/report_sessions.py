@@ -0,0 +1,164 @@
+"""
+Report Sessions
+Server-side store of analyzed reports so the chatbot can refer to them by ID
+"""
+
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from chat_router import question_terms
+
+
+class ReportSession:
+    """
+    One analyzed report: its comparison results plus lookups built once
+
+    `charts` caches serialized charts by (name, format) as they are requested,
+    all built from one `chart_frame` (charts.ChartFrame) made on first use.
+    `patient_id` is set when the report was added to a patient's history.
+
+    `by_term` maps each test name (lowercase, with '_' also read as a space)
+    to the position of its first result, so finding the tests a chat
+    question mentions is one dict lookup per question term.
+    """
+
+    def __init__(self, report_id, results, created=None, patient_id=None):
+        self.report_id = report_id
+        self.results = results
+        self.patient_id = patient_id
+        self.created = created or time.time()
+        self.synced = self.created  # Last access time written to SQLite
+        self.by_term = {}
+        self.charts = {}
+        self.chart_frame = None
+        for position, result in enumerate(results):
+            name = result['test'].lower()
+            for term in (name, name.replace('_', ' ')):
+                self.by_term.setdefault(term, position)
+
+    def find_mentioned_test(self, question):
+        """
+        Result for the test the question mentions, or None
+
+        The longest matching name wins ('urine rbc' over 'rbc'), then report order.
+        """
+        matches = [(-len(term), self.by_term[term]) for term in question_terms(question) if term in self.by_term]
+        if not matches:
+            return None
+        return self.results[min(matches)[1]]
+
+
+class ReportSessionStore:
+    """
+    LRU cache of report sessions that expire after `ttl` idle seconds
+
+    Holds at most `max_sessions` reports in memory. When `db_path` is set
+    the results are also written to SQLite, so a session evicted from
+    memory, or created by another worker process, can still be loaded.
+    """
+
+    def __init__(self, max_sessions=256, ttl=3600, db_path=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.db_path = db_path
+        self._sessions = OrderedDict()  # report_id -> (session, last access time)
+        self._lock = threading.Lock()
+        if db_path:
+            with self._connect() as db:
+                db.execute(
+                    'CREATE TABLE IF NOT EXISTS report_sessions ('
+                    'report_id TEXT PRIMARY KEY, created REAL, accessed REAL, results TEXT)'
+                )
+                db.execute('CREATE INDEX IF NOT EXISTS report_sessions_accessed ON report_sessions (accessed)')
+                columns = [row[1] for row in db.execute('PRAGMA table_info(report_sessions)')]
+                if 'patient_id' not in columns:
+                    db.execute('ALTER TABLE report_sessions ADD COLUMN patient_id TEXT')
+
+    @contextmanager
+    def _connect(self):
+        """
+        Short-lived connection that commits on success and is always closed
+        """
+        db = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def create(self, results, patient_id=None):
+        """
+        Store a report's comparison results and return the new session
+        """
+        session = ReportSession(secrets.token_urlsafe(16), results, patient_id=patient_id)
+        now = time.time()
+        with self._lock:
+            self._remember(session, now)
+        if self.db_path:
+            with self._connect() as db:
+                db.execute(
+                    'INSERT OR REPLACE INTO report_sessions (report_id, created, accessed, results, patient_id) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (session.report_id, session.created, now, json.dumps(results), patient_id)
+                )
+                db.execute('DELETE FROM report_sessions WHERE accessed < ?', (now - self.ttl,))
+        return session
+
+    def get(self, report_id):
+        """
+        Return the session for `report_id`, or None if unknown or expired
+        """
+        if not report_id:
+            return None
+        now = time.time()
+        session = None
+        with self._lock:
+            entry = self._sessions.get(report_id)
+            if entry is not None:
+                if now - entry[1] <= self.ttl:
+                    session = entry[0]
+                    self._remember(session, now)
+                else:
+                    del self._sessions[report_id]
+        if session is not None:
+            if self.db_path and now - session.synced > self.ttl / 4:
+                self._touch(session, now)
+            return session
+
+        if not self.db_path:
+            return None
+        with self._connect() as db:
+            row = db.execute(
+                'SELECT created, results, patient_id FROM report_sessions WHERE report_id = ? AND accessed >= ?',
+                (report_id, now - self.ttl)
+            ).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE report_sessions SET accessed = ? WHERE report_id = ?', (now, report_id))
+        session = ReportSession(report_id, json.loads(row[1]), row[0], row[2])
+        session.synced = now
+        with self._lock:
+            self._remember(session, now)
+        return session
+
+    def _touch(self, session, now):
+        """
+        Keep the SQLite copy of an active in-memory session from expiring
+        """
+        session.synced = now
+        with self._connect() as db:
+            db.execute('UPDATE report_sessions SET accessed = ? WHERE report_id = ?', (now, session.report_id))
+
+    def _remember(self, session, now):
+        self._sessions[session.report_id] = (session, now)
+        self._sessions.move_to_end(session.report_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def __len__(self):
+        return len(self._sessions)
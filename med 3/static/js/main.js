@@ -1,4 +1,4 @@
-let selectedFile = null;
+let selectedFiles = [];
 
 const uploadBox = document.getElementById('uploadBox');
 const fileInput = document.getElementById('fileInput');
@@ -14,7 +14,7 @@ uploadBox.addEventListener('click', () => {
 
 // File selection
 fileInput.addEventListener('change', (e) => {
-    handleFileSelect(e.target.files[0]);
+    handleFileSelect(e.target.files);
 });
 
 // Drag and drop
@@ -30,52 +30,134 @@ uploadBox.addEventListener('dragleave', () => {
 uploadBox.addEventListener('drop', (e) => {
     e.preventDefault();
     uploadBox.classList.remove('dragover');
-    handleFileSelect(e.dataTransfer.files[0]);
+    handleFileSelect(e.dataTransfer.files);
 });
 
-function handleFileSelect(file) {
-    if (!file) return;
+function handleFileSelect(fileList) {
+    const files = Array.from(fileList || []);
+    if (files.length === 0) return;
     
     const validTypes = ['image/jpeg', 'image/jpg', 'image/png', 'application/pdf'];
-    if (!validTypes.includes(file.type)) {
+    if (files.some(file => !validTypes.includes(file.type))) {
         showError('Invalid file type. Please upload a PDF, JPG, or PNG file.');
         return;
     }
     
-    selectedFile = file;
-    uploadBox.querySelector('h3').textContent = `Selected: ${file.name}`;
+    selectedFiles = files;
+    uploadBox.querySelector('h3').textContent = files.length === 1
+        ? `Selected: ${files[0].name}`
+        : `Selected ${files.length} reports: ${files.map(file => file.name).join(', ')}`;
     uploadBox.querySelector('.upload-icon').textContent = '✅';
     analyzeBtn.disabled = false;
 }
 
 // Analyze button
 analyzeBtn.addEventListener('click', async () => {
-    if (!selectedFile) return;
+    if (selectedFiles.length === 0) return;
     
     hideAllSections();
     loadingSection.style.display = 'block';
+    setLoadingMessage('Analyzing your report...');
     
+    // Several reports are analyzed together as one combined result
+    const isBatch = selectedFiles.length > 1;
     const formData = new FormData();
-    formData.append('file', selectedFile);
+    if (isBatch) {
+        selectedFiles.forEach(file => formData.append('files', file));
+        setLoadingMessage(`Analyzing ${selectedFiles.length} reports...`);
+    } else {
+        // Progress is streamed as the report is analyzed; with ANALYZE_ASYNC on the server answers with a job ID
+        formData.append('file', selectedFiles[0]);
+        formData.append('stream', '1');
+    }
+    // History is kept under a token the server issued on an earlier report, stored in this browser
+    const keepHistoryInput = document.getElementById('keepHistoryInput');
+    if (keepHistoryInput && keepHistoryInput.checked) {
+        formData.append('keep_history', '1');
+        const patientToken = localStorage.getItem('patientToken');
+        if (patientToken) {
+            formData.append('patient_token', patientToken);
+        }
+    }
     
     try {
-        const response = await fetch('/analyze', {
+        const response = await fetch(isBatch ? '/analyze/batch' : '/analyze', {
             method: 'POST',
             body: formData
         });
         
-        const data = await response.json();
-        
-        if (!response.ok) {
-            throw new Error(data.error || 'Analysis failed');
+        let result;
+        if ((response.headers.get('Content-Type') || '').startsWith('text/event-stream')) {
+            result = await readAnalysisEvents(response);
+        } else {
+            const data = await response.json();
+            
+            if (!response.ok) {
+                throw new Error(data.error || 'Analysis failed');
+            }
+            
+            result = data.job_id ? await waitForJob(data.job_id) : data;
         }
-        
-        displayResults(data);
+        if (result.patient_token) {
+            localStorage.setItem('patientToken', result.patient_token);
+        }
+        displayResults(result);
     } catch (error) {
         showError(error.message);
     }
 });
 
+// Follow a background /analyze job until it finishes and return the analysis
+async function waitForJob(jobId) {
+    const response = await fetch(`/jobs/${jobId}/events`);
+    if (!response.ok) {
+        throw new Error('Analysis job not found');
+    }
+    return readAnalysisEvents(response);
+}
+
+// Show the progress events of an analysis stream and return the analysis
+async function readAnalysisEvents(response) {
+    let result = null;
+    await readServerSentEvents(response, (event, data) => {
+        if (event === 'status' && data.status === 'queued') {
+            setLoadingMessage('Waiting for a free analyzer...');
+        } else if (event === 'progress') {
+            setLoadingMessage(describeProgress(data));
+        } else if (event === 'done') {
+            result = data;
+        } else if (event === 'error') {
+            throw new Error(data.error || 'Analysis failed');
+        }
+    });
+    
+    if (!result) {
+        throw new Error('Analysis did not finish');
+    }
+    return result;
+}
+
+function describeProgress(progress) {
+    switch (progress.stage) {
+        case 'rasterized':
+            return `Reading page ${progress.page} of ${progress.pages}...`;
+        case 'ocr':
+            return `Recognized text on page ${progress.page}...`;
+        case 'extracted':
+            return `Found ${progress.values} test values, comparing with normal ranges...`;
+        case 'compared':
+            return 'Preparing insights and recommendations...';
+        case 'charts':
+            return 'Preparing charts...';
+        default:
+            return 'Analyzing your report...';
+    }
+}
+
+function setLoadingMessage(message) {
+    loadingSection.querySelector('p').textContent = message;
+}
+
 // Tab functionality
 document.addEventListener('DOMContentLoaded', () => {
     const tabBtns = document.querySelectorAll('.tab-btn');
@@ -92,10 +174,142 @@ document.addEventListener('DOMContentLoaded', () => {
             // Add active class to clicked tab and corresponding content
             btn.classList.add('active');
             document.getElementById(`${tabName}-tab`).classList.add('active');
+            
+            loadTabCharts(tabName);
         });
     });
 });
 
+// Charts shown on each tab, loaded from /charts/<report_id>/<name> the first time the tab is opened
+const TAB_CHARTS = {
+    overview: ['bar', 'pie', 'radar'],
+    gauges: ['gauges'],
+    trends: ['trend', 'box'],
+    advanced: ['heatmap', 'scatter3d', 'violin'],
+    special: ['waterfall', 'polar', 'sunburst', 'funnel', 'sankey', 'kpi']
+};
+
+const DEFAULT_CHART_CONFIG = {
+    responsive: true,
+    displayModeBar: true,
+    displaylogo: false
+};
+
+// Container and Plotly config per chart; itemClass marks charts made of several figures
+const CHART_TARGETS = {
+    bar: {
+        container: 'barChartContainer',
+        config: { ...DEFAULT_CHART_CONFIG, modeBarButtonsToRemove: ['pan2d', 'lasso2d', 'select2d'] }
+    },
+    gauges: { container: 'gaugeChartsContainer', itemClass: 'gauge-item', config: { responsive: true, displayModeBar: false } },
+    pie: { container: 'pieChartContainer' },
+    radar: { container: 'radarChartContainer' },
+    trend: { container: 'trendChartContainer' },
+    box: { container: 'boxChartContainer' },
+    heatmap: { container: 'heatmapContainer' },
+    scatter3d: { container: 'scatter3dContainer' },
+    waterfall: { container: 'waterfallContainer' },
+    funnel: { container: 'funnelContainer' },
+    polar: { container: 'polarContainer' },
+    sunburst: { container: 'sunburstContainer' },
+    violin: { container: 'violinContainer' },
+    sankey: { container: 'sankeyContainer' },
+    kpi: { container: 'kpiContainer', itemClass: 'kpi-item', config: { responsive: true, displayModeBar: false } }
+};
+
+// Report whose charts are shown: { reportId, available: Set, requested: Set }
+let chartState = null;
+
+function resetCharts(reportId, chartNames) {
+    Object.values(CHART_TARGETS).forEach(target => {
+        const container = document.getElementById(target.container);
+        if (container) {
+            Plotly.purge(container);
+            container.innerHTML = '';
+        }
+    });
+    chartState = { reportId, available: new Set(chartNames), requested: new Set() };
+    
+    // Trend, distribution and correlation charts need past reports kept in the patient's history
+    Object.entries(CHART_TARGETS).forEach(([name, target]) => {
+        const container = document.getElementById(target.container);
+        if (container && !chartState.available.has(name)) {
+            container.innerHTML = '<p class="chart-note">Not enough data for this chart yet. Trend and distribution charts use your past reports once you keep your results in your history.</p>';
+        }
+    });
+}
+
+function loadTabCharts(tabName) {
+    if (!chartState) return;
+    (TAB_CHARTS[tabName] || []).forEach(name => {
+        if (!chartState.available.has(name) || chartState.requested.has(name)) return;
+        chartState.requested.add(name);
+        loadChart(chartState.reportId, name);
+    });
+}
+
+async function loadChart(reportId, name) {
+    try {
+        const response = await fetch(`/charts/${encodeURIComponent(reportId)}/${name}`);
+        const spec = await response.json();
+        if (!response.ok) {
+            throw new Error(spec.error || 'Chart failed to load');
+        }
+        const figure = Array.isArray(spec) ?
+            await Promise.all(spec.map(buildFigure)) : await buildFigure(spec);
+        // Ignore charts of a report that has since been replaced
+        if (chartState && chartState.reportId === reportId) {
+            renderChart(CHART_TARGETS[name], figure);
+        }
+    } catch (error) {
+        console.error(`Could not load ${name} chart:`, error);
+        if (chartState && chartState.reportId === reportId) {
+            chartState.requested.delete(name);  // Retry next time the tab is opened
+        }
+    }
+}
+
+// Plotly templates by name, fetched once and shared by every compact chart spec
+const chartTemplates = {};
+
+function getChartTemplate(name) {
+    if (!chartTemplates[name]) {
+        chartTemplates[name] = fetch(`/chart_templates/${encodeURIComponent(name)}`).then(response => {
+            if (!response.ok) {
+                throw new Error(`Chart template ${name} failed to load`);
+            }
+            return response.json();
+        });
+        chartTemplates[name].catch(() => delete chartTemplates[name]);
+    }
+    return chartTemplates[name];
+}
+
+// Compact specs name their template instead of embedding it; full Plotly JSON passes through
+async function buildFigure(spec) {
+    if (spec.template) {
+        spec.layout.template = await getChartTemplate(spec.template);
+    }
+    return spec;
+}
+
+function renderChart(target, figure) {
+    const container = document.getElementById(target.container);
+    const config = target.config || DEFAULT_CHART_CONFIG;
+    if (!target.itemClass) {
+        Plotly.newPlot(container, figure.data, figure.layout, config);
+        return;
+    }
+    container.innerHTML = '';
+    figure.forEach((item, index) => {
+        const itemDiv = document.createElement('div');
+        itemDiv.className = target.itemClass;
+        itemDiv.style.animationDelay = `${index * 0.1}s`;
+        container.appendChild(itemDiv);
+        Plotly.newPlot(itemDiv, item.data, item.layout, config);
+    });
+}
+
 function displayResults(data) {
     hideAllSections();
     resultsSection.style.display = 'block';
@@ -180,174 +394,10 @@ function displayResults(data) {
         showAttentionPanel(data.results);
     }
     
-    // Display bar chart
-    if (data.chart && data.chart.bar) {
-        const barData = JSON.parse(data.chart.bar);
-        Plotly.newPlot('barChartContainer', barData.data, barData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            modeBarButtonsToRemove: ['pan2d', 'lasso2d', 'select2d'],
-            displaylogo: false
-        });
-    }
-    
-    // Display gauge charts
-    if (data.chart && data.chart.gauges) {
-        const gaugeContainer = document.getElementById('gaugeChartsContainer');
-        gaugeContainer.innerHTML = '';
-        
-        data.chart.gauges.forEach((gaugeJson, index) => {
-            const gaugeDiv = document.createElement('div');
-            gaugeDiv.className = 'gauge-item';
-            gaugeDiv.style.animationDelay = `${index * 0.1}s`;
-            gaugeContainer.appendChild(gaugeDiv);
-            
-            const gaugeData = JSON.parse(gaugeJson);
-            Plotly.newPlot(gaugeDiv, gaugeData.data, gaugeData.layout, {
-                responsive: true,
-                displayModeBar: false
-            });
-        });
-    }
-    
-    // Display pie chart
-    if (data.chart && data.chart.pie) {
-        const pieData = JSON.parse(data.chart.pie);
-        Plotly.newPlot('pieChartContainer', pieData.data, pieData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display radar chart
-    if (data.chart && data.chart.radar) {
-        const radarData = JSON.parse(data.chart.radar);
-        Plotly.newPlot('radarChartContainer', radarData.data, radarData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display trend chart
-    if (data.chart && data.chart.trend) {
-        const trendData = JSON.parse(data.chart.trend);
-        Plotly.newPlot('trendChartContainer', trendData.data, trendData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display box plot
-    if (data.chart && data.chart.box) {
-        const boxData = JSON.parse(data.chart.box);
-        Plotly.newPlot('boxChartContainer', boxData.data, boxData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display heatmap
-    if (data.chart && data.chart.heatmap) {
-        const heatmapData = JSON.parse(data.chart.heatmap);
-        Plotly.newPlot('heatmapContainer', heatmapData.data, heatmapData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display 3D scatter
-    if (data.chart && data.chart.scatter3d) {
-        const scatter3dData = JSON.parse(data.chart.scatter3d);
-        Plotly.newPlot('scatter3dContainer', scatter3dData.data, scatter3dData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display waterfall chart
-    if (data.chart && data.chart.waterfall) {
-        const waterfallData = JSON.parse(data.chart.waterfall);
-        Plotly.newPlot('waterfallContainer', waterfallData.data, waterfallData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display funnel chart
-    if (data.chart && data.chart.funnel) {
-        const funnelData = JSON.parse(data.chart.funnel);
-        Plotly.newPlot('funnelContainer', funnelData.data, funnelData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display polar chart
-    if (data.chart && data.chart.polar) {
-        const polarData = JSON.parse(data.chart.polar);
-        Plotly.newPlot('polarContainer', polarData.data, polarData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display sunburst chart
-    if (data.chart && data.chart.sunburst) {
-        const sunburstData = JSON.parse(data.chart.sunburst);
-        Plotly.newPlot('sunburstContainer', sunburstData.data, sunburstData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display violin plot
-    if (data.chart && data.chart.violin) {
-        const violinData = JSON.parse(data.chart.violin);
-        Plotly.newPlot('violinContainer', violinData.data, violinData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display sankey diagram
-    if (data.chart && data.chart.sankey) {
-        const sankeyData = JSON.parse(data.chart.sankey);
-        Plotly.newPlot('sankeyContainer', sankeyData.data, sankeyData.layout, {
-            responsive: true,
-            displayModeBar: true,
-            displaylogo: false
-        });
-    }
-    
-    // Display KPI indicators
-    if (data.chart && data.chart.kpi) {
-        const kpiContainer = document.getElementById('kpiContainer');
-        kpiContainer.innerHTML = '';
-        
-        data.chart.kpi.forEach((kpiJson, index) => {
-            const kpiDiv = document.createElement('div');
-            kpiDiv.className = 'kpi-item';
-            kpiDiv.style.animationDelay = `${index * 0.1}s`;
-            kpiContainer.appendChild(kpiDiv);
-            
-            const kpiData = JSON.parse(kpiJson);
-            Plotly.newPlot(kpiDiv, kpiData.data, kpiData.layout, {
-                responsive: true,
-                displayModeBar: false
-            });
-        });
-    }
+    // Charts are fetched per tab when it is opened
+    resetCharts(data.report_id, data.charts || []);
+    const activeTab = document.querySelector('.tab-btn.active');
+    loadTabCharts(activeTab ? activeTab.getAttribute('data-tab') : 'overview');
     
     // Display Doctor Recommendations
     if (data.doctor_recommendations) {
@@ -604,36 +654,81 @@ async function sendMessage() {
     
     // Show typing indicator
     const typingId = showTypingIndicator();
+    let message = null;
     
     try {
-        const response = await fetch('/chat', {
+        const response = await fetch('/chat/stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({
                 question: question,
-                report_data: currentReportData
+                report_id: currentReportData ? currentReportData.report_id : null
             })
         });
         
-        const data = await response.json();
+        if (!response.ok || !response.body) {
+            throw new Error('Chat request failed');
+        }
         
-        // Remove typing indicator
-        removeTypingIndicator(typingId);
+        // Render each section of the answer as soon as it arrives
+        const sections = [];
+        await readServerSentEvents(response, (event, data) => {
+            if (event === 'chunk') {
+                if (!message) {
+                    removeTypingIndicator(typingId);
+                    message = createMessageElement('bot');
+                }
+                sections.push(data.text);
+                appendFormattedText(message.content, data.text);
+                chatbotMessages.scrollTop = chatbotMessages.scrollHeight;
+            } else if (event === 'error') {
+                throw new Error(data.error);
+            }
+        });
         
-        if (data.success) {
-            addMessage(data.response, 'bot');
-        } else {
-            addMessage('Sorry, I encountered an error. Please try again.', 'bot');
+        if (!message) {
+            throw new Error('Empty response');
+        }
+        if (synthesis) {
+            addSpeakerButton(message.content, sections.join('\n\n'));
         }
     } catch (error) {
         removeTypingIndicator(typingId);
+        if (message) {
+            message.messageDiv.remove();
+        }
         addMessage('Sorry, I\'m having trouble connecting. Please try again.', 'bot');
     }
 }
 
-function addMessage(text, sender, enableSpeech = true) {
+// Read a text/event-stream response, calling onEvent(event, data) with each parsed JSON payload
+async function readServerSentEvents(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    
+    while (true) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop();
+        frames.forEach(frame => {
+            let event = 'message';
+            let data = '';
+            frame.split('\n').forEach(line => {
+                if (line.startsWith('event:')) event = line.slice(6).trim();
+                else if (line.startsWith('data:')) data += line.slice(5).trim();
+            });
+            if (data) onEvent(event, JSON.parse(data));
+        });
+    }
+}
+
+function createMessageElement(sender) {
     const messageDiv = document.createElement('div');
     messageDiv.className = sender === 'user' ? 'user-message' : 'bot-message';
     
@@ -645,16 +740,23 @@ function addMessage(text, sender, enableSpeech = true) {
     content.className = 'message-content';
     content.style.position = 'relative';
     
-    // Add speaker button for bot messages
-    if (sender === 'bot' && enableSpeech && synthesis) {
-        const speakerBtn = document.createElement('button');
-        speakerBtn.className = 'message-speaker';
-        speakerBtn.innerHTML = '🔊';
-        speakerBtn.title = 'Listen to this message';
-        speakerBtn.onclick = () => speakText(text, speakerBtn);
-        content.appendChild(speakerBtn);
-    }
+    messageDiv.appendChild(avatar);
+    messageDiv.appendChild(content);
+    chatbotMessages.appendChild(messageDiv);
     
+    return { messageDiv, content };
+}
+
+function addSpeakerButton(content, text) {
+    const speakerBtn = document.createElement('button');
+    speakerBtn.className = 'message-speaker';
+    speakerBtn.innerHTML = '🔊';
+    speakerBtn.title = 'Listen to this message';
+    speakerBtn.onclick = () => speakText(text, speakerBtn);
+    content.insertBefore(speakerBtn, content.firstChild);
+}
+
+function appendFormattedText(content, text) {
     // Convert newlines to paragraphs and handle formatting
     const paragraphs = text.split('\n').filter(p => p.trim());
     let currentList = null;
@@ -696,10 +798,17 @@ function addMessage(text, sender, enableSpeech = true) {
             content.appendChild(p);
         }
     });
+}
+
+function addMessage(text, sender, enableSpeech = true) {
+    const { content } = createMessageElement(sender);
     
-    messageDiv.appendChild(avatar);
-    messageDiv.appendChild(content);
-    chatbotMessages.appendChild(messageDiv);
+    // Add speaker button for bot messages
+    if (sender === 'bot' && enableSpeech && synthesis) {
+        addSpeakerButton(content, text);
+    }
+    
+    appendFormattedText(content, text);
     
     // Scroll to bottom
     chatbotMessages.scrollTop = chatbotMessages.scrollHeight;
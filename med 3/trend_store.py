@@ -0,0 +1,135 @@
+"""
+Trend Store
+Per-patient history of test results in SQLite for the trend, distribution and correlation charts
+"""
+
+import secrets
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+# Most recent results per test returned by a history lookup
+DEFAULT_HISTORY_LIMIT = 50
+
+
+class TrendStore:
+    """
+    Append-only log of (patient, test, time, value) rows
+
+    Patient IDs are issued by `new_patient`, unguessable like report IDs,
+    so a history is only readable by whoever holds its ID; callers check
+    IDs sent by a client with `has_patient` before using them. Every
+    analyzed report with a patient ID adds one row per test, all with the
+    report's timestamp; re-uploads of the same file(s), recognized by
+    `upload_hash`, are recorded once per patient. The (patient_id, test,
+    taken_at) index makes a history lookup an index range scan, so reading
+    a patient's last results stays well under a millisecond however large
+    the table grows.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        with self._connect() as db:
+            db.execute(
+                'CREATE TABLE IF NOT EXISTS test_results ('
+                'patient_id TEXT NOT NULL, test TEXT NOT NULL, taken_at REAL NOT NULL, '
+                'value REAL NOT NULL, unit TEXT, status TEXT, report_id TEXT, upload_hash TEXT)'
+            )
+            columns = [row[1] for row in db.execute('PRAGMA table_info(test_results)')]
+            if 'upload_hash' not in columns:
+                db.execute('ALTER TABLE test_results ADD COLUMN upload_hash TEXT')
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS test_results_patient_test_time '
+                'ON test_results (patient_id, test, taken_at)'
+            )
+            db.execute(
+                'CREATE INDEX IF NOT EXISTS test_results_patient_upload '
+                'ON test_results (patient_id, upload_hash)'
+            )
+            db.execute('CREATE TABLE IF NOT EXISTS patients (patient_id TEXT PRIMARY KEY, created REAL NOT NULL)')
+
+    @contextmanager
+    def _connect(self):
+        """
+        This thread's connection, committing on success
+
+        Connections are kept per thread, as opening one costs more than a lookup.
+        """
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = self._local.db = sqlite3.connect(self.db_path, timeout=10)
+        with db:
+            yield db
+
+    def new_patient(self):
+        """
+        Issue a new patient ID and return it
+        """
+        patient_id = secrets.token_urlsafe(16)
+        with self._connect() as db:
+            db.execute('INSERT INTO patients (patient_id, created) VALUES (?, ?)', (patient_id, time.time()))
+        return patient_id
+
+    def has_patient(self, patient_id):
+        """
+        Whether `patient_id` was issued by new_patient
+        """
+        with self._connect() as db:
+            return db.execute('SELECT 1 FROM patients WHERE patient_id = ?', (patient_id,)).fetchone() is not None
+
+    def append(self, patient_id, comparison_results, taken_at=None, report_id=None, upload_hash=None):
+        """
+        Record a report's results for a patient, all at one timestamp
+
+        Returns the timestamp, or None when the patient already has results
+        for `upload_hash` and nothing was added.
+        """
+        taken_at = taken_at or time.time()
+        rows = [
+            (patient_id, result['test'], taken_at, float(result['value']),
+             result['unit'], result['status'], report_id, upload_hash)
+            for result in comparison_results
+        ]
+        with self._connect() as db:
+            # Take the write lock first so two identical uploads cannot both pass the check
+            db.execute('BEGIN IMMEDIATE')
+            if upload_hash is not None and db.execute(
+                'SELECT 1 FROM test_results WHERE patient_id = ? AND upload_hash = ? LIMIT 1',
+                (patient_id, upload_hash)
+            ).fetchone():
+                return None
+            db.executemany(
+                'INSERT INTO test_results (patient_id, test, taken_at, value, unit, status, report_id, upload_hash) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return taken_at
+
+    def history(self, patient_id, tests, since=None, until=None, limit=DEFAULT_HISTORY_LIMIT):
+        """
+        Past results of `tests` for a patient, {test: (timestamps, values)}
+
+        Both are NumPy arrays in time order, holding at most the `limit`
+        latest results with since <= taken_at <= until. Tests with no
+        history are left out.
+        """
+        since = float('-inf') if since is None else since
+        until = float('inf') if until is None else until
+        history = {}
+        with self._connect() as db:
+            for test in dict.fromkeys(tests):
+                rows = db.execute(
+                    'SELECT taken_at, value FROM test_results '
+                    'WHERE patient_id = ? AND test = ? AND taken_at BETWEEN ? AND ? '
+                    'ORDER BY taken_at DESC LIMIT ?',
+                    (patient_id, test, since, until, limit)
+                ).fetchall()
+                if rows:
+                    rows.reverse()
+                    timestamps, values = zip(*rows)
+                    history[test] = (np.array(timestamps), np.array(values))
+        return history